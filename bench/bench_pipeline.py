@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MAA 运行链路压测
+
+用 fake_maa.py 代替 maa 运行 run.py，再运行日志检测（maa_utils）和报告生成（process_report.py），
+测量整条后处理链路的吞吐（行/秒）、run.py 的峰值内存、asst.log 大小和卡住检测耗时
+
+每个场景在单独的临时目录中运行（HOME 也指向临时目录，不会改动真实的 daily.toml）
+
+场景：
+    replay       原样回放，不等待
+    paced        600 倍速按任务耗时回放
+    trace-flood  额外插入 20 万行 TRACE
+    error-burst  开头插入 20 行 ERROR，应检测为需要修复
+    stall        中途卡住 10 秒，超时 3 秒，应被超时检测终止
+    flight-recorder  20 万行 TRACE + ERROR，开启飞行记录器（1 MB），对比 trace-flood 的日志大小
+
+另外每次都会检查日志归档（log_archive.py）跨块的多行日志按级别查询的结果
+
+用法：
+    python3 bench/bench_pipeline.py
+    python3 bench/bench_pipeline.py --scenario stall --scenario trace-flood --json bench.json
+"""
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FAKE_MAA = os.path.join(BENCH_DIR, 'fake_maa.py')
+RUN_PY = os.path.join(REPO_DIR, 'run.py')
+PROCESS_REPORT = os.path.join(REPO_DIR, 'process_report.py')
+DAILY_TOML = os.path.join(REPO_DIR, '.config', 'maa', 'tasks', 'daily.toml')
+
+sys.path.insert(0, REPO_DIR)
+from log_archive import ArchiveReader, ArchiveWriter
+from maa_utils import check_resource_update_error, read_asst_log
+
+# 场景：fake_maa 参数、run.py 环境变量、预期结果
+SCENARIOS = {
+    'replay': {'args': '', 'env': {}, 'expect': {'returncode': 0, 'needs_fix': False}},
+    'paced': {'args': '--speed 600', 'env': {}, 'expect': {'returncode': 0}},
+    'trace-flood': {'args': '--trace-flood 200000', 'env': {}, 'expect': {'returncode': 0}},
+    'error-burst': {'args': '--error-burst 5:20', 'env': {}, 'expect': {'returncode': 0, 'needs_fix': True}},
+    'flight-recorder': {
+        'args': '--trace-flood 200000 --error-burst 600:20',
+        'env': {'MAA_FLIGHT_RECORDER': '1'},
+        'expect': {'returncode': 0, 'needs_fix': True},
+    },
+    'stall': {
+        'args': '--stall 600:10 --stall-file {tmp}/stall_started',
+        'env': {'MAA_TIMEOUT': '3', 'MAA_TIMEOUT_CHECK_INTERVAL': '0.5'},
+        'expect': {'returncode': 1, 'stall_detected_within': 3 + 0.5 + 1},
+    },
+}
+
+
+def _peak_rss_mb(pid):
+    """读取进程的峰值内存（VmHWM），进程已退出时返回 None"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _count_lines(path):
+    """统计文件行数"""
+    count = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            count += block.count(b'\n')
+    return count
+
+
+def run_scenario(name, spec):
+    """
+    运行一个场景
+
+    Returns:
+        dict: 测量结果和检查结论
+    """
+    tmp = tempfile.mkdtemp(prefix=f'maa-bench-{name}-')
+    try:
+        tasks_dir = os.path.join(tmp, '.config', 'maa', 'tasks')
+        os.makedirs(tasks_dir)
+        shutil.copy(DAILY_TOML, tasks_dir)
+
+        fake_args = spec['args'].format(tmp=tmp)
+        env = dict(os.environ, HOME=tmp, CLIENT_TYPE='Official', MAA_SAMPLE='0', MAA_CONNECTION_BENCH='0',
+                   MAA_TRACE_FILE=os.path.join(tmp, 'trace_events.jsonl'),
+                   MAA_BIN=f"{shlex.quote(sys.executable)} {shlex.quote(FAKE_MAA)} {fake_args}")
+        env.pop('MAA_FIX_MODE', None)
+        env.update(spec['env'])
+
+        start = time.time()
+        process = subprocess.Popen([sys.executable, RUN_PY], cwd=tmp, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        peak = [0.0]
+
+        def poll_memory():
+            while process.poll() is None:
+                rss = _peak_rss_mb(process.pid)
+                if rss:
+                    peak[0] = max(peak[0], rss)
+                time.sleep(0.05)
+
+        poller = threading.Thread(target=poll_memory, daemon=True)
+        poller.start()
+        returncode = process.wait()
+        finished = time.time()
+        poller.join()
+
+        result = {
+            'scenario': name,
+            'returncode': returncode,
+            'seconds': finished - start,
+            'peak_rss_mb': peak[0],
+        }
+
+        log_path = os.path.join(tmp, 'asst.log')
+        if os.path.exists(log_path):
+            lines = _count_lines(log_path)
+            result['lines'] = lines
+            result['lines_per_sec'] = lines / result['seconds']
+            result['log_mb'] = os.path.getsize(log_path) / 1024 / 1024
+
+            post_start = time.time()
+            result['needs_fix'] = check_resource_update_error(read_asst_log(log_path))
+            subprocess.run([sys.executable, PROCESS_REPORT], cwd=tmp, stdout=subprocess.DEVNULL,
+                           env=dict(env, GITHUB_STEP_SUMMARY=os.path.join(tmp, 'summary.md')), check=True)
+            result['post_seconds'] = time.time() - post_start
+
+        stall_file = os.path.join(tmp, 'stall_started')
+        if os.path.exists(stall_file):
+            with open(stall_file) as f:
+                result['stall_detect_seconds'] = finished - float(f.read())
+
+        result['failures'] = check(result, spec['expect'])
+        return result
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def check(result, expect):
+    """
+    对照预期结果
+
+    Returns:
+        list: 不符合预期的说明
+    """
+    failures = []
+    if 'returncode' in expect and result['returncode'] != expect['returncode']:
+        failures.append(f"退出码 {result['returncode']}，预期 {expect['returncode']}")
+    if 'needs_fix' in expect and result.get('needs_fix') != expect['needs_fix']:
+        failures.append(f"修复检测结果 {result.get('needs_fix')}，预期 {expect['needs_fix']}")
+    if 'stall_detected_within' in expect:
+        detect = result.get('stall_detect_seconds')
+        if detect is None or detect > expect['stall_detected_within']:
+            failures.append(f"卡住检测耗时 {detect}，预期不超过 {expect['stall_detected_within']}s")
+    return failures
+
+
+def check_archive_levels():
+    """
+    检查归档按级别查询：多行日志的续行跨块时仍沿用首行的级别
+
+    Returns:
+        list: 不符合预期的说明
+    """
+    tmp = tempfile.mkdtemp(prefix='maa-bench-archive-')
+    try:
+        archive = os.path.join(tmp, 'asst.log.blocks')
+        # 块很小，ERROR 行和 TRACE 行的续行都会落到后面的块
+        writer = ArchiveWriter(archive, block_size=64)
+        for level in ('ERROR', 'TRACE'):
+            writer.add(f'[{level}] boom\n')
+            for i in range(6):
+                writer.add(f'    continuation line {i}\n')
+        writer.close()
+
+        reader = ArchiveReader(archive)
+        try:
+            blocks = reader.index['blocks']
+            expect = {'ERROR': list(range(7)), 'INFO': list(range(7)), 'TRACE': list(range(14))}
+            failures = []
+            for level, numbers in expect.items():
+                got = [number for number, _, _ in reader.lines(blocks, min_level=level)]
+                if got != numbers:
+                    failures.append(f"--level {level} 返回第 {got} 行，预期第 {numbers} 行")
+            return failures
+        finally:
+            reader.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def print_results(results):
+    """打印结果表格"""
+    def fmt(value, spec):
+        return '-' if value is None else format(value, spec)
+
+    print(f"{'场景':<14}{'行数':>10}{'耗时s':>9}{'行/秒':>11}{'峰值内存MB':>12}{'日志MB':>9}"
+          f"{'后处理s':>9}{'卡住检测s':>11}  结果")
+    for r in results:
+        status = '✅' if not r['failures'] else '❌ ' + '；'.join(r['failures'])
+        print(f"{r['scenario']:<14}{fmt(r.get('lines'), 'd'):>10}{r['seconds']:>9.2f}"
+              f"{fmt(r.get('lines_per_sec'), ',.0f'):>11}{r['peak_rss_mb']:>12.1f}{fmt(r.get('log_mb'), '.1f'):>9}"
+              f"{fmt(r.get('post_seconds'), '.2f'):>9}{fmt(r.get('stall_detect_seconds'), '.2f'):>11}  {status}")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="MAA 运行链路压测（使用 fake_maa.py 回放日志）")
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help='只运行指定场景（可重复，默认全部）')
+    parser.add_argument('--json', default=None, help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        print(f"▶️  {name} ...", file=sys.stderr)
+        results.append(run_scenario(name, SCENARIOS[name]))
+
+    print_results(results)
+    archive_failures = check_archive_levels()
+    print(f"日志归档级别查询  {'✅' if not archive_failures else '❌ ' + '；'.join(archive_failures)}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if archive_failures or any(r['failures'] for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
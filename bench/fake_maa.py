@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟 maa 可执行文件（日志回放）
+
+把录制的 asst.log 逐行输出到 stderr、摘要输出到 stdout，行为与 `maa run daily` 一致，
+不需要模拟器和游戏就能测试 run.py、超时检测、maa_utils 的检测逻辑和 process_report.py
+
+回放速度：每个任务的日志行均匀分布在摘要中记录的该任务耗时内（[任务] HH:MM:SS - HH:MM:SS），
+--speed 1 为实际速度，--speed 60 为 60 倍速，--speed 0 不等待
+
+故障注入：
+    --stall LINE:SECONDS      在第 LINE 行之后停止输出 SECONDS 秒（模拟卡住）
+    --error-burst LINE:COUNT  在第 LINE 行之后插入 COUNT 行 ERROR（含 StartUp Error）
+    --trace-flood N           额外插入 N 行 TRACE（均匀分布在各行之间）
+
+用法（run.py 会在末尾追加 "run daily"）：
+    MAA_BIN="python3 bench/fake_maa.py --speed 0 --trace-flood 100000" python3 run.py
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+DEFAULT_LOG = os.path.join(FIXTURES_DIR, 'asst.log')
+DEFAULT_SUMMARY = os.path.join(FIXTURES_DIR, 'summary.txt')
+# 任务之外的日志行（连接、加载资源）的间隔（秒，实际速度）
+IDLE_DELAY = 0.5
+TASK_TIME_PATTERN = re.compile(r'^\[[^\]]+\]\s+(\d{2}):(\d{2}):(\d{2})\s*-\s*(\d{2}):(\d{2}):(\d{2})')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from maa_utils import parse_task_event
+
+
+def _parse_point(value, name):
+    """解析 LINE:VALUE 形式的参数"""
+    try:
+        line, amount = value.split(':', 1)
+        return int(line), float(amount)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{name} 格式应为 LINE:VALUE: {value}")
+
+
+def task_durations(summary):
+    """
+    从摘要中读取每个任务的耗时
+
+    Returns:
+        list: 按顺序的任务耗时（秒）
+    """
+    durations = []
+    for line in summary.splitlines():
+        match = TASK_TIME_PATTERN.match(line.strip())
+        if match:
+            h1, m1, s1, h2, m2, s2 = map(int, match.groups())
+            seconds = (h2 * 3600 + m2 * 60 + s2) - (h1 * 3600 + m1 * 60 + s1)
+            durations.append(seconds % 86400)
+    return durations
+
+
+def line_delays(lines, durations):
+    """
+    计算每行输出前的等待时间（实际速度）
+
+    第 k 个 "<任务> Start" 到对应结束事件之间的行均匀分布在第 k 个任务的耗时内
+
+    Returns:
+        list: 与 lines 等长的等待时间（秒）
+    """
+    delays = [IDLE_DELAY] * len(lines)
+    index = 0
+    start = None
+    for i, line in enumerate(lines):
+        event = parse_task_event(line)
+        if not event:
+            continue
+        if event[1] == 'Start':
+            start = i
+        elif start is not None:
+            duration = durations[index] if index < len(durations) else 0
+            per_line = duration / (i - start + 1)
+            for j in range(start, i + 1):
+                delays[j] = per_line
+            index += 1
+            start = None
+    return delays
+
+
+def trace_line(n, size):
+    """生成一行 TRACE 日志（约 size 字节）"""
+    text = f"[TRACE] Flood/MatchTemplate #{n} | rect=(0, 0, 1280, 720) score=0.0000 "
+    return text + 'x' * max(size - len(text) - 1, 0) + '\n'
+
+
+def replay(args):
+    """
+    回放日志
+
+    Returns:
+        int: 退出码
+    """
+    with open(args.log, encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(args.summary, encoding='utf-8') as f:
+        summary = f.read()
+    delays = line_delays(lines, task_durations(summary))
+
+    stalls = dict(args.stall or [])
+    bursts = dict(args.error_burst or [])
+    flood_per_line = args.trace_flood / max(len(lines), 1)
+    flood_budget = 0.0
+    flooded = 0
+    err = sys.stderr
+
+    for i, line in enumerate(lines, 1):
+        if args.speed > 0:
+            time.sleep(delays[i - 1] / args.speed)
+        err.write(line)
+
+        flood_budget += flood_per_line
+        while flood_budget >= 1:
+            err.write(trace_line(flooded, args.trace_size))
+            flooded += 1
+            flood_budget -= 1
+
+        if i in bursts:
+            err.write("[ERROR] StartUp Error\n")
+            for n in range(int(bursts[i]) - 1):
+                err.write(f"[ERROR] FailedToProcessMessage: task chain {n} failed\n")
+        err.flush()
+
+        if i in stalls:
+            if args.stall_file:
+                with open(args.stall_file, 'w') as f:
+                    f.write(f"{time.time()}\n")
+            time.sleep(stalls[i])
+
+    sys.stdout.write(summary)
+    sys.stdout.flush()
+    return args.exit_code
+
+
+def main():
+    """命令行入口（参数与 maa 兼容：fake_maa.py [选项] run daily）"""
+    parser = argparse.ArgumentParser(description="模拟 maa：回放录制的日志和摘要")
+    parser.add_argument('command', nargs='?', default='run', help='兼容 maa 的子命令（忽略）')
+    parser.add_argument('task', nargs='?', default='daily', help='兼容 maa 的任务名（忽略）')
+    parser.add_argument('--log', default=DEFAULT_LOG, help='录制的 asst.log')
+    parser.add_argument('--summary', default=DEFAULT_SUMMARY, help='录制的摘要')
+    parser.add_argument('--speed', type=float, default=float(os.getenv('FAKE_MAA_SPEED', '0')),
+                        help='回放倍速（0 = 不等待）')
+    parser.add_argument('--stall', action='append', type=lambda v: _parse_point(v, '--stall'),
+                        metavar='LINE:SECONDS', help='在第 LINE 行后停止输出 SECONDS 秒')
+    parser.add_argument('--stall-file', default=None, help='开始卡住时把时间戳写入该文件')
+    parser.add_argument('--error-burst', action='append', type=lambda v: _parse_point(v, '--error-burst'),
+                        metavar='LINE:COUNT', help='在第 LINE 行后插入 COUNT 行 ERROR')
+    parser.add_argument('--trace-flood', type=int, default=0, help='额外插入的 TRACE 行数')
+    parser.add_argument('--trace-size', type=int, default=200, help='每行 TRACE 的字节数')
+    parser.add_argument('--exit-code', type=int, default=0, help='退出码')
+    args = parser.parse_args()
+    sys.exit(replay(args))
+
+
+if __name__ == '__main__':
+    main()
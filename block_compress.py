@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多核分块压缩工具
+将输入流切成独立的块，在线程池中并行压缩/解压，输出带帧头的流
+
+流格式：
+    文件头（13 字节）：魔数 MAABLK + 版本 + 编码 + 压缩级别 + 块大小
+    数据帧：原始长度（4 字节）+ 压缩后长度（4 字节）+ 压缩数据
+    结束帧：两个长度都为 0
+
+用法：
+    tar -cf - ark.tar data.tar | python3 block_compress.py compress --level 1 > out
+    python3 block_compress.py decompress < out | tar -xf -
+"""
+import argparse
+import collections
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# zstd 为可选依赖，未安装时只能使用 zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'MAABLK'
+VERSION = 1
+HEADER = struct.Struct('>6sBBBI')
+FRAME = struct.Struct('>II')
+
+# 编码 ID（写入文件头）
+CODEC_STORE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {
+    'store': CODEC_STORE,
+    'zlib': CODEC_ZLIB,
+    'zstd': CODEC_ZSTD,
+}
+
+# 默认块大小 4 MiB：足够大以保持压缩率，又能让所有核心都有活干
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def default_workers():
+    """默认线程数：CPU 核心数"""
+    return os.cpu_count() or 1
+
+
+def read_exact(stream, size):
+    """
+    从流中读取指定长度的数据（管道可能返回不足长度的数据）
+
+    Args:
+        stream: 二进制输入流
+        size: 需要读取的字节数
+
+    Returns:
+        bytes: 读取到的数据，到达流末尾时可能短于 size
+    """
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def make_compressor(codec, level):
+    """
+    创建块压缩函数
+
+    Args:
+        codec: 编码 ID
+        level: 压缩级别
+
+    Returns:
+        callable: 输入原始块，返回压缩块
+    """
+    if codec == CODEC_STORE:
+        return bytes
+    if codec == CODEC_ZLIB:
+        return lambda block: zlib.compress(block, level)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("未安装 zstandard 模块，无法使用 zstd 编码")
+        # ZstdCompressor 不是线程安全的，每次调用单独创建
+        return lambda block: zstandard.ZstdCompressor(level=level).compress(block)
+    raise ValueError(f"未知的编码: {codec}")
+
+
+def make_decompressor(codec):
+    """
+    创建块解压函数
+
+    Args:
+        codec: 编码 ID
+
+    Returns:
+        callable: 输入 (压缩块, 原始长度)，返回原始块
+    """
+    if codec == CODEC_STORE:
+        return lambda block, raw_len: block
+    if codec == CODEC_ZLIB:
+        return lambda block, raw_len: zlib.decompress(block)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("未安装 zstandard 模块，无法解压 zstd 数据")
+        return lambda block, raw_len: zstandard.ZstdDecompressor().decompress(block, max_output_size=raw_len)
+    raise ValueError(f"未知的编码: {codec}")
+
+
+def ordered_map(func, items, workers, write):
+    """
+    在线程池中并行执行 func，并按输入顺序写出结果
+
+    同时在途的任务数限制为 workers * 2，避免把整个输入读进内存
+    """
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            pending.append(pool.submit(func, *item))
+            if len(pending) >= workers * 2:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+
+
+def compress_stream(src, dst, level=1, codec=None, block_size=DEFAULT_BLOCK_SIZE, workers=None):
+    """
+    分块并行压缩
+
+    Args:
+        src: 二进制输入流
+        dst: 二进制输出流
+        level: 压缩级别，0 表示不压缩（仍然写帧头，便于恢复时识别）
+        codec: 编码 ID，默认 zlib（level 为 0 时强制为 store）
+        block_size: 块大小（字节）
+        workers: 线程数，默认 CPU 核心数
+
+    Returns:
+        tuple: (原始字节数, 输出字节数)
+    """
+    if codec is None:
+        codec = CODEC_ZLIB
+    if level == 0:
+        codec = CODEC_STORE
+    workers = workers or default_workers()
+    compress = make_compressor(codec, level)
+
+    dst.write(HEADER.pack(MAGIC, VERSION, codec, level, block_size))
+    stats = {'raw': 0, 'out': HEADER.size}
+
+    def encode(block):
+        return len(block), compress(block)
+
+    def blocks():
+        while True:
+            block = read_exact(src, block_size)
+            if not block:
+                return
+            yield (block,)
+
+    def write(result):
+        raw_len, data = result
+        dst.write(FRAME.pack(raw_len, len(data)))
+        dst.write(data)
+        stats['raw'] += raw_len
+        stats['out'] += FRAME.size + len(data)
+
+    ordered_map(encode, blocks(), workers, write)
+    dst.write(FRAME.pack(0, 0))
+    dst.flush()
+    stats['out'] += FRAME.size
+    return stats['raw'], stats['out']
+
+
+def read_header(src):
+    """
+    读取并解析文件头
+
+    Args:
+        src: 二进制输入流
+
+    Returns:
+        tuple: (header, raw)。header 为 dict（codec/level/block_size），
+               不是分块格式时为 None；raw 为已经读出的字节
+    """
+    raw = read_exact(src, HEADER.size)
+    if len(raw) < HEADER.size:
+        return None, raw
+    magic, version, codec, level, block_size = HEADER.unpack(raw)
+    if magic != MAGIC:
+        return None, raw
+    if version != VERSION:
+        raise ValueError(f"不支持的分块格式版本: {version}")
+    return {'codec': codec, 'level': level, 'block_size': block_size}, raw
+
+
+def _copy_stream(src, dst, prefix=b''):
+    """直接复制流（旧的无压缩备份）"""
+    dst.write(prefix)
+    while True:
+        chunk = src.read(DEFAULT_BLOCK_SIZE)
+        if not chunk:
+            break
+        dst.write(chunk)
+
+
+def _gunzip_stream(src, dst, prefix=b''):
+    """解压 gzip 流（旧的 gzip 备份，可能包含多个 member）"""
+    decomp = zlib.decompressobj(wbits=31)
+    data = prefix
+    while True:
+        while data:
+            dst.write(decomp.decompress(data))
+            if decomp.eof:
+                data = decomp.unused_data
+                decomp = zlib.decompressobj(wbits=31)
+            else:
+                data = b''
+        data = src.read(DEFAULT_BLOCK_SIZE)
+        if not data:
+            break
+    dst.write(decomp.flush())
+
+
+def decompress_stream(src, dst, workers=None):
+    """
+    分块并行解压
+
+    兼容旧格式：流开头不是分块文件头时，按 gzip 或未压缩数据处理，
+    这样恢复时只需要解密一次
+
+    Args:
+        src: 二进制输入流
+        dst: 二进制输出流
+        workers: 线程数，默认 CPU 核心数
+
+    Returns:
+        dict: 文件头信息，旧格式返回 {'codec': 'gzip'} 或 {'codec': 'raw'}
+    """
+    header, raw = read_header(src)
+    if header is None:
+        if raw.startswith(GZIP_MAGIC):
+            _gunzip_stream(src, dst, raw)
+            dst.flush()
+            return {'codec': 'gzip'}
+        _copy_stream(src, dst, raw)
+        dst.flush()
+        return {'codec': 'raw'}
+
+    workers = workers or default_workers()
+    decompress = make_decompressor(header['codec'])
+
+    def frames():
+        while True:
+            frame = read_exact(src, FRAME.size)
+            if len(frame) < FRAME.size:
+                raise ValueError("数据流被截断：缺少结束帧")
+            raw_len, comp_len = FRAME.unpack(frame)
+            if raw_len == 0 and comp_len == 0:
+                return
+            data = read_exact(src, comp_len)
+            if len(data) < comp_len:
+                raise ValueError("数据流被截断：数据帧不完整")
+            yield data, raw_len
+
+    def decode(data, raw_len):
+        block = decompress(data, raw_len)
+        if len(block) != raw_len:
+            raise ValueError(f"数据块长度不匹配：期望 {raw_len}，实际 {len(block)}")
+        return block
+
+    ordered_map(decode, frames(), workers, dst.write)
+    dst.flush()
+    return header
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="多核分块压缩工具（stdin → stdout）")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_compress = sub.add_parser('compress', help='压缩')
+    p_compress.add_argument('-l', '--level', type=int, default=1, help='压缩级别（0 = 不压缩）')
+    p_compress.add_argument('-c', '--codec', choices=['zlib', 'zstd'], default='zlib', help='编码')
+    p_compress.add_argument('-b', '--block-size', type=int, default=DEFAULT_BLOCK_SIZE // 1024 // 1024, help='块大小（MiB）')
+    p_compress.add_argument('-j', '--workers', type=int, default=None, help='线程数（默认 CPU 核心数）')
+
+    p_decompress = sub.add_parser('decompress', help='解压')
+    p_decompress.add_argument('-j', '--workers', type=int, default=None, help='线程数（默认 CPU 核心数）')
+
+    sub.add_parser('info', help='显示文件头信息')
+
+    args = parser.parse_args()
+    src = sys.stdin.buffer
+    dst = sys.stdout.buffer
+
+    if args.command == 'compress':
+        raw, out = compress_stream(src, dst, args.level, CODEC_NAMES[args.codec],
+                                   args.block_size * 1024 * 1024, args.workers)
+        print(f"压缩完成：{raw} → {out} 字节", file=sys.stderr)
+    elif args.command == 'decompress':
+        decompress_stream(src, dst, args.workers)
+    elif args.command == 'info':
+        header, _ = read_header(src)
+        if header is None:
+            print("不是分块压缩格式")
+            sys.exit(1)
+        codec = {v: k for k, v in CODEC_NAMES.items()}.get(header['codec'], header['codec'])
+        print(f"编码: {codec}")
+        print(f"压缩级别: {header['level']}")
+        print(f"块大小: {header['block_size']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+容器资源采样
+
+直接读取 redroid 容器的 cgroup 统计文件（不循环调用 docker stats），
+按固定间隔记录 CPU、内存、IO 和压力（PSI）指标，每个样本标记当时正在运行的 MAA 任务，
+用来判断卡顿/卡住时容器是否缺 CPU、内存或 IO
+
+同时支持 cgroup v2 和 v1（v1 没有 PSI，对应列留空）
+
+输出 CSV 列：
+    time          采样时间（UNIX 秒）
+    task          当前 MAA 任务
+    cpu_pct       CPU 使用率（相对单核，多核可超过 100）
+    throttled_ms  本周期内被限流的时间
+    mem_mb        内存占用（含页缓存）
+    anon_mb       匿名内存
+    file_mb       页缓存
+    majflt        本周期内的主缺页次数
+    read_kb       本周期读取量
+    write_kb      本周期写入量
+    cpu_some      CPU 压力（some avg10，%）
+    mem_some      内存压力（some avg10，%）
+    mem_full      内存压力（full avg10，%）
+    io_some       IO 压力（some avg10，%）
+
+run.py 运行 MAA 时会自动在后台采样（MAA_SAMPLE=0 关闭，MAA_SAMPLE_INTERVAL 调整间隔），
+结束时打印按任务汇总的结果
+
+单独使用：
+    python3 cgroup_sampler.py record --container redroid --interval 2 -o resource_samples.csv
+    python3 cgroup_sampler.py summary resource_samples.csv
+"""
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import threading
+import time
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+DEFAULT_CONTAINER = os.getenv('REDROID_NAME', 'redroid')
+DEFAULT_INTERVAL = 2.0
+DEFAULT_OUTPUT = 'resource_samples.csv'
+FIELDS = ['time', 'task', 'cpu_pct', 'throttled_ms', 'mem_mb', 'anon_mb', 'file_mb', 'majflt',
+          'read_kb', 'write_kb', 'cpu_some', 'mem_some', 'mem_full', 'io_some']
+MB = 1024 * 1024
+
+
+def _read(path):
+    """读取统计文件，不存在或无权限时返回 None"""
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _read_kv(path):
+    """读取 "key value" 格式的文件（cpu.stat、memory.stat）"""
+    text = _read(path)
+    result = {}
+    for line in (text or '').splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            result[parts[0]] = int(parts[1])
+    return result
+
+
+def _read_int(path):
+    text = _read(path)
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _read_pressure(path):
+    """
+    读取 PSI 文件
+
+    Returns:
+        dict: {'some': avg10, 'full': avg10}，文件不存在时为空
+    """
+    result = {}
+    for line in (_read(path) or '').splitlines():
+        kind, *fields = line.split()
+        values = dict(field.split('=') for field in fields)
+        result[kind] = float(values.get('avg10', 0))
+    return result
+
+
+def container_pid(container):
+    """
+    获取容器主进程 PID
+
+    Returns:
+        int: PID，容器未运行时返回 None
+    """
+    try:
+        result = subprocess.run(['docker', 'inspect', '-f', '{{.State.Pid}}', container],
+                                capture_output=True, text=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    pid = int(result.stdout.strip() or 0)
+    return pid or None
+
+
+def find_cgroup(pid):
+    """
+    根据 /proc/<pid>/cgroup 找到容器的 cgroup 目录
+
+    Returns:
+        dict: v2 为 {'version': 2, 'path': ...}；
+              v1 为 {'version': 1, 'cpu': ..., 'cpuacct': ..., 'memory': ..., 'blkio': ...}
+
+    Raises:
+        RuntimeError: 找不到 cgroup
+    """
+    text = _read(f'/proc/{pid}/cgroup')
+    if text is None:
+        raise RuntimeError(f"无法读取 /proc/{pid}/cgroup")
+    v1 = {}
+    for line in text.splitlines():
+        _, controllers, path = line.split(':', 2)
+        if controllers == '':
+            # 混合模式下也有 0:: 行，但控制器都挂在 v1 上
+            if os.path.exists(os.path.join(CGROUP_ROOT, 'cgroup.controllers')):
+                return {'version': 2, 'path': os.path.join(CGROUP_ROOT, path.lstrip('/'))}
+            continue
+        for controller in controllers.split(','):
+            if controller in ('cpu', 'cpuacct', 'memory', 'blkio'):
+                # v1 的挂载点可能是 cpu,cpuacct 这样的组合目录
+                for mount in (controller, controllers):
+                    candidate = os.path.join(CGROUP_ROOT, mount, path.lstrip('/'))
+                    if os.path.isdir(candidate):
+                        v1[controller] = candidate
+                        break
+    if not v1:
+        raise RuntimeError(f"进程 {pid} 没有可用的 cgroup")
+    return dict(v1, version=1)
+
+
+def read_counters(cgroup):
+    """
+    读取一次原始计数器
+
+    Returns:
+        dict: cpu_usec、throttled_usec、mem、anon、file、majflt、read、write（字节）以及 PSI
+    """
+    if cgroup['version'] == 2:
+        path = cgroup['path']
+        cpu = _read_kv(os.path.join(path, 'cpu.stat'))
+        memory = _read_kv(os.path.join(path, 'memory.stat'))
+        read_bytes = write_bytes = 0
+        for line in (_read(os.path.join(path, 'io.stat')) or '').splitlines():
+            for field in line.split()[1:]:
+                key, _, value = field.partition('=')
+                if key == 'rbytes':
+                    read_bytes += int(value)
+                elif key == 'wbytes':
+                    write_bytes += int(value)
+        cpu_pressure = _read_pressure(os.path.join(path, 'cpu.pressure'))
+        mem_pressure = _read_pressure(os.path.join(path, 'memory.pressure'))
+        io_pressure = _read_pressure(os.path.join(path, 'io.pressure'))
+        return {
+            'cpu_usec': cpu.get('usage_usec', 0),
+            'throttled_usec': cpu.get('throttled_usec', 0),
+            'mem': _read_int(os.path.join(path, 'memory.current')) or 0,
+            'anon': memory.get('anon', 0),
+            'file': memory.get('file', 0),
+            'majflt': memory.get('pgmajfault', 0),
+            'read': read_bytes,
+            'write': write_bytes,
+            'cpu_some': cpu_pressure.get('some'),
+            'mem_some': mem_pressure.get('some'),
+            'mem_full': mem_pressure.get('full'),
+            'io_some': io_pressure.get('some'),
+        }
+
+    cpuacct = cgroup.get('cpuacct') or cgroup.get('cpu')
+    cpu = _read_kv(os.path.join(cgroup.get('cpu', cpuacct), 'cpu.stat'))
+    memory = _read_kv(os.path.join(cgroup.get('memory', ''), 'memory.stat'))
+    read_bytes = write_bytes = 0
+    blkio = os.path.join(cgroup.get('blkio', ''), 'blkio.throttle.io_service_bytes')
+    for line in (_read(blkio) or '').splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[1] == 'Read':
+            read_bytes += int(parts[2])
+        elif len(parts) == 3 and parts[1] == 'Write':
+            write_bytes += int(parts[2])
+    return {
+        'cpu_usec': (_read_int(os.path.join(cpuacct, 'cpuacct.usage')) or 0) // 1000,
+        'throttled_usec': cpu.get('throttled_time', 0) // 1000,
+        'mem': _read_int(os.path.join(cgroup.get('memory', ''), 'memory.usage_in_bytes')) or 0,
+        'anon': memory.get('total_rss', memory.get('rss', 0)),
+        'file': memory.get('total_cache', memory.get('cache', 0)),
+        'majflt': memory.get('total_pgmajfault', memory.get('pgmajfault', 0)),
+        'read': read_bytes,
+        'write': write_bytes,
+        'cpu_some': None, 'mem_some': None, 'mem_full': None, 'io_some': None,
+    }
+
+
+def make_sample(previous, current, elapsed, task=''):
+    """
+    两次计数器 → 一行样本（累计值换算为本周期的增量）
+
+    Returns:
+        dict: 与 FIELDS 对应的样本
+    """
+    def delta(key):
+        return max(current[key] - previous[key], 0)
+
+    def optional(value):
+        return '' if value is None else value
+
+    return {
+        'time': round(time.time(), 1),
+        'task': task,
+        'cpu_pct': round(delta('cpu_usec') / (elapsed * 1_000_000) * 100, 1),
+        'throttled_ms': delta('throttled_usec') // 1000,
+        'mem_mb': round(current['mem'] / MB, 1),
+        'anon_mb': round(current['anon'] / MB, 1),
+        'file_mb': round(current['file'] / MB, 1),
+        'majflt': delta('majflt'),
+        'read_kb': delta('read') // 1024,
+        'write_kb': delta('write') // 1024,
+        'cpu_some': optional(current['cpu_some']),
+        'mem_some': optional(current['mem_some']),
+        'mem_full': optional(current['mem_full']),
+        'io_some': optional(current['io_some']),
+    }
+
+
+class CgroupSampler:
+    """后台采样线程；task 属性由调用方（run.py）在任务切换时更新"""
+
+    def __init__(self, container=DEFAULT_CONTAINER, interval=DEFAULT_INTERVAL, output=DEFAULT_OUTPUT):
+        """
+        Args:
+            container: 容器名
+            interval: 采样间隔（秒）
+            output: CSV 输出路径
+        """
+        self.container = container
+        self.interval = interval
+        self.output = output
+        self.task = ''
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        启动采样线程
+
+        Returns:
+            bool: 是否成功（容器未运行或找不到 cgroup 时返回 False，不影响调用方）
+        """
+        pid = container_pid(self.container)
+        if pid is None:
+            print(f"⚠️  容器 {self.container} 未运行，跳过资源采样", file=sys.stderr)
+            return False
+        try:
+            self.cgroup = find_cgroup(pid)
+        except RuntimeError as e:
+            print(f"⚠️  {e}，跳过资源采样", file=sys.stderr)
+            return False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self):
+        with open(self.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            previous = read_counters(self.cgroup)
+            previous_time = time.monotonic()
+            while not self._stop.wait(self.interval):
+                current = read_counters(self.cgroup)
+                now = time.monotonic()
+                writer.writerow(make_sample(previous, current, now - previous_time, self.task))
+                f.flush()
+                self.samples += 1
+                previous, previous_time = current, now
+
+    def stop(self):
+        """停止采样并等待线程结束"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def summarize(path):
+    """
+    按任务汇总样本
+
+    Returns:
+        list: 每个任务一项 dict：task、samples、cpu_avg、cpu_max、mem_max、throttled_ms、
+              majflt、read_mb、write_mb、mem_some_max、io_some_max（按首次出现顺序）
+    """
+    summary = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            task = row['task'] or '-'
+            item = summary.setdefault(task, {
+                'task': task, 'samples': 0, 'cpu_sum': 0.0, 'cpu_max': 0.0, 'mem_max': 0.0,
+                'throttled_ms': 0, 'majflt': 0, 'read_mb': 0.0, 'write_mb': 0.0,
+                'mem_some_max': 0.0, 'io_some_max': 0.0,
+            })
+            cpu = float(row['cpu_pct'])
+            item['samples'] += 1
+            item['cpu_sum'] += cpu
+            item['cpu_max'] = max(item['cpu_max'], cpu)
+            item['mem_max'] = max(item['mem_max'], float(row['mem_mb']))
+            item['throttled_ms'] += int(row['throttled_ms'])
+            item['majflt'] += int(row['majflt'])
+            item['read_mb'] += int(row['read_kb']) / 1024
+            item['write_mb'] += int(row['write_kb']) / 1024
+            if row['mem_some']:
+                item['mem_some_max'] = max(item['mem_some_max'], float(row['mem_some']))
+            if row['io_some']:
+                item['io_some_max'] = max(item['io_some_max'], float(row['io_some']))
+    for item in summary.values():
+        item['cpu_avg'] = item.pop('cpu_sum') / item['samples']
+    return list(summary.values())
+
+
+def print_summary(path):
+    """打印按任务汇总的表格"""
+    rows = summarize(path)
+    print(f"{'任务':<12}{'样本':>6}{'CPU均值%':>10}{'CPU峰值%':>10}{'内存峰值MB':>12}"
+          f"{'限流ms':>9}{'主缺页':>8}{'读MB':>8}{'写MB':>8}{'内存压力':>9}{'IO压力':>8}")
+    for r in rows:
+        print(f"{r['task']:<12}{r['samples']:>6}{r['cpu_avg']:>10.1f}{r['cpu_max']:>10.1f}{r['mem_max']:>12.0f}"
+              f"{r['throttled_ms']:>9}{r['majflt']:>8}{r['read_mb']:>8.0f}{r['write_mb']:>8.0f}"
+              f"{r['mem_some_max']:>9.1f}{r['io_some_max']:>8.1f}")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="容器 cgroup 资源采样")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_record = sub.add_parser('record', help='持续采样直到 Ctrl+C')
+    p_record.add_argument('--container', default=DEFAULT_CONTAINER, help='容器名')
+    p_record.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='采样间隔（秒）')
+    p_record.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help='CSV 输出文件')
+
+    p_summary = sub.add_parser('summary', help='按任务汇总')
+    p_summary.add_argument('file', nargs='?', default=DEFAULT_OUTPUT)
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        sampler = CgroupSampler(args.container, args.interval, args.output)
+        if not sampler.start():
+            sys.exit(1)
+        print(f"📈 正在采样 {args.container}（每 {args.interval}s）→ {args.output}，Ctrl+C 停止", file=sys.stderr)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            sampler.stop()
+            print(f"\n✅ 共 {sampler.samples} 个样本", file=sys.stderr)
+    elif args.command == 'summary':
+        print_summary(args.file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+备份压缩设置自动调优
+
+从 ark.tar / data.img 中均匀抽样，在本机测量各编码和级别的压缩速度、压缩率和解压速度，
+结合实测的上传/下载带宽，估算 备份（压缩 + 上传）+ 恢复（下载 + 解压）的总耗时，
+选出耗时最短的编码、级别和分卷大小，保存到 maa_state/compression.json 供之后的备份使用
+
+带宽来自之前的实际传输：stream_backup.py / stream_restore.py 每次运行后记录单连接速度和并发数，
+没有记录时使用保守的默认值
+
+maa_state/ 由 workflow 的缓存在多次运行之间保留
+
+用法：
+    python3 compression_tuner.py tune ark.tar data.img     # 测量并保存选择
+    python3 compression_tuner.py show                      # 显示当前选择和测量结果
+    python3 compression_tuner.py get                       # 输出 "编码 级别 分卷大小"，供 shell 读取
+    python3 compression_tuner.py check --max-age 7         # 选择存在且不超过 7 天时退出码为 0
+"""
+import argparse
+import errno
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from block_compress import CODEC_NAMES, DEFAULT_BLOCK_SIZE, default_workers, make_compressor, make_decompressor, zstandard
+from snapshot_crypto import parse_size
+
+STATE_DIR = os.getenv('MAA_STATE_DIR', 'maa_state')
+STATE_FILE = os.path.join(STATE_DIR, 'compression.json')
+
+# 未调优时的设置（与之前 backup_to_release.sh 中写死的一致）
+DEFAULT_CHOICE = {'codec': 'zlib', 'level': 1, 'split_size': '1900m'}
+# 候选设置：级别 0 为只分帧不压缩
+CANDIDATES = [('store', 0), ('zlib', 1), ('zlib', 3), ('zlib', 6), ('zstd', 1), ('zstd', 3), ('zstd', 6), ('zstd', 12)]
+# 分卷大小候选（GitHub Release 单个文件上限 2GB）
+SPLIT_SIZES = ['512m', '1024m', '1900m']
+# 没有实测记录时的单连接带宽（MB/s）
+DEFAULT_STREAM_MBPS = {'upload': 30.0, 'download': 60.0}
+# 每个分卷的固定开销（创建 asset、校验等，秒）
+PART_OVERHEAD = 5.0
+DEFAULT_SAMPLE = '256m'
+
+
+def load_state(path=STATE_FILE):
+    """
+    读取状态文件
+
+    Returns:
+        dict: 状态，文件不存在或损坏时为空字典
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, path=STATE_FILE):
+    """写入状态文件（先写临时文件再替换）"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def record_transfer(direction, transfers, streams, path=STATE_FILE):
+    """
+    记录一次实际传输的带宽（stream_backup.py / stream_restore.py 调用）
+
+    记录失败只打印警告，不影响备份和恢复
+
+    Args:
+        direction: 'upload' 或 'download'
+        transfers: [(字节数, 秒数), ...]，每个分卷一项
+        streams: 并发连接数
+    """
+    size = sum(item[0] for item in transfers)
+    seconds = sum(item[1] for item in transfers)
+    # 太小的传输测不准（清单、连接建立开销占主导）
+    if size < 16 * 1024 * 1024 or seconds <= 0:
+        return
+    try:
+        state = load_state(path)
+        state.setdefault('bandwidth', {})[direction] = {
+            'stream_mbps': round(size / seconds / 1024 / 1024, 2),
+            'streams': streams,
+            'bytes': size,
+            'measured_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        save_state(state, path)
+    except OSError as e:
+        print(f"⚠️  无法记录{direction}带宽: {e}", file=sys.stderr)
+
+
+def bandwidth(state, direction, streams):
+    """
+    有效带宽（MB/s）= 单连接速度 × 并发数
+
+    Returns:
+        tuple: (有效带宽, 单连接速度, 是否为实测值)
+    """
+    record = state.get('bandwidth', {}).get(direction)
+    if record:
+        return record['stream_mbps'] * streams, record['stream_mbps'], True
+    return DEFAULT_STREAM_MBPS[direction] * streams, DEFAULT_STREAM_MBPS[direction], False
+
+
+def _data_extents(f, size):
+    """
+    稀疏文件中实际有数据的区间（tar -S 只打包这些部分）
+
+    文件系统不支持 SEEK_DATA 时把整个文件当作一个区间
+
+    Returns:
+        list: [(起始偏移, 长度), ...]
+    """
+    if not hasattr(os, 'SEEK_DATA'):
+        return [(0, size)]
+    extents = []
+    offset = 0
+    fd = f.fileno()
+    try:
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:  # 之后全是空洞
+                    break
+                raise
+            end = os.lseek(fd, start, os.SEEK_HOLE)
+            extents.append((start, end - start))
+            offset = end
+    except OSError:
+        return [(0, size)]
+    return extents
+
+
+def sample_blocks(paths, sample_size, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    从文件中均匀抽取数据块，每个文件的样本量与其大小成正比（至少一块）
+
+    稀疏文件（data.img）只在有数据的区间内抽样，大小也只计实际数据，
+    与 tar -S 打包后的流一致
+
+    Args:
+        paths: 文件列表
+        sample_size: 样本总大小（字节）
+        block_size: 块大小（与 block_compress.py 相同）
+
+    Returns:
+        tuple: (数据块列表, 实际数据总大小)
+
+    Raises:
+        ValueError: 文件不存在或为空
+    """
+    extents = {}
+    for path in paths:
+        if not os.path.isfile(path):
+            raise ValueError(f"未找到 {path}")
+        with open(path, 'rb') as f:
+            extents[path] = _data_extents(f, os.path.getsize(path))
+    sizes = {path: sum(length for _, length in ext) for path, ext in extents.items()}
+    total = sum(sizes.values())
+    if total == 0:
+        raise ValueError("样本文件都是空的")
+
+    blocks = []
+    for path, size in sizes.items():
+        if size == 0:
+            continue
+        count = max(1, min(round(sample_size * size / total / block_size), math.ceil(size / block_size)))
+        stride = max((size - block_size) / max(count - 1, 1), 0)
+        with open(path, 'rb') as f:
+            for i in range(count):
+                # 数据偏移 → 文件偏移（跳过空洞）
+                position = int(i * stride)
+                for start, length in extents[path]:
+                    if position < length:
+                        f.seek(start + position)
+                        block = f.read(min(block_size, length - position))
+                        if block:
+                            blocks.append(block)
+                        break
+                    position -= length
+    return blocks, total
+
+
+def measure(blocks, codec, level, workers=None):
+    """
+    用线程池（与 block_compress.py 相同的并发方式）测量一个设置
+
+    Returns:
+        dict: codec、level、ratio（压缩后/原始）、compress_mbps、decompress_mbps
+    """
+    workers = workers or default_workers()
+    codec_id = CODEC_NAMES[codec]
+    compress = make_compressor(codec_id, level)
+    decompress = make_decompressor(codec_id)
+    raw = sum(len(block) for block in blocks)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        compressed = list(pool.map(compress, blocks))
+        compress_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in pool.map(decompress, compressed, [len(block) for block in blocks]):
+            pass
+        decompress_seconds = time.perf_counter() - start
+
+    mb = raw / 1024 / 1024
+    return {
+        'codec': codec,
+        'level': level,
+        'ratio': sum(len(block) for block in compressed) / raw,
+        'compress_mbps': mb / max(compress_seconds, 1e-6),
+        'decompress_mbps': mb / max(decompress_seconds, 1e-6),
+    }
+
+
+def estimate(result, raw_bytes, split_size, upload, download, pipelined=True):
+    """
+    估算备份和恢复耗时（秒）
+
+    流水线模式下压缩和上传重叠，耗时取较慢的一方，再加上最后一个分卷的上传时间；
+    传统模式为两者之和。恢复总是流式的（下载和解压重叠）
+
+    Args:
+        result: measure() 的结果
+        raw_bytes: 原始大小
+        split_size: 分卷大小（字节）
+        upload: (有效带宽, 单连接速度)，MB/s
+        download: (有效带宽, 单连接速度)，MB/s
+        pipelined: 备份是否为流水线模式
+
+    Returns:
+        tuple: (备份秒数, 恢复秒数)
+    """
+    raw_mb = raw_bytes / 1024 / 1024
+    out_mb = raw_mb * result['ratio']
+    parts = max(1, math.ceil(out_mb * 1024 * 1024 / split_size))
+    part_mb = out_mb / parts
+
+    compress_seconds = raw_mb / result['compress_mbps']
+    upload_seconds = out_mb / upload[0]
+    if pipelined:
+        backup = max(compress_seconds, upload_seconds) + part_mb / upload[1]
+    else:
+        backup = compress_seconds + upload_seconds
+    backup += parts * PART_OVERHEAD / max(upload[0] / upload[1], 1)
+
+    restore = max(out_mb / download[0], raw_mb / result['decompress_mbps']) + part_mb / download[1]
+    return backup, restore
+
+
+def tune(paths, sample_size=parse_size(DEFAULT_SAMPLE), uploads=2, prefetch=2, pipelined=True,
+         workers=None, path=STATE_FILE):
+    """
+    测量所有候选设置，保存耗时最短的一个
+
+    Args:
+        paths: 样本文件（备份中的 ark.tar / data.img）
+        sample_size: 样本大小（字节）
+        uploads: 备份时的并发上传数
+        prefetch: 恢复时的并发下载数
+        pipelined: 备份是否为流水线模式
+        workers: 压缩线程数
+        path: 状态文件
+
+    Returns:
+        dict: 保存的选择
+    """
+    blocks, raw_bytes = sample_blocks(paths, sample_size)
+    state = load_state(path)
+    up_total, up_stream, up_measured = bandwidth(state, 'upload', uploads)
+    down_total, down_stream, down_measured = bandwidth(state, 'download', prefetch)
+    print(f"🔬 样本 {len(blocks)} 块（{sum(len(b) for b in blocks) / 1024 / 1024:.0f} MB），"
+          f"原始大小 {raw_bytes / 1024 ** 3:.1f} GB，{workers or default_workers()} 线程", file=sys.stderr)
+    print(f"🌐 上传 {up_total:.0f} MB/s（{'实测' if up_measured else '默认'}，{uploads} 并发），"
+          f"下载 {down_total:.0f} MB/s（{'实测' if down_measured else '默认'}，{prefetch} 并发）", file=sys.stderr)
+
+    results = []
+    for codec, level in CANDIDATES:
+        if codec == 'zstd' and zstandard is None:
+            continue
+        result = measure(blocks, codec, level, workers)
+        best = None
+        for split in SPLIT_SIZES:
+            backup, restore = estimate(result, raw_bytes, parse_size(split), (up_total, up_stream),
+                                       (down_total, down_stream), pipelined)
+            if best is None or backup + restore < best['total']:
+                best = {'split_size': split, 'backup': backup, 'restore': restore, 'total': backup + restore}
+        result.update(best)
+        results.append(result)
+        print(f"   {codec:<5} {level:>2}  压缩率 {result['ratio'] * 100:5.1f}%  "
+              f"压缩 {result['compress_mbps']:7.0f} MB/s  解压 {result['decompress_mbps']:7.0f} MB/s  "
+              f"→ 备份 {format_duration(result['backup'])} + 恢复 {format_duration(result['restore'])}"
+              f"（分卷 {result['split_size']}）", file=sys.stderr)
+
+    chosen = min(results, key=lambda item: item['total'])
+    state['compression'] = {
+        'codec': chosen['codec'],
+        'level': chosen['level'],
+        'split_size': chosen['split_size'],
+        'estimated_seconds': round(chosen['total']),
+        'raw_bytes': raw_bytes,
+        'workers': workers or default_workers(),
+        'bandwidth_measured': up_measured and down_measured,
+        'measured_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'timestamp': time.time(),
+        'results': [{key: round(value, 4) if isinstance(value, float) else value for key, value in item.items()}
+                    for item in results],
+    }
+    save_state(state, path)
+    print(f"✅ 选择 {chosen['codec']} 级别 {chosen['level']}，分卷 {chosen['split_size']}"
+          f"（预计 {format_duration(chosen['total'])}）→ {path}", file=sys.stderr)
+    return state['compression']
+
+
+def format_duration(seconds):
+    """把秒数格式化为 XmYYs"""
+    seconds = int(round(seconds))
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+def current_choice(path=STATE_FILE):
+    """
+    当前使用的压缩设置
+
+    Returns:
+        dict: codec、level、split_size；没有调优结果时为默认值
+    """
+    choice = load_state(path).get('compression')
+    if not choice:
+        return dict(DEFAULT_CHOICE)
+    if choice['codec'] == 'zstd' and zstandard is None:
+        # 调优时可用 zstd，现在不可用：退回默认值
+        return dict(DEFAULT_CHOICE)
+    return {key: choice[key] for key in DEFAULT_CHOICE}
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="备份压缩设置自动调优")
+    parser.add_argument('--state', default=STATE_FILE, help='状态文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_tune = sub.add_parser('tune', help='抽样测量并保存最快的设置')
+    p_tune.add_argument('files', nargs='+', help='备份的文件（ark.tar / ark.delta.tar、data.img 或 data.tar）')
+    p_tune.add_argument('--sample', default=DEFAULT_SAMPLE, help='样本大小（如 256m）')
+    p_tune.add_argument('--uploads', type=int, default=2, help='备份时的并发上传数')
+    p_tune.add_argument('--prefetch', type=int, default=2, help='恢复时的并发下载数')
+    p_tune.add_argument('--mode', choices=['pipelined', 'file'], default='pipelined', help='备份模式')
+    p_tune.add_argument('-j', '--workers', type=int, default=None, help='线程数（默认 CPU 核心数）')
+
+    sub.add_parser('show', help='显示当前选择和测量结果')
+    sub.add_parser('get', help='输出 "编码 级别 分卷大小"')
+
+    p_check = sub.add_parser('check', help='检查调优结果是否存在且未过期')
+    p_check.add_argument('--max-age', type=float, default=7, help='最长有效天数')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'tune':
+            tune(args.files, parse_size(args.sample), args.uploads, args.prefetch, args.mode == 'pipelined',
+                 args.workers, args.state)
+        elif args.command == 'get':
+            choice = current_choice(args.state)
+            # 不压缩在 block_compress.py 中表示为级别 0
+            codec = 'zlib' if choice['codec'] == 'store' else choice['codec']
+            print(codec, choice['level'], choice['split_size'])
+        elif args.command == 'check':
+            choice = load_state(args.state).get('compression')
+            if not choice or time.time() - choice.get('timestamp', 0) > args.max_age * 86400:
+                sys.exit(1)
+        elif args.command == 'show':
+            state = load_state(args.state)
+            choice = state.get('compression')
+            if not choice:
+                print(f"ℹ️  尚未调优，使用默认设置：{DEFAULT_CHOICE}")
+            else:
+                print(f"🗜️  {choice['codec']} 级别 {choice['level']}，分卷 {choice['split_size']}"
+                      f"（{choice['measured_at']} 测量，预计 {format_duration(choice['estimated_seconds'])}）")
+                for item in sorted(choice['results'], key=lambda item: item['total']):
+                    print(f"   {item['codec']:<5} {item['level']:>2}  压缩率 {item['ratio'] * 100:5.1f}%  "
+                          f"压缩 {item['compress_mbps']:7.0f} MB/s  解压 {item['decompress_mbps']:7.0f} MB/s  "
+                          f"总计 {format_duration(item['total'])}")
+            for direction, record in state.get('bandwidth', {}).items():
+                print(f"🌐 {direction}: 单连接 {record['stream_mbps']} MB/s × {record['streams']}"
+                      f"（{record['measured_at']}）")
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
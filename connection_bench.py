@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+连接与截图方式测速
+
+MAA 每一步识别都要截一次图，截图延迟直接决定运行速度。本工具通过本机 ADB 连接，
+对每种可用的方式各采样多次，测量单帧截图延迟、ADB 点击的往返延迟和常驻触控进程的可用性，
+选出最快且稳定的组合写入 MAA 的 profile（touch_mode、adb_lite_enabled）
+
+测量的方式：
+    截图（MAA 会在连接时自动选择截图方式，这里测量各方式在两种传输上的表现）：
+        - Raw / RawWithGzip / Encode：screencap 原始数据 / gzip 压缩 / PNG 编码
+        - 传输 adb：每帧启动一次 adb 可执行文件（adb_lite_enabled = false）
+        - 传输 lite：直接连接 adb server 的端口（与 MAA 的 adb-lite 相同，adb_lite_enabled = true）
+    点击（touch_mode）：
+        - ADB：每次点击执行 adb shell input tap，测量完整的往返耗时
+        - MaaTouch / MiniTouch：常驻进程，从 MAA 的资源目录推送到设备；
+          协议没有回执，无法测量单次点击的端到端延迟，只检查启动握手、启动耗时和连续点击后进程是否仍在运行
+        常驻方式不需要每次点击启动进程，可用时优先于 ADB；两种常驻方式之间优先保留 profile 中原来的设置
+
+测量结果以设备的 ro.build.fingerprint（底层 redroid 镜像）为键保存在 maa_state/connection.json，
+docker commit 每次都会生成新的镜像 ID，所以不用镜像 ID；镜像变化时 auto 重新测量，否则直接应用保存的结果
+
+用法：
+    python3 connection_bench.py auto          # 镜像变化时测量，然后写入 profile（run.py 调用）
+    python3 connection_bench.py run           # 强制重新测量并写入 profile
+    python3 connection_bench.py run --dry-run # 只测量，不写入
+    python3 connection_bench.py show          # 显示保存的测量结果
+"""
+import argparse
+import gzip
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import toml
+
+STATE_DIR = os.getenv('MAA_STATE_DIR', 'maa_state')
+STATE_FILE = os.path.join(STATE_DIR, 'connection.json')
+CONFIG_DIR = os.getenv('MAA_CONFIG_DIR', os.path.expanduser('~/.config/maa'))
+
+ADB_SERVER = ('127.0.0.1', int(os.getenv('ANDROID_ADB_SERVER_PORT', '5037')))
+DEFAULT_DEVICE = os.getenv('ADB_DEVICE', '127.0.0.1:5555')
+DEFAULT_FRAMES = 30
+DEFAULT_TAPS = 20
+# 每种方式先丢弃的样本数（连接建立、缓存预热）
+WARMUP = 2
+COMMAND_TIMEOUT = 20
+
+CAPTURE_METHODS = {
+    'Raw': 'screencap',
+    'RawWithGzip': 'screencap | gzip -1',
+    'Encode': 'screencap -p',
+}
+TRANSPORTS = ['adb', 'lite']
+TOUCH_MODES = ['ADB', 'MaaTouch', 'MiniTouch']
+# 常驻触控进程在设备上的位置和启动命令（与 MAA 相同）
+TOUCH_REMOTE = {
+    'MaaTouch': ('/data/local/tmp/maatouch',
+                 'CLASSPATH=/data/local/tmp/maatouch app_process /data/local/tmp com.shxyke.MaaTouch.App'),
+    'MiniTouch': ('/data/local/tmp/minitouch', '/data/local/tmp/minitouch -i'),
+}
+# 点击位置：屏幕左上角（状态栏，测速时游戏尚未启动，点击不会触发任何操作）
+TAP_RATIO = 0.005
+# p95 超过中位数的这个倍数视为不稳定
+STABLE_P95_RATIO = 3.0
+
+
+def load_state(path=STATE_FILE):
+    """
+    读取状态文件
+
+    Returns:
+        dict: 状态，文件不存在或损坏时为空字典
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, path=STATE_FILE):
+    """写入状态文件（先写临时文件再替换）"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+# ==================== ADB ====================
+
+def adb(device, *args, timeout=COMMAND_TIMEOUT):
+    """
+    执行 adb 命令
+
+    Returns:
+        bytes: 标准输出
+
+    Raises:
+        RuntimeError: adb 不存在、超时或返回非零
+    """
+    try:
+        result = subprocess.run(['adb', '-s', device, *args], capture_output=True, timeout=timeout)
+    except FileNotFoundError:
+        raise RuntimeError("未找到 adb")
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"adb {' '.join(args)} 超时")
+    if result.returncode != 0:
+        raise RuntimeError(f"adb {' '.join(args)} 失败: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise RuntimeError("adb server 断开连接")
+        data += chunk
+    return data
+
+
+def _adb_request(sock, payload):
+    """发送一个 adb server 请求（4 位十六进制长度 + 内容）并检查 OKAY"""
+    sock.sendall(f"{len(payload):04x}{payload}".encode())
+    status = _recv_exact(sock, 4)
+    if status != b'OKAY':
+        length = int(_recv_exact(sock, 4), 16)
+        raise RuntimeError(f"adb server 拒绝 {payload}: {_recv_exact(sock, length).decode(errors='replace')}")
+
+
+def lite_exec(device, command, timeout=COMMAND_TIMEOUT):
+    """
+    不经过 adb 可执行文件，直接通过 adb server 在设备上执行命令（exec: 服务，输出不经过 pty）
+
+    Returns:
+        bytes: 标准输出
+    """
+    with socket.create_connection(ADB_SERVER, timeout=timeout) as sock:
+        _adb_request(sock, f"host:transport:{device}")
+        _adb_request(sock, f"exec:{command}")
+        chunks = []
+        while True:
+            chunk = sock.recv(1 << 20)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def screen_size(device):
+    """
+    设备屏幕分辨率
+
+    Returns:
+        tuple: (宽, 高)
+    """
+    output = adb(device, 'shell', 'wm', 'size').decode(errors='replace')
+    # "Physical size: 1280x720"，有 Override size 时以最后一行为准
+    size = output.strip().splitlines()[-1].split(':')[-1].strip()
+    width, height = size.split('x')
+    return int(width), int(height)
+
+
+def device_fingerprint(device):
+    """底层镜像的标识（ro.build.fingerprint）"""
+    return adb(device, 'shell', 'getprop', 'ro.build.fingerprint').decode(errors='replace').strip()
+
+
+# ==================== 截图 ====================
+
+def check_frame(method, data, width, height):
+    """
+    检查截图数据是否完整
+
+    Raises:
+        RuntimeError: 数据不完整
+    """
+    if method == 'RawWithGzip':
+        try:
+            data = gzip.decompress(data)
+        except (OSError, EOFError):
+            raise RuntimeError("gzip 数据损坏")
+        method = 'Raw'
+    if method == 'Raw' and len(data) < width * height * 4:
+        raise RuntimeError(f"原始数据不完整（{len(data)} 字节）")
+    if method == 'Encode' and not data.startswith(b'\x89PNG'):
+        raise RuntimeError("不是 PNG 数据")
+
+
+def measure_capture(device, method, transport, frames, size):
+    """
+    测量一种截图方式
+
+    Returns:
+        tuple: (每帧耗时列表（毫秒）, 失败次数, 单帧大小)
+    """
+    command = CAPTURE_METHODS[method]
+    samples = []
+    failures = 0
+    frame_bytes = 0
+    for i in range(frames + WARMUP):
+        start = time.perf_counter()
+        try:
+            if transport == 'lite':
+                data = lite_exec(device, command)
+            else:
+                data = adb(device, 'exec-out', command)
+            elapsed = (time.perf_counter() - start) * 1000
+            check_frame(method, data, *size)
+        except (RuntimeError, OSError):
+            failures += 1
+            continue
+        if i >= WARMUP:
+            samples.append(elapsed)
+            frame_bytes = len(data)
+    return samples, failures, frame_bytes
+
+
+# ==================== 点击 ====================
+
+def find_touch_binary(mode, abi):
+    """
+    在 MAA 的资源目录中查找常驻触控程序（maatouch / <abi>/minitouch）
+
+    Returns:
+        str: 文件路径；未找到时为 None
+    """
+    roots = [os.getenv('MAA_RESOURCE_DIR', '')]
+    try:
+        roots.append(subprocess.run(['maa', 'dir', 'resource'], capture_output=True, text=True,
+                                    timeout=10).stdout.strip())
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+    name = mode.lower()
+    for root in filter(None, roots):
+        for dirpath, _, filenames in os.walk(os.path.dirname(root.rstrip('/'))):
+            if name not in filenames:
+                continue
+            if mode == 'MiniTouch' and os.path.basename(dirpath) != abi:
+                continue
+            return os.path.join(dirpath, name)
+    return None
+
+
+def _read_header(process, timeout):
+    """
+    读取常驻触控进程的握手（v 版本 / ^ 触点数 最大x 最大y 最大压力 / $ pid）
+
+    Returns:
+        tuple: (最大 x, 最大 y)；超时或进程退出时为 None
+    """
+    header = {}
+
+    def reader():
+        for line in process.stdout:
+            line = line.decode(errors='replace').strip()
+            if line.startswith('^'):
+                fields = line.split()
+                header['max'] = (int(fields[2]), int(fields[3]))
+            elif line.startswith('$'):
+                header['ready'] = True
+                return
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return header.get('max') if header.get('ready') else None
+
+
+def measure_touch(device, mode, taps, size, abi):
+    """
+    测量一种点击方式
+
+    Returns:
+        dict: ADB 为 samples（每次点击的往返耗时，毫秒）、failures；
+              常驻方式为 startup_ms（启动到握手的耗时）、sent（成功发送的点击数）、stable（点击后进程仍在运行）；
+              不可用时为 {'unavailable': 原因}
+    """
+    width, height = size
+    x, y = max(1, int(width * TAP_RATIO)), max(1, int(height * TAP_RATIO))
+
+    if mode == 'ADB':
+        samples = []
+        failures = 0
+        for i in range(taps + WARMUP):
+            start = time.perf_counter()
+            try:
+                adb(device, 'shell', 'input', 'tap', str(x), str(y))
+            except RuntimeError:
+                failures += 1
+                continue
+            if i >= WARMUP:
+                samples.append((time.perf_counter() - start) * 1000)
+        return {'samples': samples, 'failures': failures}
+
+    local = find_touch_binary(mode, abi)
+    if not local:
+        return {'unavailable': f"未在 MAA 资源目录中找到 {mode.lower()}"}
+    remote, command = TOUCH_REMOTE[mode]
+    try:
+        adb(device, 'push', local, remote)
+        adb(device, 'shell', 'chmod', '755', remote)
+    except RuntimeError as e:
+        return {'unavailable': str(e)}
+
+    start = time.perf_counter()
+    process = subprocess.Popen(['adb', '-s', device, 'shell', command],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        limits = _read_header(process, COMMAND_TIMEOUT)
+        startup_ms = (time.perf_counter() - start) * 1000
+        if not limits:
+            return {'unavailable': f"{mode} 启动失败（没有握手）"}
+        tx, ty = max(1, limits[0] * x // width), max(1, limits[1] * y // height)
+        tap = f"d 0 {tx} {ty} 50\nc\nu 0\nc\n".encode()
+        sent = 0
+        for _ in range(taps):
+            try:
+                process.stdin.write(tap)
+                process.stdin.flush()
+            except OSError:
+                break
+            sent += 1
+            # 与 MAA 点击之间的间隔相当，避免被识别为长按或滑动
+            time.sleep(0.05)
+        time.sleep(0.5)
+        return {'startup_ms': round(startup_ms, 1), 'sent': sent,
+                'stable': sent == taps and process.poll() is None}
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+
+# ==================== 统计与选择 ====================
+
+def summarize(samples, failures):
+    """
+    单种方式的统计
+
+    Returns:
+        dict: count、failures、median、p95、min、max（毫秒）、stable
+    """
+    if not samples:
+        return {'count': 0, 'failures': failures, 'stable': False}
+    ordered = sorted(samples)
+    median = statistics.median(ordered)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        'count': len(ordered),
+        'failures': failures,
+        'median': round(median, 2),
+        'p95': round(p95, 2),
+        'min': round(ordered[0], 2),
+        'max': round(ordered[-1], 2),
+        'stable': failures == 0 and p95 <= median * STABLE_P95_RATIO,
+    }
+
+
+def choose(results, current):
+    """
+    选出最快且稳定的组合
+
+    截图由 MAA 自动选择方式，所以每种传输取其最快的稳定截图方式比较；
+    点击：常驻方式没有单次点击的端到端延迟，不与 ADB 的往返耗时比较——
+    有握手成功且连续点击后仍在运行的常驻方式时从中选择（优先保留原来的设置，其次按 TOUCH_MODES 顺序），
+    都不可用时只有 ADB 稳定才改为 ADB；
+    没有稳定的测量结果的设置保持 profile 中原来的值
+
+    Args:
+        results: benchmark() 的结果
+        current: profile 中当前的 instance_options
+
+    Returns:
+        dict: touch_mode、adb_lite_enabled
+    """
+    choice = {'touch_mode': current.get('touch_mode', 'MaaTouch'),
+              'adb_lite_enabled': current.get('adb_lite_enabled', False)}
+
+    best = {}
+    for item in results['capture']:
+        stats = item['stats']
+        if stats['stable'] and stats['median'] < best.get(item['transport'], float('inf')):
+            best[item['transport']] = stats['median']
+    if len(best) == len(TRANSPORTS):
+        choice['adb_lite_enabled'] = best['lite'] < best['adb']
+
+    persistent = [item['mode'] for item in results['touch'] if item.get('stable')]
+    if persistent:
+        if choice['touch_mode'] not in persistent:
+            choice['touch_mode'] = persistent[0]
+    elif any(item['mode'] == 'ADB' and item.get('stats', {}).get('stable') for item in results['touch']):
+        choice['touch_mode'] = 'ADB'
+    return choice
+
+
+def benchmark(device, frames=DEFAULT_FRAMES, taps=DEFAULT_TAPS):
+    """
+    测量所有截图和点击方式
+
+    Returns:
+        dict: fingerprint、size、capture [{method, transport, stats, frame_bytes}]、
+              touch [{mode, stats}（ADB）、{mode, startup_ms, sent, stable}（常驻）或 {mode, unavailable}]
+
+    Raises:
+        RuntimeError: 设备不可用
+    """
+    size = screen_size(device)
+    abi = adb(device, 'shell', 'getprop', 'ro.product.cpu.abi').decode(errors='replace').strip()
+    results = {'fingerprint': device_fingerprint(device), 'size': list(size), 'capture': [], 'touch': []}
+
+    for transport in TRANSPORTS:
+        for method in CAPTURE_METHODS:
+            print(f"📸 {transport:<4} {method} ...", file=sys.stderr)
+            samples, failures, frame_bytes = measure_capture(device, method, transport, frames, size)
+            results['capture'].append({'method': method, 'transport': transport, 'frame_bytes': frame_bytes,
+                                       'stats': summarize(samples, failures)})
+
+    for mode in TOUCH_MODES:
+        print(f"👆 {mode} ...", file=sys.stderr)
+        measured = measure_touch(device, mode, taps, size, abi)
+        if 'samples' in measured:
+            results['touch'].append({'mode': mode, 'stats': summarize(measured['samples'], measured['failures'])})
+        else:
+            results['touch'].append(dict(measured, mode=mode))
+    return results
+
+
+def print_results(results, choice=None):
+    """打印每帧/每次点击的耗时"""
+    print(f"📱 {results['fingerprint']}（{results['size'][0]}x{results['size'][1]}）")
+    print(f"   {'截图':<16} {'中位数':>8} {'p95':>8} {'最小':>8} {'帧/秒':>7} {'单帧':>8}  稳定")
+    for item in results['capture']:
+        stats = item['stats']
+        label = f"{item['transport']} {item['method']}"
+        if not stats['count']:
+            print(f"   {label:<16} 全部失败（{stats['failures']} 次）")
+            continue
+        print(f"   {label:<16} {stats['median']:>6.1f}ms {stats['p95']:>6.1f}ms {stats['min']:>6.1f}ms "
+              f"{1000 / stats['median']:>7.1f} {item['frame_bytes'] / 1024:>6.0f}KB  {'✅' if stats['stable'] else '⚠️'}")
+    for item in results['touch']:
+        if 'unavailable' in item:
+            print(f"   {item['mode']:<16} 不可用：{item['unavailable']}")
+        elif 'stats' in item:
+            stats = item['stats']
+            if not stats['count']:
+                print(f"   {item['mode']:<16} 全部失败（{stats['failures']} 次）")
+                continue
+            print(f"   {item['mode']:<16} 单次点击往返 中位数 {stats['median']:.1f}ms，p95 {stats['p95']:.1f}ms，"
+                  f"最小 {stats['min']:.1f}ms  {'✅' if stats['stable'] else '⚠️'}")
+        else:
+            print(f"   {item['mode']:<16} 常驻进程，握手耗时 {item['startup_ms']:.0f}ms，"
+                  f"连续点击 {item['sent']} 次后{'仍在运行 ✅' if item['stable'] else '退出 ⚠️'}（无单次点击延迟）")
+    if choice:
+        print(f"🏁 touch_mode = {choice['touch_mode']}，adb_lite_enabled = {str(choice['adb_lite_enabled']).lower()}")
+
+
+# ==================== profile ====================
+
+def profile_path(config_dir=CONFIG_DIR):
+    return os.path.join(config_dir, 'profiles', 'default.toml')
+
+
+def read_profile(config_dir=CONFIG_DIR):
+    """
+    读取 profile
+
+    Raises:
+        ValueError: profile 不存在或格式错误
+    """
+    path = profile_path(config_dir)
+    try:
+        return toml.load(path)
+    except (OSError, toml.TomlDecodeError) as e:
+        raise ValueError(f"无法读取 {path}: {e}")
+
+
+def apply_choice(choice, config_dir=CONFIG_DIR):
+    """把选择写入 profile 的 instance_options"""
+    profile = read_profile(config_dir)
+    profile.setdefault('instance_options', {}).update(choice)
+    with open(profile_path(config_dir), 'w') as f:
+        toml.dump(profile, f)
+
+
+def run(config_dir=CONFIG_DIR, frames=DEFAULT_FRAMES, taps=DEFAULT_TAPS, dry_run=False, path=STATE_FILE):
+    """测量、保存并写入 profile"""
+    profile = read_profile(config_dir)
+    device = profile.get('connection', {}).get('address', DEFAULT_DEVICE)
+    results = benchmark(device, frames, taps)
+    choice = choose(results, profile.get('instance_options', {}))
+    print_results(results, choice)
+    if dry_run:
+        return choice
+    state = load_state(path)
+    state.update(results=results, choice=choice, measured_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+    save_state(state, path)
+    apply_choice(choice, config_dir)
+    return choice
+
+
+def ensure(config_dir=CONFIG_DIR, path=STATE_FILE):
+    """
+    镜像没有变化时直接应用保存的选择，否则重新测量（run.py 调用）
+
+    测量失败只打印警告，profile 保持不变
+    """
+    try:
+        profile = read_profile(config_dir)
+        device = profile.get('connection', {}).get('address', DEFAULT_DEVICE)
+        state = load_state(path)
+        saved = state.get('results', {}).get('fingerprint')
+        if saved and saved == device_fingerprint(device):
+            apply_choice(state['choice'], config_dir)
+            print(f"🔌 连接设置（{state['measured_at']} 测量）：touch_mode = {state['choice']['touch_mode']}，"
+                  f"adb_lite_enabled = {str(state['choice']['adb_lite_enabled']).lower()}")
+            return state['choice']
+        print("🔌 容器镜像有变化（或尚未测量），测量截图和点击方式...")
+        return run(config_dir, path=path)
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"⚠️  连接测速失败，使用 profile 中的设置: {e}")
+        return None
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="连接与截图方式测速")
+    parser.add_argument('--state', default=STATE_FILE, help='状态文件')
+    parser.add_argument('--config-dir', default=CONFIG_DIR, help='MAA 配置目录')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_run = sub.add_parser('run', help='测量并写入 profile')
+    p_run.add_argument('--frames', type=int, default=DEFAULT_FRAMES, help='每种截图方式的采样帧数')
+    p_run.add_argument('--taps', type=int, default=DEFAULT_TAPS, help='每种点击方式的采样次数')
+    p_run.add_argument('--dry-run', action='store_true', help='只测量，不保存、不写入 profile')
+
+    sub.add_parser('auto', help='镜像变化时测量，否则应用保存的结果')
+    sub.add_parser('show', help='显示保存的测量结果')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'run':
+            run(args.config_dir, args.frames, args.taps, args.dry_run, args.state)
+        elif args.command == 'auto':
+            if ensure(args.config_dir, args.state) is None:
+                sys.exit(1)
+        elif args.command == 'show':
+            state = load_state(args.state)
+            if not state.get('results'):
+                print("ℹ️  尚未测量")
+            else:
+                print(f"🕐 {state['measured_at']} 测量")
+                print_results(state['results'], state['choice'])
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,10 +17,12 @@ import sys
 import os
 
 from maa_utils import mark_fix_done, clear_fix_flag
+import maa_trace
 
 # 游戏包名
 GAME_PACKAGE = "com.hypergryph.arknights"
-ADB_DEVICE = "127.0.0.1:5555"
+# 多实例模式下由 multi_instance.py 设置
+ADB_DEVICE = os.getenv("ADB_DEVICE", "127.0.0.1:5555")
 
 # 等待时间（秒）- 1小时
 WAIT_TIME = 3600
@@ -39,9 +41,12 @@ def run_adb_command(cmd):
 def connect_adb():
     """连接 ADB"""
     print("🔌 连接 ADB...")
-    # 先 kill-server 再连接
-    subprocess.run("adb kill-server", shell=True, capture_output=True)
-    success, stdout, stderr = run_adb_command("connect 127.0.0.1:5555")
+    # 先 kill-server 再连接（多实例共用 adb server，只断开自己的设备）
+    if os.getenv("MAA_INSTANCE"):
+        subprocess.run(f"adb disconnect {ADB_DEVICE}", shell=True, capture_output=True)
+    else:
+        subprocess.run("adb kill-server", shell=True, capture_output=True)
+    success, stdout, stderr = run_adb_command(f"connect {ADB_DEVICE}")
     if success:
         print("✅ ADB 连接成功")
         return True
@@ -130,7 +135,8 @@ def main():
     print()
     
     # 步骤3: 等待1小时
-    wait_for_update()
+    with maa_trace.span('wait for game update', 'fix_game_update', seconds=WAIT_TIME):
+        wait_for_update()
     
     print()
     
@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GitHub Releases 客户端
+
+替代脚本里反复调用的 gh 命令：
+- 分页列出所有 Release，每次运行只请求一次
+- 并发上传分卷，每个文件单独重试，内容相同的文件自动跳过（断点续传）
+- 并发删除旧 Release 和残留 tag
+
+API 地址取自 GITHUB_API_URL（默认 https://api.github.com），
+可以指向本地的 REST API 桩服务进行测试
+
+环境变量：
+    GH_TOKEN / GITHUB_TOKEN: 访问令牌
+    GITHUB_REPOSITORY: 仓库（owner/repo），未设置时从 git remote 推断
+    GITHUB_API_URL: API 地址
+
+用法：
+    python3 github_releases.py list --prefix snapshot
+    python3 github_releases.py latest --prefix snapshot
+    python3 github_releases.py upload <tag> <files...> --title ... --notes ...
+    python3 github_releases.py cleanup --prefix snapshot --keep 2 --verbose
+"""
+import argparse
+import hashlib
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+
+DEFAULT_API_URL = 'https://api.github.com'
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 3
+DOWNLOAD_CHUNK = 4 * 1024 * 1024
+
+
+class GitHubError(RuntimeError):
+    """GitHub API 请求失败"""
+
+
+def detect_repo():
+    """
+    获取当前仓库（owner/repo）
+
+    优先使用 GITHUB_REPOSITORY，否则解析 git remote origin 的地址
+    """
+    repo = os.getenv('GITHUB_REPOSITORY')
+    if repo:
+        return repo
+    try:
+        url = subprocess.run(['git', 'remote', 'get-url', 'origin'],
+                             capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    match = re.search(r'[:/]([^/:]+/[^/]+?)(?:\.git)?$', url)
+    return match.group(1) if match else None
+
+
+class _ChunkReader:
+    """按块读取文件的可迭代对象，避免把整个分卷读进内存"""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(DOWNLOAD_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+
+    def __len__(self):
+        return self.size
+
+
+def _file_digest(path):
+    """文件的 SHA-256，格式与 GitHub 文件信息中的 digest 一致（sha256:...）"""
+    digest = hashlib.sha256()
+    for chunk in _ChunkReader(path):
+        digest.update(chunk)
+    return 'sha256:' + digest.hexdigest()
+
+
+class ReleasesClient:
+    """GitHub Releases REST API 客户端"""
+
+    def __init__(self, repo=None, token=None, api_url=None, workers=DEFAULT_WORKERS,
+                 retries=DEFAULT_RETRIES, session=None):
+        """
+        Args:
+            repo: 仓库（owner/repo），默认自动检测
+            token: 访问令牌，默认读取 GH_TOKEN / GITHUB_TOKEN
+            api_url: API 地址，默认读取 GITHUB_API_URL
+            workers: 并发上传/删除的线程数
+            retries: 单个请求的最大尝试次数
+            session: 可选的 requests.Session
+        """
+        self.repo = repo or detect_repo()
+        if not self.repo:
+            raise GitHubError("无法确定仓库，请设置 GITHUB_REPOSITORY")
+        self.api_url = (api_url or os.getenv('GITHUB_API_URL') or DEFAULT_API_URL).rstrip('/')
+        self.workers = workers
+        self.retries = retries
+        self.session = session or requests.Session()
+        token = token or os.getenv('GH_TOKEN') or os.getenv('GITHUB_TOKEN')
+        self.session.headers.update({
+            'Accept': 'application/vnd.github+json',
+            'X-GitHub-Api-Version': '2022-11-28',
+        })
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+        self._releases = None
+
+    # ==================== 基础请求 ====================
+    def _url(self, path):
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.api_url}/repos/{self.repo}/{path.lstrip('/')}"
+
+    def request(self, method, path, expected=(200,), **kwargs):
+        """
+        发送请求，网络错误和 5xx 时重试
+
+        Args:
+            method: HTTP 方法
+            path: 相对仓库的路径或完整 URL
+            expected: 视为成功的状态码
+
+        Returns:
+            requests.Response
+
+        Raises:
+            GitHubError: 重试后仍然失败
+        """
+        last_error = None
+        timeout = kwargs.pop('timeout', 60)
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self.session.request(method, self._url(path), timeout=timeout, **kwargs)
+            except requests.RequestException as e:
+                last_error = str(e)
+            else:
+                if response.status_code in expected:
+                    return response
+                last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code < 500 and response.status_code != 429:
+                    break
+            if attempt < self.retries:
+                time.sleep(2 ** attempt)
+        raise GitHubError(f"{method} {path} 失败: {last_error}")
+
+    def paginate(self, path, params=None):
+        """
+        遍历分页结果（按 Link 头的 next 翻页）
+
+        Yields:
+            dict: 每一条记录
+        """
+        params = dict(params or {}, per_page=100)
+        url = path
+        while url:
+            response = self.request('GET', url, params=params)
+            yield from response.json()
+            url = response.links.get('next', {}).get('url')
+            params = None  # next 链接中已经带了参数
+
+    # ==================== Release ====================
+    def list_releases(self, refresh=False):
+        """
+        列出所有 Release（新的在前），结果在实例内缓存
+
+        Returns:
+            list: Release 列表
+        """
+        if self._releases is None or refresh:
+            releases = list(self.paginate('releases'))
+            releases.sort(key=lambda r: r.get('created_at') or '', reverse=True)
+            self._releases = releases
+        return self._releases
+
+    def snapshot_releases(self, prefix='snapshot', include_drafts=False):
+        """
+        列出 tag 以 <prefix>- 开头的 Release（新的在前）
+
+        Args:
+            prefix: tag 前缀
+            include_drafts: 是否包含草稿（未上传完成的 Release）
+        """
+        return [
+            r for r in self.list_releases()
+            if r['tag_name'].startswith(f'{prefix}-') and (include_drafts or not r.get('draft'))
+        ]
+
+    def get_release(self, tag):
+        """按 tag 查找 Release（包括草稿），不存在返回 None"""
+        for release in self.list_releases():
+            if release['tag_name'] == tag:
+                return release
+        return None
+
+    def create_release(self, tag, name, body='', draft=False):
+        """创建 Release"""
+        response = self.request('POST', 'releases', expected=(201,), json={
+            'tag_name': tag, 'name': name, 'body': body, 'draft': draft,
+        })
+        release = response.json()
+        if self._releases is not None:
+            self._releases.insert(0, release)
+        return release
+
+    def start_release(self, tag, name, body=''):
+        """
+        准备上传用的草稿 Release
+
+        同名 Release 已发布时先删除；同名草稿（上次上传中断）直接复用，内容相同（SHA-256 一致）的文件会被跳过
+
+        Returns:
+            dict: 草稿 Release
+        """
+        release = self.get_release(tag)
+        if release is not None and not release.get('draft'):
+            print(f"⚠️  Release {tag} 已存在，将删除后重新创建", file=sys.stderr)
+            self.delete_release(release)
+            release = None
+        if release is None:
+            release = self.create_release(tag, name, body, draft=True)
+        return release
+
+    def publish_release(self, release, **fields):
+        """发布草稿 Release（此时才会创建 tag）"""
+        return self.update_release(release, draft=False, tag_name=release['tag_name'], **fields)
+
+    def update_release(self, release, **fields):
+        """更新 Release（如 draft=False 发布草稿）"""
+        return self.request('PATCH', f"releases/{release['id']}", json=fields).json()
+
+    def delete_release(self, release, cleanup_tag=True):
+        """
+        删除 Release，可选同时删除 tag
+
+        Raises:
+            GitHubError: 删除失败
+        """
+        self.request('DELETE', f"releases/{release['id']}", expected=(204, 404))
+        if cleanup_tag and not release.get('draft'):
+            self.delete_tag(release['tag_name'])
+        if self._releases is not None:
+            self._releases = [r for r in self._releases if r['id'] != release['id']]
+
+    # ==================== 文件 ====================
+    def list_assets(self, release):
+        """列出 Release 中的文件"""
+        return list(self.paginate(f"releases/{release['id']}/assets"))
+
+    def upload_asset(self, release, path, existing=None):
+        """
+        上传单个文件（失败重试；已存在且内容一致时跳过；不完整或内容不同的旧文件先删除）
+
+        分卷加密后大小都相同，只比较大小会把重新加密的分卷误判为已上传，
+        因此按 GitHub 返回的 digest 比较内容；没有 digest 时一律重新上传
+
+        Args:
+            release: Release
+            path: 本地文件路径
+            existing: 可选，Release 中已有文件的 {name: asset} 映射
+
+        Returns:
+            dict: 文件信息
+        """
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        asset = (existing or {}).get(name)
+        if asset is not None:
+            if (asset.get('state') == 'uploaded' and asset.get('size') == size
+                    and asset.get('digest') and asset['digest'] == _file_digest(path)):
+                return asset
+            self.request('DELETE', f"releases/assets/{asset['id']}", expected=(204, 404))
+
+        upload_url = release['upload_url'].split('{')[0]
+        last_error = None
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self.session.post(
+                    upload_url, params={'name': name}, data=_ChunkReader(path),
+                    headers={'Content-Type': 'application/octet-stream', 'Content-Length': str(size)},
+                    timeout=3600,
+                )
+            except requests.RequestException as e:
+                last_error = str(e)
+            else:
+                if response.status_code == 201:
+                    return response.json()
+                last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+            # 失败的上传可能留下不完整的文件，删除后重试
+            for asset in self.list_assets(release):
+                if asset['name'] == name:
+                    self.request('DELETE', f"releases/assets/{asset['id']}", expected=(204, 404))
+            if attempt < self.retries:
+                print(f"⚠️  {name} 上传失败（第 {attempt}/{self.retries} 次）: {last_error}", file=sys.stderr)
+                time.sleep(2 ** attempt)
+        raise GitHubError(f"{name} 上传失败: {last_error}")
+
+    def upload_assets(self, release, paths):
+        """
+        并发上传多个文件
+
+        Returns:
+            list: 上传失败的 (文件, 错误) 列表
+        """
+        existing = {a['name']: a for a in self.list_assets(release)}
+        failures = []
+
+        def upload(path):
+            start = time.time()
+            self.upload_asset(release, path, existing)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            print(f"✅ {os.path.basename(path)} ({size_mb:.0f} MB, {time.time() - start:.0f}s)", file=sys.stderr)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(upload, path): path for path in paths}
+            for future, path in futures.items():
+                try:
+                    future.result()
+                except GitHubError as e:
+                    failures.append((path, str(e)))
+        return failures
+
+    def download_asset(self, asset, directory='.'):
+        """
+        下载文件，下载过程中断开或大小不符时重新下载整个文件
+
+        Returns:
+            str: 本地路径
+
+        Raises:
+            GitHubError: 重试后仍然失败
+        """
+        path = os.path.join(directory, asset['name'])
+        last_error = None
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self.request('GET', asset['url'], headers={'Accept': 'application/octet-stream'},
+                                        stream=True, timeout=3600)
+                with open(path, 'wb') as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                        f.write(chunk)
+                    written = f.tell()
+                # Content-Length 是压缩后的大小时无法比较
+                expected = response.headers.get('Content-Length')
+                if expected is None or 'Content-Encoding' in response.headers or int(expected) == written:
+                    return path
+                last_error = f"文件不完整（{written}/{expected} 字节）"
+            except requests.RequestException as e:
+                last_error = str(e)
+            if attempt < self.retries:
+                print(f"⚠️  {asset['name']} 下载中断（第 {attempt}/{self.retries} 次）: {last_error}", file=sys.stderr)
+                time.sleep(2 ** attempt)
+        raise GitHubError(f"下载 {asset['name']} 失败: {last_error}")
+
+    def download_assets(self, release, names, directory='.'):
+        """
+        并发下载多个文件
+
+        Returns:
+            list: 下载失败的 (文件名, 错误) 列表
+        """
+        by_name = {a['name']: a for a in self.list_assets(release)}
+        missing = [(name, 'Release 中没有该文件') for name in names if name not in by_name]
+
+        def download(name):
+            path = self.download_asset(by_name[name], directory)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            print(f"✅ {name} ({size_mb:.0f} MB)", file=sys.stderr)
+
+        return missing + self._parallel(download, [name for name in names if name in by_name])
+
+    # ==================== Tag ====================
+    def list_tags(self, prefix):
+        """列出以 prefix 开头的 tag 名"""
+        response = self.request('GET', f"git/matching-refs/tags/{quote(prefix)}")
+        return [ref['ref'][len('refs/tags/'):] for ref in response.json()]
+
+    def delete_tag(self, tag):
+        """删除 tag（不存在时忽略）"""
+        self.request('DELETE', f"git/refs/tags/{quote(tag)}", expected=(204, 404, 422))
+
+    # ==================== 批量操作 ====================
+    def _parallel(self, func, items):
+        """并发执行，返回失败的 (项, 错误) 列表"""
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(func, item): item for item in items}
+            for future, item in futures.items():
+                try:
+                    future.result()
+                except (GitHubError, OSError) as e:
+                    failures.append((item, str(e)))
+        return failures
+
+    def cleanup(self, prefix='snapshot', keep=2):
+        """
+        保留最近 keep 个 Release，并发删除其余的 Release（含 tag）、草稿和残留 tag
+
+        全部 Release 只分页获取一次，清理后剩余的 Release 取自同一份缓存
+
+        Returns:
+            dict: {'kept': [...], 'deleted': [...], 'orphaned_tags': [...], 'failures': [...],
+                   'remaining': [Release, ...]}
+
+        Raises:
+            GitHubError: 保留数量小于 1，或要删除的 Release 在保留列表中
+        """
+        # 安全检查：至少保留一个，避免误删全部 snapshot
+        if keep < 1:
+            raise GitHubError(f"保留数量必须至少为 1（当前 {keep}），中止清理")
+        published = self.snapshot_releases(prefix)
+        drafts = [r for r in self.snapshot_releases(prefix, include_drafts=True) if r.get('draft')]
+        kept = published[:keep]
+        old = published[keep:] + drafts
+
+        # 安全检查：要删除的 Release 不能在保留列表中
+        kept_ids = {r['id'] for r in kept}
+        kept_tags = {r['tag_name'] for r in kept}
+        if any(r['id'] in kept_ids or r['tag_name'] in kept_tags for r in old):
+            raise GitHubError("要删除的 Release 在保留列表中，中止清理")
+
+        failures = self._parallel(self.delete_release, old)
+        failed_tags = {item['tag_name'] for item, _ in failures}
+
+        release_tags = {r['tag_name'] for r in self.list_releases()}
+        orphaned = [t for t in self.list_tags(f'{prefix}-') if t not in release_tags and t not in failed_tags]
+        failures += self._parallel(self.delete_tag, orphaned)
+
+        return {
+            'kept': [r['tag_name'] for r in kept],
+            'deleted': [r['tag_name'] for r in old if r['tag_name'] not in failed_tags],
+            'orphaned_tags': orphaned,
+            'failures': [(item['tag_name'] if isinstance(item, dict) else item, error) for item, error in failures],
+            'remaining': self.snapshot_releases(prefix),
+        }
+
+
+def print_statistics(releases, keep):
+    """打印 Release 统计（创建时间和文件数）"""
+    print("ℹ️  ==========================================", file=sys.stderr)
+    print("ℹ️    Release 统计", file=sys.stderr)
+    print("ℹ️  ==========================================", file=sys.stderr)
+    print(f"ℹ️  总数：{len(releases)} 个", file=sys.stderr)
+    print(f"ℹ️  保留策略：最近 {keep} 个", file=sys.stderr)
+    if releases:
+        print("ℹ️  当前 Release：", file=sys.stderr)
+    for r in releases:
+        print(f"ℹ️    - {r['tag_name']} (创建于: {r.get('created_at') or 'Unknown'}, "
+              f"{len(r.get('assets', []))} files)", file=sys.stderr)
+    print("ℹ️  ==========================================", file=sys.stderr)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="GitHub Releases 客户端")
+    parser.add_argument('-j', '--workers', type=int, default=DEFAULT_WORKERS, help='并发数')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_list = sub.add_parser('list', help='列出 snapshot Release（新的在前）')
+    p_list.add_argument('--prefix', default='snapshot')
+    p_list.add_argument('-v', '--verbose', action='store_true', help='同时显示创建时间和文件数')
+
+    p_latest = sub.add_parser('latest', help='输出最新的 snapshot Release tag')
+    p_latest.add_argument('--prefix', default='snapshot')
+
+    p_assets = sub.add_parser('assets', help='列出 Release 中的文件名')
+    p_assets.add_argument('tag')
+
+    p_download = sub.add_parser('download', help='下载 Release 中的文件')
+    p_download.add_argument('tag')
+    p_download.add_argument('names', nargs='+')
+    p_download.add_argument('--dir', default='.')
+
+    p_upload = sub.add_parser('upload', help='创建 Release 并并发上传文件')
+    p_upload.add_argument('tag')
+    p_upload.add_argument('files', nargs='+')
+    p_upload.add_argument('--title', default=None)
+    p_upload.add_argument('--notes', default='')
+
+    p_cleanup = sub.add_parser('cleanup', help='清理旧 Release 和残留 tag')
+    p_cleanup.add_argument('--prefix', default='snapshot')
+    p_cleanup.add_argument('--keep', type=int, default=2)
+    p_cleanup.add_argument('-v', '--verbose', action='store_true', help='清理后显示剩余 Release 的统计')
+
+    args = parser.parse_args()
+
+    try:
+        client = ReleasesClient(workers=args.workers)
+
+        if args.command == 'list':
+            releases = client.snapshot_releases(args.prefix)
+            if not releases:
+                sys.exit(1)
+            for r in releases:
+                if args.verbose:
+                    print(f"{r['tag_name']}\t{r.get('created_at', '')}\t{len(r.get('assets', []))} files")
+                else:
+                    print(r['tag_name'])
+
+        elif args.command == 'latest':
+            releases = client.snapshot_releases(args.prefix)
+            if not releases:
+                print(f"❌ 未找到任何 {args.prefix} Release", file=sys.stderr)
+                sys.exit(1)
+            print(releases[0]['tag_name'])
+
+        elif args.command in ('assets', 'download'):
+            release = client.get_release(args.tag)
+            if release is None:
+                print(f"❌ 未找到 Release {args.tag}", file=sys.stderr)
+                sys.exit(1)
+            if args.command == 'assets':
+                for asset in client.list_assets(release):
+                    print(asset['name'])
+            else:
+                failures = client.download_assets(release, args.names, args.dir)
+                for name, error in failures:
+                    print(f"❌ {name} 下载失败: {error}", file=sys.stderr)
+                if failures:
+                    sys.exit(1)
+
+        elif args.command == 'upload':
+            # 先创建草稿，全部上传成功后再发布，避免恢复时读到不完整的 Release
+            release = client.start_release(args.tag, args.title or args.tag, args.notes)
+            failures = client.upload_assets(release, args.files)
+            if failures:
+                for path, error in failures:
+                    print(f"❌ {path}: {error}", file=sys.stderr)
+                sys.exit(1)
+            client.publish_release(release)
+            print(f"✅ 已发布 {args.tag}（{len(args.files)} 个文件）", file=sys.stderr)
+
+        elif args.command == 'cleanup':
+            result = client.cleanup(args.prefix, args.keep)
+            for tag in result['kept']:
+                print(f"ℹ️  保留：{tag}", file=sys.stderr)
+            for tag in result['deleted']:
+                print(f"✅ 已删除：{tag}", file=sys.stderr)
+            for tag in result['orphaned_tags']:
+                print(f"✅ 已删除残留 tag：{tag}", file=sys.stderr)
+            for item, error in result['failures']:
+                print(f"❌ 删除失败：{item}（{error}）", file=sys.stderr)
+            if args.verbose:
+                print_statistics(result['remaining'], args.keep)
+            if result['failures']:
+                sys.exit(1)
+
+    except GitHubError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+容器镜像增量导出/还原
+
+ark 镜像 = 公开的 redroid 基础镜像 + docker commit 产生的改动层。
+基础镜像每次都一样，没必要随快照一起上传，这里只保存改动层：
+
+    split：读取 docker save ark 的输出，丢掉基础镜像已有的层，
+           生成 ark.delta.tar（delta.json + config.json + layers/<diff_id>.tar）
+    merge：读取 ark.delta.tar 和 docker save <基础镜像> 的输出，
+           拼出完整的镜像 tar，直接送给 docker load
+
+层通过 diff_id（未压缩层 tar 的 SHA-256）识别，兼容旧版和 OCI 两种 docker save 格式
+
+用法：
+    docker save ark | python3 image_delta.py split --base redroid/redroid:11.0.0-latest -o ark.delta.tar
+    python3 image_delta.py merge ark.delta.tar | docker load
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import posixpath
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+DEFAULT_BASE_IMAGE = 'redroid/redroid:11.0.0-latest'
+DELTA_FORMAT = 'maa-image-delta-v1'
+DELTA_FILE = 'ark.delta.tar'
+IMAGE_TAG = 'ark:latest'
+# 小于该大小的文件（JSON 元数据、很小的层）直接放内存
+SMALL_FILE = 1024 * 1024
+COPY_BUFSIZE = 4 * 1024 * 1024
+
+
+def image_diff_ids(image):
+    """
+    获取本地镜像的层 diff_id 列表
+
+    Args:
+        image: 镜像名
+
+    Returns:
+        list: diff_id 列表（如 'sha256:...'），镜像不存在时返回 None
+    """
+    result = subprocess.run(
+        ['docker', 'image', 'inspect', image, '--format', '{{json .RootFS.Layers}}'],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout)
+
+
+def ensure_base_image(image):
+    """确保基础镜像在本地（不存在时 docker pull）"""
+    if image_diff_ids(image) is not None:
+        return
+    print(f"📥 拉取基础镜像 {image}...", file=sys.stderr)
+    subprocess.run(['docker', 'pull', image], check=True, stdout=subprocess.DEVNULL)
+
+
+def _copy_and_hash(src, dst):
+    """复制数据并计算 SHA-256"""
+    digest = hashlib.sha256()
+    while True:
+        chunk = src.read(COPY_BUFSIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        dst.write(chunk)
+    return 'sha256:' + digest.hexdigest()
+
+
+def _add_bytes(archive, name, data):
+    """向 tar 中添加内存中的文件"""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644
+    archive.addfile(info, io.BytesIO(data))
+
+
+def _resolve(name, links):
+    """解析 docker save 中的符号链接（旧格式用符号链接去重相同的层）"""
+    seen = set()
+    while name in links and name not in seen:
+        seen.add(name)
+        name = posixpath.normpath(posixpath.join(posixpath.dirname(name), links[name]))
+    return name
+
+
+def split_image(src, base_diff_ids, output, base_image=DEFAULT_BASE_IMAGE):
+    """
+    从 docker save 流中提取增量层
+
+    大文件边读边算哈希并暂存到临时目录，属于基础镜像的层立即删除，
+    所以磁盘上只会保留改动层
+
+    Args:
+        src: docker save 的输出流
+        base_diff_ids: 基础镜像的 diff_id 列表
+        output: 输出文件路径
+        base_image: 基础镜像名（写入 delta.json）
+
+    Returns:
+        dict: delta.json 的内容
+
+    Raises:
+        ValueError: 镜像不是基于该基础镜像构建的
+    """
+    base_set = set(base_diff_ids)
+    small = {}
+    spooled = {}
+    hashes = {}
+    links = {}
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as tmp:
+        with tarfile.open(fileobj=src, mode='r|') as archive:
+            for member in archive:
+                if member.issym():
+                    links[member.name] = member.linkname
+                    continue
+                if not member.isfile():
+                    continue
+                f = archive.extractfile(member)
+                if member.size <= SMALL_FILE:
+                    small[member.name] = f.read()
+                    continue
+                path = os.path.join(tmp, str(len(spooled)))
+                with open(path, 'wb') as out:
+                    diff_id = _copy_and_hash(f, out)
+                hashes[member.name] = diff_id
+                if diff_id in base_set:
+                    os.remove(path)
+                else:
+                    spooled[member.name] = path
+
+        if 'manifest.json' not in small:
+            raise ValueError("docker save 输出中没有 manifest.json")
+        image_manifest = json.loads(small['manifest.json'])[0]
+        config_data = small[_resolve(image_manifest['Config'], links)]
+        diff_ids = json.loads(config_data)['rootfs']['diff_ids']
+
+        if diff_ids[:len(base_diff_ids)] != list(base_diff_ids):
+            raise ValueError(f"镜像不是基于 {base_image} 构建的，无法增量导出")
+
+        delta_layers = []
+        layer_files = image_manifest['Layers'][len(base_diff_ids):]
+        for diff_id, layer_file in zip(diff_ids[len(base_diff_ids):], layer_files):
+            name = _resolve(layer_file, links)
+            if name in small:
+                actual = 'sha256:' + hashlib.sha256(small[name]).hexdigest()
+            else:
+                actual = hashes.get(name)
+            if actual != diff_id:
+                raise ValueError(f"层 {layer_file} 的哈希与配置不一致")
+            delta_layers.append({'diff_id': diff_id, 'file': name})
+
+        delta = {
+            'format': DELTA_FORMAT,
+            'base_image': base_image,
+            'base_diff_ids': list(base_diff_ids),
+            'repo_tags': image_manifest.get('RepoTags') or [IMAGE_TAG],
+            'layers': [layer['diff_id'] for layer in delta_layers],
+        }
+
+        with tarfile.open(output, 'w') as out:
+            _add_bytes(out, 'delta.json', json.dumps(delta, indent=1).encode('utf-8'))
+            _add_bytes(out, 'config.json', config_data)
+            written = set()
+            for layer in delta_layers:
+                if layer['diff_id'] in written:
+                    continue
+                written.add(layer['diff_id'])
+                arcname = f"layers/{layer['diff_id'].split(':')[1]}.tar"
+                if layer['file'] in small:
+                    _add_bytes(out, arcname, small[layer['file']])
+                else:
+                    out.add(spooled[layer['file']], arcname)
+    return delta
+
+
+def merge_image(delta_stream, out, base_save=None):
+    """
+    增量层 + 基础镜像 → 完整镜像 tar（docker load 格式）
+
+    基础镜像的内容原样放在 base/ 目录下，增量层放在 layers/ 下，
+    最后写入新的 manifest.json，全程流式处理
+
+    Args:
+        delta_stream: ark.delta.tar 的输入流
+        out: 输出流（docker load 的 stdin）
+        base_save: 可选，返回基础镜像 docker save 流的函数 base_save(image)，默认调用 docker save
+
+    Returns:
+        dict: delta.json 的内容
+
+    Raises:
+        ValueError: 基础镜像的层与增量记录的不一致
+    """
+    process = None
+    with tarfile.open(fileobj=delta_stream, mode='r|') as delta_archive, \
+            tarfile.open(fileobj=out, mode='w|') as output:
+        members = iter(delta_archive)
+        delta = None
+        config_data = None
+        for member in members:
+            data = delta_archive.extractfile(member).read()
+            if member.name == 'delta.json':
+                delta = json.loads(data)
+            elif member.name == 'config.json':
+                config_data = data
+            if delta is not None and config_data is not None:
+                break
+        if delta is None or delta.get('format') != DELTA_FORMAT:
+            raise ValueError("不是有效的增量镜像文件")
+
+        if base_save is None:
+            ensure_base_image(delta['base_image'])
+            process = subprocess.Popen(['docker', 'save', delta['base_image']], stdout=subprocess.PIPE)
+            base_stream = process.stdout
+        else:
+            base_stream = base_save(delta['base_image'])
+
+        # 1. 基础镜像：原样复制到 base/ 下
+        small = {}
+        with tarfile.open(fileobj=base_stream, mode='r|') as base_archive:
+            for member in base_archive:
+                if member.isfile() and member.size <= SMALL_FILE:
+                    data = base_archive.extractfile(member).read()
+                    small[member.name] = data
+                    member.name = 'base/' + member.name
+                    output.addfile(member, io.BytesIO(data))
+                else:
+                    f = base_archive.extractfile(member) if member.isfile() else None
+                    member.name = 'base/' + member.name
+                    output.addfile(member, f)
+        if process is not None and process.wait() != 0:
+            raise RuntimeError(f"docker save {delta['base_image']} 失败")
+
+        base_manifest = json.loads(small['manifest.json'])[0]
+        base_config = json.loads(small[_resolve(base_manifest['Config'], {})])
+        if base_config['rootfs']['diff_ids'] != delta['base_diff_ids']:
+            raise ValueError(f"本地的 {delta['base_image']} 与快照使用的基础镜像不一致")
+
+        # 2. 增量层
+        for member in members:
+            if member.isfile():
+                output.addfile(member, delta_archive.extractfile(member))
+
+        # 3. 配置和 manifest
+        _add_bytes(output, 'config.json', config_data)
+        layers = ['base/' + path for path in base_manifest['Layers']]
+        layers += [f"layers/{diff_id.split(':')[1]}.tar" for diff_id in delta['layers']]
+        manifest = [{'Config': 'config.json', 'RepoTags': delta['repo_tags'], 'Layers': layers}]
+        _add_bytes(output, 'manifest.json', json.dumps(manifest).encode('utf-8'))
+    return delta
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="容器镜像增量导出/还原")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_split = sub.add_parser('split', help='从 docker save 输出（stdin）中提取增量层')
+    p_split.add_argument('--base', default=DEFAULT_BASE_IMAGE, help='基础镜像')
+    p_split.add_argument('-o', '--output', default=DELTA_FILE, help='输出文件')
+
+    p_merge = sub.add_parser('merge', help='增量层 + 基础镜像 → 完整镜像 tar（stdout）')
+    p_merge.add_argument('delta', nargs='?', default=DELTA_FILE, help='增量文件（- 表示 stdin）')
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'split':
+            base_diff_ids = image_diff_ids(args.base)
+            if base_diff_ids is None:
+                raise ValueError(f"本地没有基础镜像 {args.base}")
+            delta = split_image(sys.stdin.buffer, base_diff_ids, args.output, args.base)
+            print(f"✅ 增量导出完成：{len(delta['layers'])} 个改动层"
+                  f"（跳过 {len(base_diff_ids)} 个基础层）", file=sys.stderr)
+        elif args.command == 'merge':
+            if args.delta == '-':
+                delta = merge_image(sys.stdin.buffer, sys.stdout.buffer)
+            else:
+                with open(args.delta, 'rb') as f:
+                    delta = merge_image(f, sys.stdout.buffer)
+            print(f"✅ 已合并基础镜像 {delta['base_image']} 和 {len(delta['layers'])} 个改动层", file=sys.stderr)
+    except (ValueError, RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
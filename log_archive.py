@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MAA 日志归档与查询
+
+asst.log 以 TRACE 为主，动辄几十上百 MB。归档把日志切成独立压缩的小块，
+另存一个 JSON 索引（每块的偏移、行号范围、时间范围、各级别行数，以及每个任务的行号范围），
+查询时只解压需要的块：
+    所有 ERROR 行        → 只解压含 ERROR 的块
+    某个任务的日志       → 只解压该任务行号范围覆盖的块
+    卡住前 30 秒的日志   → 只解压时间范围重叠的块
+
+run.py 运行时边接收边写入归档，每行记录接收时间（日志行本身不带时间），
+也可以用 build 子命令从已有的 asst.log 生成（没有时间信息）
+
+文件：
+    asst.log.blocks       压缩块依次拼接；每块解压后为 行数×4 字节时间（毫秒，相对开始时间）+ UTF-8 文本
+    asst.log.index.json   索引
+
+用法：
+    python3 log_archive.py build asst.log
+    python3 log_archive.py info
+    python3 log_archive.py query --level ERROR
+    python3 log_archive.py query --task Fight          # 所有 Fight 任务（Fight:2 = 第二次）
+    python3 log_archive.py query --last 30             # 日志结束（卡住）前 30 秒
+    python3 log_archive.py query --at 05:12:00 --before 60 --after 10
+"""
+import argparse
+import collections
+import datetime
+import io
+import json
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from maa_utils import parse_task_event
+
+# zstd 为可选依赖，未安装时使用 zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_ARCHIVE = 'asst.log.blocks'
+INDEX_SUFFIX = '.index.json'
+INDEX_VERSION = 1
+# 每块的原始大小上限：块越小，查询时多解压的数据越少
+DEFAULT_BLOCK_SIZE = 256 * 1024
+LEVELS = ('TRACE', 'DEBUG', 'INFO', 'WARN', 'ERROR')
+# 日志级别在第一个方括号里，如 "[INFO ] ..." 或 "[2024-01-01 12:00:00 INFO ] ..."
+LEVEL_PATTERN = re.compile(r'^\[(?:[^\]]*\s)?(TRACE|DEBUG|INFO|WARN|ERROR)\s*\]')
+NO_TIME = 0xFFFFFFFF
+
+
+def index_path(archive):
+    """归档对应的索引文件路径（asst.log.blocks → asst.log.index.json）"""
+    if archive.endswith('.blocks'):
+        archive = archive[:-len('.blocks')]
+    return archive + INDEX_SUFFIX
+
+
+def line_level(line, previous='INFO'):
+    """
+    日志行的级别（多行日志的后续行沿用上一行的级别）
+
+    Returns:
+        str: 级别
+    """
+    match = LEVEL_PATTERN.match(line)
+    return match.group(1) if match else previous
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("归档使用 zstd 压缩，需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class ArchiveWriter:
+    """边接收边写入的日志归档"""
+
+    def __init__(self, path=DEFAULT_ARCHIVE, block_size=DEFAULT_BLOCK_SIZE, start_time=None):
+        """
+        Args:
+            path: 归档文件路径（索引为 <路径去掉 .blocks>.index.json）
+            block_size: 每块的原始大小上限（字节）
+            start_time: 时间基准（UNIX 秒），None 表示不记录时间
+        """
+        self.path = path
+        self.block_size = block_size
+        self.start_time = start_time
+        self.codec = 'zstd' if zstandard is not None else 'zlib'
+        self.file = open(path, 'wb')
+        self.blocks = []
+        self.tasks = []
+        self.open_tasks = {}
+        self.task_counts = {}
+        self.line_count = 0
+        self.level = 'INFO'
+        self._reset_block()
+
+    def _reset_block(self):
+        self.pending = []
+        self.pending_times = []
+        self.pending_size = 0
+        self.pending_levels = {}
+        # 块首行之前生效的级别：块首的续行沿用它，读取时据此还原
+        self.pending_start_level = self.level
+
+    def add(self, line, timestamp=None, event=None):
+        """
+        追加一行
+
+        Args:
+            line: 日志行（含换行符）
+            timestamp: 接收时间（UNIX 秒）
+            event: 该行的 parse_task_event 结果（调用方通常已经解析过，避免重复匹配）
+        """
+        self.level = line_level(line, self.level)
+        self.pending_levels[self.level] = self.pending_levels.get(self.level, 0) + 1
+        if self.start_time is not None and timestamp is not None:
+            self.pending_times.append(min(int((timestamp - self.start_time) * 1000), NO_TIME - 1))
+        else:
+            self.pending_times.append(NO_TIME)
+
+        if event:
+            task, result = event
+            if result == 'Start':
+                self.task_counts[task] = self.task_counts.get(task, 0) + 1
+                self.open_tasks[task] = {'task': task, 'occurrence': self.task_counts[task],
+                                         'first_line': self.line_count, 'last_line': None, 'result': None}
+                self.tasks.append(self.open_tasks[task])
+            elif task in self.open_tasks:
+                entry = self.open_tasks.pop(task)
+                entry.update(last_line=self.line_count, result=result)
+
+        encoded = line.encode('utf-8', errors='replace')
+        self.pending.append(encoded)
+        self.pending_size += len(encoded)
+        self.line_count += 1
+        if self.pending_size >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """把当前块压缩写入文件"""
+        if not self.pending:
+            return
+        times = struct.pack(f'<{len(self.pending_times)}I', *self.pending_times)
+        data = _compress(times + b''.join(self.pending), self.codec)
+        known = [t for t in self.pending_times if t != NO_TIME]
+        self.blocks.append({
+            'offset': self.file.tell(),
+            'length': len(data),
+            'first_line': self.line_count - len(self.pending),
+            'lines': len(self.pending),
+            'raw_size': self.pending_size,
+            # 飞行记录器补写的 TRACE 行时间早于前面的行，块的时间范围取最小/最大值
+            't0': min(known) / 1000 if known else None,
+            't1': max(known) / 1000 if known else None,
+            'levels': self.pending_levels,
+            'start_level': self.pending_start_level,
+        })
+        self.file.write(data)
+        self.file.flush()
+        self._reset_block()
+
+    def close(self):
+        """写入最后一块和索引"""
+        self.flush()
+        self.file.close()
+        index = {
+            'version': INDEX_VERSION,
+            'codec': self.codec,
+            'start_time': self.start_time,
+            'lines': self.line_count,
+            'raw_size': sum(block['raw_size'] for block in self.blocks),
+            'blocks': self.blocks,
+            'tasks': self.tasks,
+        }
+        with open(index_path(self.path), 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+
+
+class FlightRecorder:
+    """
+    飞行记录器：TRACE 行先放进固定大小的环形缓冲区，只在出事时落盘
+
+    DEBUG 及以上级别的行总是直接写入；遇到 ERROR 行、任务失败或卡住时，
+    先补写缓冲区中的 TRACE（事发前的窗口），之后再直接写入一段 TRACE（事发后的窗口）。
+    补写的行前后各有一行 "[FLIGHT]" 标记，行的接收时间不变
+    """
+
+    def __init__(self, write, buffer_bytes, after_bytes):
+        """
+        Args:
+            write: 落盘函数 write(line, timestamp, event)
+            buffer_bytes: 环形缓冲区大小（字节）
+            after_bytes: 事发后直接写入的 TRACE 字节数
+        """
+        self.write = write
+        self.buffer_bytes = buffer_bytes
+        self.after_bytes = after_bytes
+        self.buffer = collections.deque()
+        self.buffered = 0
+        self.after_left = 0
+        self.level = 'INFO'
+        self.lock = threading.Lock()
+        self.trace_lines = 0
+        self.trace_bytes = 0
+        self.kept_lines = 0
+        self.incidents = []
+
+    def add(self, line, timestamp=None, event=None):
+        """接收一行"""
+        with self.lock:
+            self.level = line_level(line, self.level)
+            if self.level != 'TRACE':
+                # 事发前的 TRACE 写在触发的行之前，asst.log 中的顺序与接收顺序一致
+                if self.level == 'ERROR' and LEVEL_PATTERN.match(line):
+                    self._incident(line.strip(), timestamp, (line, event))
+                elif event and event[1] == 'Error':
+                    self._incident(f"{event[0]} Error", timestamp, (line, event))
+                else:
+                    self.write(line, timestamp, event)
+                return
+
+            self.trace_lines += 1
+            self.trace_bytes += len(line)
+            if self.after_left > 0:
+                self.after_left -= len(line)
+                self.kept_lines += 1
+                self.write(line, timestamp, None)
+                if self.after_left <= 0:
+                    self.write("[FLIGHT] ---- 事发后窗口结束 ----\n", timestamp, None)
+                return
+            self.buffer.append((line, timestamp))
+            self.buffered += len(line)
+            while self.buffered > self.buffer_bytes:
+                dropped, _ = self.buffer.popleft()
+                self.buffered -= len(dropped)
+
+    def incident(self, reason, timestamp=None):
+        """外部检测到的事件（如卡住超时）：补写事发前的 TRACE"""
+        with self.lock:
+            self._incident(reason, timestamp)
+
+    def _incident(self, reason, timestamp, trigger=None):
+        """补写事发前的窗口，再写入触发的行 trigger=(行, 任务事件)，然后开始事发后的窗口"""
+        self.incidents.append(reason)
+        if self.buffer:
+            self.write(f"[FLIGHT] ---- {reason}：事发前的 {len(self.buffer)} 行 TRACE ----\n", timestamp, None)
+            for line, line_time in self.buffer:
+                self.write(line, line_time, None)
+            self.kept_lines += len(self.buffer)
+            self.buffer.clear()
+            self.buffered = 0
+        if trigger:
+            self.write(trigger[0], timestamp, trigger[1])
+        if self.after_left <= 0 and self.after_bytes > 0:
+            self.write(f"[FLIGHT] ---- {reason}：事发后的 TRACE ----\n", timestamp, None)
+        self.after_left = self.after_bytes
+
+    def summary(self):
+        """
+        统计信息
+
+        Returns:
+            dict: TRACE 总行数/字节数、落盘的 TRACE 行数、事件列表
+        """
+        return {'trace_lines': self.trace_lines, 'trace_bytes': self.trace_bytes,
+                'kept_lines': self.kept_lines, 'incidents': self.incidents}
+
+
+def build(log_path, archive=DEFAULT_ARCHIVE, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    从已有的日志文件生成归档（没有时间信息）
+
+    Returns:
+        dict: 索引
+    """
+    writer = ArchiveWriter(archive, block_size)
+    with open(log_path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            writer.add(line, event=parse_task_event(line))
+    writer.close()
+    return load_index(archive)
+
+
+def load_index(archive=DEFAULT_ARCHIVE):
+    """
+    读取索引
+
+    Raises:
+        ValueError: 索引不存在或版本不支持
+    """
+    try:
+        with open(index_path(archive), encoding='utf-8') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"未找到索引 {index_path(archive)}")
+    if index.get('version') != INDEX_VERSION:
+        raise ValueError(f"不支持的索引版本: {index.get('version')}")
+    return index
+
+
+class ArchiveReader:
+    """按需解压归档中的块"""
+
+    def __init__(self, archive=DEFAULT_ARCHIVE):
+        self.index = load_index(archive)
+        self.file = open(archive, 'rb')
+        self.decompressed = 0
+
+    def read_block(self, block):
+        """
+        解压一块
+
+        Returns:
+            list: (行号, 相对时间秒或 None, 行) 列表
+        """
+        self.file.seek(block['offset'])
+        data = _decompress(self.file.read(block['length']), self.index['codec'])
+        self.decompressed += 1
+        count = block['lines']
+        times = struct.unpack(f'<{count}I', data[:count * 4])
+        # 只按 \n 分行（str.splitlines 还会在 \x1c、\u2028 等字符处分行，与时间表错位）
+        lines = [line.decode('utf-8', errors='replace') for line in io.BytesIO(data[count * 4:]).readlines()]
+        return [(block['first_line'] + i, None if t == NO_TIME else t / 1000, line)
+                for i, (t, line) in enumerate(zip(times, lines))]
+
+    def lines(self, blocks, line_range=None, time_range=None, min_level=None):
+        """
+        逐行输出指定块中符合条件的行
+
+        Args:
+            blocks: 要解压的块
+            line_range: (起始行, 结束行)，含两端
+            time_range: (起始秒, 结束秒)，相对开始时间
+            min_level: 最低级别
+        """
+        min_rank = LEVELS.index(min_level) if min_level else 0
+        for block in blocks:
+            level = block.get('start_level', 'INFO')
+            for number, t, line in self.read_block(block):
+                level = line_level(line, level)
+                if line_range and not line_range[0] <= number <= line_range[1]:
+                    continue
+                if time_range and (t is None or not time_range[0] <= t <= time_range[1]):
+                    continue
+                if LEVELS.index(level) < min_rank:
+                    continue
+                yield number, t, line
+
+    def close(self):
+        self.file.close()
+
+
+def select_blocks(index, line_range=None, time_range=None, min_level=None):
+    """
+    根据索引选出可能包含目标行的块
+
+    Returns:
+        list: 块列表
+    """
+    selected = []
+    for block in index['blocks']:
+        last_line = block['first_line'] + block['lines'] - 1
+        if line_range and (last_line < line_range[0] or block['first_line'] > line_range[1]):
+            continue
+        if time_range and (block['t0'] is None or block['t1'] < time_range[0] or block['t0'] > time_range[1]):
+            continue
+        if min_level and not any(LEVELS.index(level) >= LEVELS.index(min_level) for level in block['levels']):
+            continue
+        selected.append(block)
+    return selected
+
+
+def task_range(index, spec):
+    """
+    任务的行号范围
+
+    Args:
+        spec: 任务名，或 任务名:第几次
+
+    Returns:
+        list: [(起始行, 结束行), ...]
+
+    Raises:
+        ValueError: 没有找到该任务
+    """
+    task, _, occurrence = spec.partition(':')
+    ranges = [
+        (entry['first_line'], entry['last_line'] if entry['last_line'] is not None else index['lines'] - 1)
+        for entry in index['tasks']
+        if entry['task'] == task and (not occurrence or entry['occurrence'] == int(occurrence))
+    ]
+    if not ranges:
+        raise ValueError(f"日志中没有任务 {spec}")
+    return ranges
+
+
+def time_of_day_offset(index, text):
+    """
+    把当天时间（HH:MM[:SS]）换算为相对开始时间的秒数
+
+    Raises:
+        ValueError: 归档没有时间信息或格式错误
+    """
+    if index.get('start_time') is None:
+        raise ValueError("归档没有时间信息（由 build 生成），无法按时间查询")
+    start = datetime.datetime.fromtimestamp(index['start_time'])
+    try:
+        parts = [int(part) for part in text.split(':')]
+        target = start.replace(hour=parts[0], minute=parts[1], second=parts[2] if len(parts) > 2 else 0,
+                               microsecond=0)
+    except (ValueError, IndexError):
+        raise ValueError(f"时间格式错误: {text}（应为 HH:MM 或 HH:MM:SS）")
+    if target < start - datetime.timedelta(hours=12):
+        target += datetime.timedelta(days=1)
+    return (target - start).total_seconds()
+
+
+def last_time(index):
+    """最后一行的相对时间（秒）"""
+    times = [block['t1'] for block in index['blocks'] if block['t1'] is not None]
+    if not times:
+        raise ValueError("归档没有时间信息（由 build 生成），无法按时间查询")
+    return max(times)
+
+
+def print_info(index, archive):
+    """打印归档概况"""
+    compressed = sum(block['length'] for block in index['blocks'])
+    levels = {}
+    for block in index['blocks']:
+        for level, count in block['levels'].items():
+            levels[level] = levels.get(level, 0) + count
+    print(f"📦 {archive}：{index['lines']} 行，{len(index['blocks'])} 块（{index['codec']}），"
+          f"{index['raw_size'] / 1024 / 1024:.1f} MB → {compressed / 1024 / 1024:.1f} MB")
+    if index.get('start_time') is not None:
+        start = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(index['start_time']))
+        print(f"🕐 开始 {start}，持续 {last_time(index):.0f}s")
+    print("📊 " + '  '.join(f"{level} {levels[level]}" for level in LEVELS if level in levels))
+    for entry in index['tasks']:
+        result = entry['result'] or '未结束'
+        print(f"   {entry['task']}:{entry['occurrence']:<3} 行 {entry['first_line'] + 1}-"
+              f"{(entry['last_line'] if entry['last_line'] is not None else index['lines'] - 1) + 1}  {result}")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="MAA 日志归档（分块压缩 + 索引）与查询")
+    parser.add_argument('-a', '--archive', default=DEFAULT_ARCHIVE, help='归档文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_build = sub.add_parser('build', help='从日志文件生成归档')
+    p_build.add_argument('log', nargs='?', default='asst.log')
+    p_build.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE, help='每块原始大小（字节）')
+
+    sub.add_parser('info', help='显示归档概况和任务列表')
+
+    p_query = sub.add_parser('query', help='查询日志（条件可以组合）')
+    p_query.add_argument('--level', choices=LEVELS, help='最低级别（如 ERROR、WARN）')
+    p_query.add_argument('--task', help='任务名，或 任务名:第几次（如 Fight:2）')
+    p_query.add_argument('--lines', help='行号范围，如 100-200')
+    p_query.add_argument('--last', type=float, help='日志结束前 N 秒（卡住前的日志）')
+    p_query.add_argument('--at', help='时间点 HH:MM[:SS]，配合 --before/--after')
+    p_query.add_argument('--before', type=float, default=30, help='--at 之前的秒数')
+    p_query.add_argument('--after', type=float, default=0, help='--at 之后的秒数')
+    p_query.add_argument('--grep', help='再按正则过滤')
+    p_query.add_argument('-n', '--line-numbers', action='store_true', help='显示行号和时间')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'build':
+            index = build(args.log, args.archive, args.block_size)
+            print_info(index, args.archive)
+            return
+        index = load_index(args.archive)
+        if args.command == 'info':
+            print_info(index, args.archive)
+            return
+
+        line_ranges = [None]
+        if args.task:
+            line_ranges = task_range(index, args.task)
+        elif args.lines:
+            first, _, last = args.lines.partition('-')
+            line_ranges = [(int(first) - 1, int(last or first) - 1)]
+        time_range = None
+        if args.last is not None:
+            end = last_time(index)
+            time_range = (end - args.last, end)
+        elif args.at:
+            at = time_of_day_offset(index, args.at)
+            time_range = (at - args.before, at + args.after)
+        pattern = re.compile(args.grep) if args.grep else None
+
+        reader = ArchiveReader(args.archive)
+        matched = 0
+        out = sys.stdout
+        for line_range in line_ranges:
+            blocks = select_blocks(index, line_range, time_range, args.level)
+            for number, t, line in reader.lines(blocks, line_range, time_range, args.level):
+                if pattern and not pattern.search(line):
+                    continue
+                matched += 1
+                if args.line_numbers:
+                    stamp = f"{t:9.3f}s " if t is not None else ''
+                    out.write(f"{number + 1:>8}  {stamp}{line}")
+                else:
+                    out.write(line)
+        reader.close()
+        print(f"ℹ️  {matched} 行，解压了 {reader.decompressed}/{len(index['blocks'])} 块", file=sys.stderr)
+    except BrokenPipeError:
+        # 输出被 head 等提前关闭
+        sys.stderr.close()
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
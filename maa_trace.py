@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行耗时追踪
+
+Python 和 shell 步骤都可以记录区间（span）的开始和结束，
+事件逐行追加到同一个 JSONL 文件（多个进程同时写也不会互相覆盖），
+最后导出为 Chrome trace-event JSON，用 chrome://tracing 或 https://ui.perfetto.dev 打开
+
+每个 span 属于一条轨道（track），同一轨道上的 span 按开始/结束配对，
+导出时每条轨道显示为单独的一行
+
+Python 用法：
+    from maa_trace import span
+    with span('docker load', track='setup_container'):
+        ...
+
+Shell 用法（见 common_functions.sh 的 trace_begin / trace_end）：
+    python3 maa_trace.py begin "docker load" --track setup_container
+    python3 maa_trace.py end "docker load" --track setup_container
+    python3 maa_trace.py export -o trace.json
+
+环境变量：
+    MAA_TRACE_FILE: 事件文件路径（默认 trace_events.jsonl）
+    MAA_TRACE: 设为 0 时关闭追踪
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+DEFAULT_EVENTS_FILE = 'trace_events.jsonl'
+DEFAULT_OUTPUT = 'trace.json'
+PROCESS_NAME = 'MAA workflow'
+
+
+def events_file():
+    """事件文件路径"""
+    return os.getenv('MAA_TRACE_FILE', DEFAULT_EVENTS_FILE)
+
+
+def default_track(fallback='main'):
+    """默认轨道：编排器启动的步骤继承步骤名（MAA_TRACE_TRACK）"""
+    return os.getenv('MAA_TRACE_TRACK', fallback)
+
+
+def enabled():
+    """是否启用追踪"""
+    return os.getenv('MAA_TRACE', '1') != '0'
+
+
+def _now_us():
+    """当前时间（微秒，跨进程可比较）"""
+    return int(time.time() * 1_000_000)
+
+
+def record(phase, name, track='main', ts=None, **args):
+    """
+    追加一条事件
+
+    Args:
+        phase: 'B'（开始）、'E'（结束）或 'i'（瞬时事件）
+        name: span 名
+        track: 轨道名
+        ts: 时间戳（微秒），默认当前时间
+        **args: 附加信息（显示在 trace 查看器的详情中）
+    """
+    if not enabled():
+        return
+    event = {'ph': phase, 'name': name, 'track': track, 'ts': ts or _now_us()}
+    if args:
+        event['args'] = args
+    line = json.dumps(event, ensure_ascii=False) + '\n'
+    # 追踪失败不能影响实际任务
+    try:
+        with open(events_file(), 'a', encoding='utf-8') as f:
+            f.write(line)
+    except OSError:
+        pass
+
+
+def begin(name, track='main', **args):
+    """开始一个 span"""
+    record('B', name, track, **args)
+
+
+def end(name, track='main', **args):
+    """结束最近一个同名 span"""
+    record('E', name, track, **args)
+
+
+def instant(name, track='main', **args):
+    """记录瞬时事件"""
+    record('i', name, track, **args)
+
+
+@contextlib.contextmanager
+def span(name, track='main', **args):
+    """
+    记录代码块的耗时，异常时在结束事件中标记 error
+
+    Args:
+        name: span 名
+        track: 轨道名
+        **args: 附加信息
+    """
+    begin(name, track, **args)
+    try:
+        yield
+    except BaseException as e:
+        end(name, track, error=type(e).__name__)
+        raise
+    end(name, track)
+
+
+def load_events(path=None):
+    """
+    读取事件文件（忽略写了一半的行）
+
+    Returns:
+        list: 事件列表（按时间排序）
+    """
+    events = []
+    try:
+        with open(path or events_file(), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return []
+    events.sort(key=lambda e: e['ts'])
+    return events
+
+
+def to_chrome_trace(events):
+    """
+    事件 → Chrome trace-event 格式
+
+    同一轨道上同名的开始/结束事件配对为完整事件（ph=X），
+    没有结束的 span 在最后一个事件的时间截止并标记 unfinished
+
+    Returns:
+        dict: {'traceEvents': [...], 'displayTimeUnit': 'ms'}
+    """
+    if not events:
+        return {'traceEvents': [], 'displayTimeUnit': 'ms'}
+
+    origin = events[0]['ts']
+    last = events[-1]['ts']
+    tids = {}
+    open_spans = {}
+    trace = []
+
+    def tid(track):
+        if track not in tids:
+            tids[track] = len(tids) + 1
+        return tids[track]
+
+    for event in events:
+        track = event.get('track', 'main')
+        key = (track, event['name'])
+        if event['ph'] == 'B':
+            open_spans.setdefault(key, []).append(event)
+        elif event['ph'] == 'E':
+            stack = open_spans.get(key)
+            if not stack:
+                continue
+            started = stack.pop()
+            args = dict(started.get('args', {}), **event.get('args', {}))
+            trace.append({
+                'name': event['name'], 'cat': track, 'ph': 'X', 'pid': 1, 'tid': tid(track),
+                'ts': started['ts'] - origin, 'dur': event['ts'] - started['ts'], 'args': args,
+            })
+        elif event['ph'] == 'i':
+            trace.append({
+                'name': event['name'], 'cat': track, 'ph': 'i', 's': 't', 'pid': 1, 'tid': tid(track),
+                'ts': event['ts'] - origin, 'args': event.get('args', {}),
+            })
+
+    for (track, name), stack in open_spans.items():
+        for started in stack:
+            trace.append({
+                'name': name, 'cat': track, 'ph': 'X', 'pid': 1, 'tid': tid(track),
+                'ts': started['ts'] - origin, 'dur': last - started['ts'],
+                'args': dict(started.get('args', {}), unfinished=True),
+            })
+
+    metadata = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': PROCESS_NAME}}]
+    for track, track_id in tids.items():
+        metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': track_id, 'args': {'name': track}})
+        metadata.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': 1, 'tid': track_id,
+                         'args': {'sort_index': track_id}})
+    trace.sort(key=lambda e: (e['ts'], -e.get('dur', 0)))
+    return {'traceEvents': metadata + trace, 'displayTimeUnit': 'ms'}
+
+
+def summarize(trace):
+    """
+    汇总所有 span 的耗时
+
+    Returns:
+        list: (轨道名, span 名, 秒) 列表，按耗时降序
+    """
+    names = {e['tid']: e['args']['name'] for e in trace['traceEvents'] if e.get('name') == 'thread_name'}
+    rows = [
+        (names.get(e['tid'], e['tid']), e['name'], e['dur'] / 1_000_000)
+        for e in trace['traceEvents'] if e['ph'] == 'X'
+    ]
+    rows.sort(key=lambda row: -row[2])
+    return rows
+
+
+def _parse_args(pairs):
+    """把 key=value 列表转成 dict"""
+    result = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition('=')
+        result[key] = value
+    return result
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="运行耗时追踪（Chrome trace-event 格式）")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for command in ('begin', 'end', 'instant'):
+        p = sub.add_parser(command)
+        p.add_argument('name', help='span 名')
+        p.add_argument('--track', default=default_track(), help='轨道名（默认 MAA_TRACE_TRACK 或 main）')
+        p.add_argument('--arg', action='append', help='附加信息 key=value（可重复）')
+
+    p_export = sub.add_parser('export', help='导出 Chrome trace JSON')
+    p_export.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help='输出文件')
+    p_export.add_argument('--summary', type=int, default=15, help='打印耗时最长的前 N 个 span（0 = 不打印）')
+
+    args = parser.parse_args()
+
+    if args.command in ('begin', 'end', 'instant'):
+        record({'begin': 'B', 'end': 'E', 'instant': 'i'}[args.command], args.name, args.track,
+               **_parse_args(args.arg))
+    elif args.command == 'export':
+        trace = to_chrome_trace(load_events())
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(trace, f, ensure_ascii=False)
+        spans = summarize(trace)
+        print(f"✅ 已导出 {len(spans)} 个 span 到 {args.output}", file=sys.stderr)
+        for track, name, seconds in spans[:args.summary]:
+            print(f"   {seconds:>8.1f}s  [{track}] {name}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
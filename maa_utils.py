@@ -8,6 +8,17 @@ MAA 工具模块
 import os
 import re
 
+# MAA 任务类型（daily.toml 中 type 字段的取值）
+TASK_TYPES = (
+    'StartUp', 'CloseDown', 'Fight', 'Recruit', 'Infrast', 'Mall', 'Award', 'Roguelike',
+    'Copilot', 'SSSCopilot', 'Depot', 'OperBox', 'Reclamation', 'Custom', 'SingleStep',
+    'VideoRecognition',
+)
+# 任务链开始/结束的日志行，如 "[2024-01-01 12:00:00 INFO ] Fight Start"
+TASK_EVENT_PATTERN = re.compile(
+    r'\b(' + '|'.join(TASK_TYPES) + r')\s+(Start|Completed|Error|Stopped)\s*$'
+)
+
 
 def read_asst_log(filepath='asst.log'):
     """
@@ -70,6 +81,22 @@ def check_resource_update_error(log_content):
     return False
 
 
+def parse_task_event(line):
+    """
+    解析任务链开始/结束的日志行
+
+    Args:
+        line: 一行日志
+
+    Returns:
+        tuple: (任务类型, 事件)，事件为 Start/Completed/Error/Stopped；不是任务事件返回 None
+    """
+    match = TASK_EVENT_PATTERN.search(line.rstrip())
+    if not match:
+        return None
+    return match.group(1), match.group(2)
+
+
 def is_first_time_fix():
     """
     检查是否是第一次修复
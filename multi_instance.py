@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多实例模式：一个 runner 上同时运行多个账号
+
+每个实例是一个独立的 redroid 容器（单独的端口、数据目录、MAA 配置、快照 Release），
+在各自的工作目录 instances/<name>/ 中依次执行：
+    恢复快照 → 启动容器 → 安装游戏 → 运行 MAA → 生成报告 → 发送通知 → 导出 → 备份
+
+实例按配置顺序启动，同时运行的实例占用的 CPU/内存不超过预算（见 instances.example.toml），
+超出预算的实例等前面的实例结束后再启动；每个实例的 cpus/memory 同时作为容器的资源上限
+（REDROID_CPUS、REDROID_MEM 传给 docker-compose.yml），实例之间不会互相挤占
+
+工作目录中链接了仓库的 Python 脚本并复制了 docker-compose.yml，
+所以 scripts/ 下的脚本不需要修改路径，只通过环境变量区分实例：
+    MAA_INSTANCE、REDROID_NAME、ADB_PORT、ADB_DEVICE、ARK_IMAGE、SNAPSHOT_PREFIX、MAA_CONFIG_DIR、
+    REDROID_CPUS、REDROID_MEM
+
+用法：
+    python3 multi_instance.py list
+    python3 multi_instance.py run
+    python3 multi_instance.py run --only alt --skip-backup
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import toml
+
+import maa_trace
+from snapshot_crypto import parse_size
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = 'instances.toml'
+INSTANCES_DIR = 'instances'
+MAA_CONFIG_SOURCE = os.path.join(REPO_DIR, '.config', 'maa')
+BASE_PORT = 5555
+DEFAULTS = {
+    'client_type': 'Official',
+    'profile': 'default',
+    'tasks': 'daily',
+    'cpus': 2,
+    'memory': '3g',
+}
+# 失败时打印的日志行数
+FAILURE_TAIL = 30
+
+
+def load_instances(path=DEFAULT_CONFIG):
+    """
+    读取多实例配置
+
+    Args:
+        path: 配置文件路径
+
+    Returns:
+        tuple: (实例列表, 预算)；实例为 dict：name、port、container、image、snapshot_prefix、
+               workdir、client_type、profile、tasks、cpus、memory（字节）；预算为 {'cpus', 'memory'}
+
+    Raises:
+        ValueError: 配置有误
+    """
+    if not os.path.exists(path):
+        raise ValueError(f"未找到 {path}，请复制 instances.example.toml 后修改")
+    config = toml.load(path)
+    defaults = dict(DEFAULTS, **config.get('defaults', {}))
+
+    instances = []
+    for index, entry in enumerate(config.get('instances', [])):
+        item = dict(defaults, **entry)
+        name = str(item.get('name', ''))
+        # 实例名会用在容器名、镜像名和 Release 标签中
+        if not name or not all(c.isdigit() or ('a' <= c <= 'z') or c == '-' for c in name) or name[0] == '-':
+            raise ValueError(f"实例名无效（只能使用小写字母、数字和 -）: {name!r}")
+        port = int(item.get('port', BASE_PORT + index))
+        instances.append({
+            'name': name,
+            'port': port,
+            'container': f'redroid-{name}',
+            'image': f'ark-{name}',
+            'snapshot_prefix': f'{name}-snapshot',
+            'workdir': os.path.join(INSTANCES_DIR, name),
+            'client_type': item['client_type'],
+            'profile': item['profile'],
+            'tasks': item['tasks'],
+            'cpus': float(item['cpus']),
+            'memory': parse_size(item['memory']),
+        })
+    if not instances:
+        raise ValueError(f"{path} 中没有配置任何实例")
+
+    for key in ('name', 'port'):
+        values = [instance[key] for instance in instances]
+        duplicated = {value for value in values if values.count(value) > 1}
+        if duplicated:
+            raise ValueError(f"实例的 {key} 重复: {', '.join(map(str, sorted(duplicated)))}")
+
+    budget = config.get('budget', {})
+    budget = {
+        'cpus': float(budget.get('cpus', 0)) or float(os.cpu_count() or 1),
+        'memory': parse_size(budget.get('memory', '0')) or available_memory(),
+    }
+    return instances, budget
+
+
+def available_memory():
+    """当前可用内存（字节，读取 /proc/meminfo 的 MemAvailable）"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def instance_env(instance):
+    """
+    实例的环境变量（scripts/ 和 run.py 通过这些变量区分实例）
+
+    Returns:
+        dict: 完整的环境变量
+    """
+    workdir = os.path.abspath(instance['workdir'])
+    return dict(
+        os.environ,
+        MAA_INSTANCE=instance['name'],
+        REDROID_NAME=instance['container'],
+        ADB_PORT=str(instance['port']),
+        ADB_DEVICE=f"127.0.0.1:{instance['port']}",
+        ARK_IMAGE=instance['image'],
+        REDROID_CPUS=f"{instance['cpus']:g}",
+        REDROID_MEM=str(instance['memory']),
+        SNAPSHOT_PREFIX=instance['snapshot_prefix'],
+        COMPOSE_PROJECT_NAME=f"maa-{instance['name']}",
+        MAA_CONFIG_DIR=os.path.join(workdir, 'maa_config'),
+        CLIENT_TYPE=instance['client_type'],
+        GITHUB_STEP_SUMMARY=os.path.join(workdir, 'summary.md'),
+        MAA_TRACE_FILE=os.path.abspath(maa_trace.events_file()),
+        MAA_TRACE_TRACK=instance['name'],
+    )
+
+
+def link_repo(directory):
+    """
+    在目录中链接仓库的 Python 脚本、复制 docker-compose.yml
+
+    scripts/ 下的脚本以 "python3 xxx.py" 调用辅助脚本，docker compose 以当前目录为项目目录，
+    所以每个实例的工作目录都要能找到这些文件
+    """
+    os.makedirs(directory, exist_ok=True)
+    for filename in os.listdir(REPO_DIR):
+        if filename.endswith('.py'):
+            target = os.path.join(directory, filename)
+            if not os.path.lexists(target):
+                os.symlink(os.path.join(REPO_DIR, filename), target)
+    shutil.copy(os.path.join(REPO_DIR, 'docker-compose.yml'), directory)
+
+
+def prepare_workdir(instance):
+    """
+    准备实例的工作目录和 MAA 配置目录
+
+    MAA 配置从 .config/maa 复制：profiles/<profile>.toml（连接地址改为实例的端口）
+    作为 default.toml，tasks/<tasks>.toml 作为 daily.toml
+
+    Raises:
+        ValueError: 配置文件不存在
+    """
+    workdir = instance['workdir']
+    link_repo(workdir)
+
+    config_dir = os.path.join(workdir, 'maa_config')
+    profile_src = os.path.join(MAA_CONFIG_SOURCE, 'profiles', f"{instance['profile']}.toml")
+    tasks_src = os.path.join(MAA_CONFIG_SOURCE, 'tasks', f"{instance['tasks']}.toml")
+    for src in (profile_src, tasks_src):
+        if not os.path.exists(src):
+            raise ValueError(f"实例 {instance['name']} 的 MAA 配置不存在: {src}")
+
+    os.makedirs(os.path.join(config_dir, 'profiles'), exist_ok=True)
+    os.makedirs(os.path.join(config_dir, 'tasks'), exist_ok=True)
+    shutil.copy(os.path.join(MAA_CONFIG_SOURCE, 'cli.toml'), config_dir)
+    profile = toml.load(profile_src)
+    profile.setdefault('connection', {})['address'] = f"127.0.0.1:{instance['port']}"
+    with open(os.path.join(config_dir, 'profiles', 'default.toml'), 'w') as f:
+        toml.dump(profile, f)
+    shutil.copy(tasks_src, os.path.join(config_dir, 'tasks', 'daily.toml'))
+
+
+def instance_steps(instance, skip_restore=False, skip_backup=False):
+    """
+    实例的执行步骤（在实例工作目录中按顺序执行，失败即停止）
+
+    Returns:
+        list: 步骤列表，每项为 dict：name、cmd、enabled
+    """
+    return [
+        {'name': 'restore', 'cmd': 'restore_from_release.sh', 'enabled': not skip_restore},
+        {'name': 'setup_container', 'cmd': 'setup_container.sh 180', 'enabled': True},
+        {'name': 'game_install', 'cmd': f'install_game.sh "{instance["client_type"]}" install', 'enabled': True},
+        {'name': 'run', 'cmd': 'python3 run.py', 'enabled': True},
+        {'name': 'report', 'cmd': 'python3 process_report.py', 'enabled': True},
+        {'name': 'notify', 'cmd': '[ ! -f telegram_msg.txt ] || python3 send_msg.py', 'enabled': True},
+        {'name': 'export', 'cmd': 'export_container.sh', 'enabled': not skip_backup},
+        {'name': 'backup', 'cmd': 'backup_to_release.sh', 'enabled': not skip_backup},
+    ]
+
+
+class MultiInstanceRunner:
+    """按资源预算并发运行多个实例"""
+
+    def __init__(self, instances, budget, skip_restore=False, skip_backup=False):
+        """
+        Args:
+            instances: 实例列表（见 load_instances）
+            budget: 资源预算 {'cpus', 'memory'}
+            skip_restore: 不恢复快照（使用默认镜像）
+            skip_backup: 不导出和备份
+        """
+        self.instances = instances
+        self.budget = budget
+        self.skip_restore = skip_restore
+        self.skip_backup = skip_backup
+        self.width = max(len(instance['name']) for instance in instances) + len('/setup_container')
+        self.print_lock = threading.Lock()
+
+    # ==================== 输出 ====================
+    def log(self, message):
+        """打印调度信息"""
+        with self.print_lock:
+            print(f"[{'multi_instance':<{self.width}}] {message}", flush=True)
+
+    def _run_step(self, instance, step, env):
+        """
+        执行一个步骤，输出加 [实例/步骤] 前缀并写入 instances/<name>/logs/<步骤>.log
+
+        Returns:
+            int: 退出码
+        """
+        log_dir = os.path.join(instance['workdir'], 'logs')
+        os.makedirs(log_dir, exist_ok=True)
+        prefix = f"[{instance['name'] + '/' + step['name']:<{self.width}}] "
+        with open(os.path.join(log_dir, f"{step['name']}.log"), 'w', encoding='utf-8') as log_file:
+            process = subprocess.Popen(step['cmd'], shell=True, cwd=instance['workdir'], env=env,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+            for raw in iter(process.stdout.readline, b''):
+                line = raw.decode('utf-8', errors='replace').rstrip('\r\n').rsplit('\r', 1)[-1]
+                log_file.write(line + '\n')
+                with self.print_lock:
+                    print(prefix + line, flush=True)
+            process.stdout.close()
+            return process.wait()
+
+    def run_instance(self, instance):
+        """
+        在实例工作目录中依次执行步骤
+
+        Returns:
+            dict: name、status（success/failed）、failed_step、seconds、steps（步骤名 → 秒）
+        """
+        start = time.time()
+        result = {'name': instance['name'], 'status': 'success', 'failed_step': None, 'steps': {}}
+        env = instance_env(instance)
+        try:
+            for step in instance_steps(instance, self.skip_restore, self.skip_backup):
+                if not step['enabled']:
+                    continue
+                step_start = time.time()
+                with maa_trace.span(step['name'], instance['name']):
+                    returncode = self._run_step(instance, step, env)
+                result['steps'][step['name']] = time.time() - step_start
+                if returncode != 0:
+                    result.update(status='failed', failed_step=step['name'])
+                    break
+        finally:
+            # 失败的实例不会导出（导出时会删除容器），删除容器以释放预算
+            if result['status'] == 'failed' or self.skip_backup:
+                subprocess.run(f"docker rm -f {instance['container']} > /dev/null 2>&1", shell=True)
+        result['seconds'] = time.time() - start
+        return result
+
+    # ==================== 调度 ====================
+    def _fits(self, instance, running):
+        """实例加入后是否仍在预算内（没有实例在运行时总是允许，避免单个实例超预算时永远等待）"""
+        if not running:
+            return True
+        cpus = sum(item['cpus'] for item in running.values()) + instance['cpus']
+        memory = sum(item['memory'] for item in running.values()) + instance['memory']
+        return cpus <= self.budget['cpus'] and memory <= self.budget['memory']
+
+    def download_games(self):
+        """
+        每种客户端只下载一次 APK，链接到各个实例的工作目录
+
+        Returns:
+            bool: 是否全部下载成功
+        """
+        for client_type in sorted({instance['client_type'] for instance in self.instances}):
+            directory = os.path.join(INSTANCES_DIR, f'_download_{client_type}')
+            link_repo(directory)
+            self.log(f"⬇️  下载 {client_type} 客户端")
+            step = {'name': 'game_download', 'cmd': f'install_game.sh "{client_type}" download'}
+            with maa_trace.span(f'game_download ({client_type})', 'multi_instance'):
+                returncode = self._run_step({'name': client_type, 'workdir': directory}, step, dict(os.environ))
+            if returncode != 0:
+                self.log(f"❌ {client_type} 客户端下载失败")
+                return False
+            apk = os.path.abspath(os.path.join(directory, 'arknights.apk'))
+            for instance in self.instances:
+                if instance['client_type'] == client_type:
+                    target = os.path.join(instance['workdir'], 'arknights.apk')
+                    if os.path.lexists(target):
+                        os.remove(target)
+                    os.symlink(apk, target)
+        return True
+
+    def run(self):
+        """
+        准备工作目录、下载游戏，然后按预算调度所有实例
+
+        Returns:
+            list: 每个实例的结果（见 run_instance），按配置顺序
+        """
+        for instance in self.instances:
+            prepare_workdir(instance)
+        if not self.download_games():
+            return [{'name': instance['name'], 'status': 'failed', 'failed_step': 'game_download',
+                     'seconds': 0, 'steps': {}} for instance in self.instances]
+
+        self.log(f"📊 预算：{self.budget['cpus']:g} 核，{self.budget['memory'] / 1024 ** 3:.1f}G 内存")
+        pending = list(self.instances)
+        running = {}
+        results = {}
+        with ThreadPoolExecutor(max_workers=len(self.instances)) as pool:
+            while pending or running:
+                # 按配置顺序启动，前面的实例放不下时后面的也等待（保证顺序可预期）
+                while pending and self._fits(pending[0], running):
+                    instance = pending.pop(0)
+                    self.log(f"▶️  启动 {instance['name']}（端口 {instance['port']}，{instance['cpus']:g} 核，"
+                             f"{instance['memory'] / 1024 ** 3:.1f}G）")
+                    running[pool.submit(self.run_instance, instance)] = instance
+                if pending:
+                    self.log(f"⏸️  {pending[0]['name']} 等待资源（运行中 {len(running)} 个实例）")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    instance = running.pop(future)
+                    result = future.result()
+                    results[instance['name']] = result
+                    icon = '✅' if result['status'] == 'success' else f"❌ 失败于 {result['failed_step']}"
+                    self.log(f"{icon} {instance['name']}（{result['seconds']:.0f}s）")
+        return [results[instance['name']] for instance in self.instances]
+
+    # ==================== 报告 ====================
+    def report(self, results):
+        """打印汇总表格和失败步骤的日志末尾，并合并各实例的 GitHub Summary"""
+        lines = ['', '=' * 60, '📊 多实例运行结果', '=' * 60]
+        for instance, result in zip(self.instances, results):
+            status = '✅ 成功' if result['status'] == 'success' else f"❌ {result['failed_step']}"
+            steps = '  '.join(f"{name} {seconds:.0f}s" for name, seconds in result['steps'].items())
+            lines.append(f"  {instance['name']:<12} :{instance['port']:<6} {status:<20} "
+                         f"{result['seconds']:>6.0f}s  {steps}")
+        for instance, result in zip(self.instances, results):
+            log_path = os.path.join(instance['workdir'], 'logs', f"{result['failed_step']}.log")
+            if result['status'] == 'failed' and os.path.exists(log_path):
+                with open(log_path, encoding='utf-8') as f:
+                    tail = f.read().splitlines()[-FAILURE_TAIL:]
+                lines += ['', f"📋 {instance['name']}/{result['failed_step']} 日志（最后 {len(tail)} 行）："]
+                lines += [f"   {line}" for line in tail]
+        with self.print_lock:
+            print('\n'.join(lines), flush=True)
+
+        github_step_summary = os.getenv('GITHUB_STEP_SUMMARY')
+        if github_step_summary:
+            with open(github_step_summary, 'a', encoding='utf-8') as out:
+                for instance in self.instances:
+                    path = os.path.join(instance['workdir'], 'summary.md')
+                    if os.path.exists(path):
+                        with open(path, encoding='utf-8') as f:
+                            out.write(f.read() + '\n\n')
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="多实例模式：按资源预算并发运行多个 redroid + MAA 实例")
+    parser.add_argument('-c', '--config', default=DEFAULT_CONFIG, help='多实例配置文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('list', help='显示实例配置和预算')
+
+    p_run = sub.add_parser('run', help='运行所有实例')
+    p_run.add_argument('--only', action='append', help='只运行指定实例（可重复）')
+    p_run.add_argument('--skip-restore', action='store_true', help='不恢复快照（使用默认镜像）')
+    p_run.add_argument('--skip-backup', action='store_true', help='不导出和备份')
+
+    args = parser.parse_args()
+
+    try:
+        instances, budget = load_instances(args.config)
+        if args.command == 'run' and args.only:
+            unknown = set(args.only) - {instance['name'] for instance in instances}
+            if unknown:
+                raise ValueError(f"未知的实例: {', '.join(sorted(unknown))}")
+            instances = [instance for instance in instances if instance['name'] in args.only]
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.command == 'list':
+        print(f"预算：{budget['cpus']:g} 核，{budget['memory'] / 1024 ** 3:.1f}G 内存")
+        for instance in instances:
+            print(f"  {instance['name']:<12} 端口 {instance['port']}  容器 {instance['container']}  "
+                  f"{instance['client_type']}  profile={instance['profile']} tasks={instance['tasks']}  "
+                  f"{instance['cpus']:g} 核 {instance['memory'] / 1024 ** 3:.1f}G  "
+                  f"快照 {instance['snapshot_prefix']}")
+    elif args.command == 'run':
+        runner = MultiInstanceRunner(instances, budget, args.skip_restore, args.skip_backup)
+        try:
+            results = runner.run()
+        except ValueError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(1)
+        runner.report(results)
+        if any(result['status'] != 'success' for result in results):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+环境准备编排器
+
+按依赖关系执行环境准备步骤：依赖都完成的步骤立即并发启动，
+每个步骤的输出加上 [步骤名] 前缀实时打印，同时写入单独的日志文件。
+关键步骤失败时立即终止其它步骤，并输出耗时报告和关键路径
+
+步骤依赖（auto/update 模式）：
+    prepare_env ─┬─ restore ─── setup_container ─┬─ game_install
+                 └─ game_download ───────────────┘
+                                  setup_container ── tunnel（非关键）
+    install_maa（无依赖）
+
+用法：
+    python3 orchestrator.py --mode auto --client-type Official
+    python3 orchestrator.py --mode init --dry-run
+"""
+import argparse
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import maa_trace
+
+DEFAULT_LOG_DIR = 'setup_logs'
+# 失败时打印的日志行数
+FAILURE_TAIL = 30
+# 终止步骤时等待进程退出的秒数
+KILL_TIMEOUT = 10
+
+
+def setup_steps(mode, client_type):
+    """
+    环境准备步骤
+
+    Args:
+        mode: 运行模式（auto/init/update）
+        client_type: 游戏客户端类型
+
+    Returns:
+        list: 步骤列表，每项为 dict：
+              name（步骤名）、cmd（shell 命令）、deps（依赖的步骤名）、
+              critical（失败时是否中止全部步骤）、enabled（是否执行，跳过的步骤视为已完成）
+    """
+    return [
+        {'name': 'prepare_env', 'cmd': 'prepare_env.sh', 'deps': [],
+         'critical': True, 'enabled': True},
+        {'name': 'restore', 'cmd': 'restore_from_release.sh', 'deps': ['prepare_env'],
+         'critical': True, 'enabled': mode in ('auto', 'update')},
+        {'name': 'setup_container', 'cmd': 'setup_container.sh 180', 'deps': ['prepare_env', 'restore'],
+         'critical': True, 'enabled': True},
+        {'name': 'install_maa', 'cmd': 'install_maa.sh', 'deps': [],
+         'critical': True, 'enabled': True},
+        {'name': 'game_download', 'cmd': f'install_game.sh "{client_type}" download', 'deps': ['prepare_env'],
+         'critical': True, 'enabled': True},
+        {'name': 'game_install', 'cmd': f'install_game.sh "{client_type}" install',
+         'deps': ['game_download', 'setup_container'], 'critical': True, 'enabled': True},
+        {'name': 'tunnel', 'cmd': 'setup_tunnel.sh', 'deps': ['setup_container'],
+         'critical': False, 'enabled': True},
+    ]
+
+
+def validate_steps(steps):
+    """
+    检查步骤定义（依赖是否存在、是否有环）
+
+    Raises:
+        ValueError: 定义有误
+    """
+    names = {step['name'] for step in steps}
+    for step in steps:
+        for dep in step['deps']:
+            if dep not in names:
+                raise ValueError(f"步骤 {step['name']} 依赖不存在的步骤 {dep}")
+
+    visiting, done = set(), set()
+    by_name = {step['name']: step for step in steps}
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"步骤依赖存在环：{' → '.join(path + [name])}")
+        visiting.add(name)
+        for dep in by_name[name]['deps']:
+            visit(dep, path + [name])
+        visiting.discard(name)
+        done.add(name)
+
+    for step in steps:
+        visit(step['name'], [])
+
+
+class Orchestrator:
+    """按依赖关系并发执行步骤"""
+
+    def __init__(self, steps, log_dir=DEFAULT_LOG_DIR):
+        """
+        Args:
+            steps: 步骤列表（见 setup_steps）
+            log_dir: 每个步骤的日志目录
+        """
+        validate_steps(steps)
+        self.steps = {step['name']: dict(step) for step in steps}
+        self.order = [step['name'] for step in steps]
+        self.log_dir = log_dir
+        self.width = max(len(name) for name in self.order)
+        self.print_lock = threading.Lock()
+        self.events = queue.Queue()
+        self.processes = {}
+        self.start_time = None
+        for step in self.steps.values():
+            step['status'] = 'pending' if step['enabled'] else 'skipped'
+            step['start'] = step['end'] = None
+            step['returncode'] = None
+
+    # ==================== 输出 ====================
+    def log(self, message):
+        """打印编排器自身的信息"""
+        with self.print_lock:
+            print(f"[{'orchestrator':<{self.width}}] {message}", flush=True)
+
+    def _stream(self, name, process, log_file):
+        """逐行转发步骤输出（加前缀），同时写入日志文件"""
+        prefix = f"[{name:<{self.width}}] "
+        for raw in iter(process.stdout.readline, b''):
+            line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+            # 进度条用 \r 刷新同一行，只保留最后的状态
+            line = line.rsplit('\r', 1)[-1]
+            log_file.write(line + '\n')
+            log_file.flush()
+            with self.print_lock:
+                print(prefix + line, flush=True)
+        process.stdout.close()
+        log_file.close()
+        returncode = process.wait()
+        maa_trace.end(name, name, returncode=returncode)
+        self.events.put((name, returncode))
+
+    # ==================== 调度 ====================
+    def _ready(self):
+        """依赖都已完成（或被跳过）的待执行步骤"""
+        finished = {name for name, step in self.steps.items() if step['status'] in ('success', 'skipped')}
+        return [
+            name for name in self.order
+            if self.steps[name]['status'] == 'pending' and all(dep in finished for dep in self.steps[name]['deps'])
+        ]
+
+    def _start(self, name):
+        step = self.steps[name]
+        step['status'] = 'running'
+        step['start'] = time.time()
+        self.log(f"▶️  启动 {name}: {step['cmd']}")
+        # 每个步骤一条轨道，步骤脚本内部的 span 也记录在同名轨道上（环境变量 MAA_TRACE_TRACK）
+        maa_trace.begin(name, name, cmd=step['cmd'])
+        log_file = open(os.path.join(self.log_dir, f'{name}.log'), 'w', encoding='utf-8')
+        process = subprocess.Popen(
+            step['cmd'], shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL, start_new_session=True, env=dict(os.environ, MAA_TRACE_TRACK=name)
+        )
+        self.processes[name] = process
+        threading.Thread(target=self._stream, args=(name, process, log_file), daemon=True).start()
+
+    def _skip_dependents(self, failed):
+        """非关键步骤失败时，依赖它的步骤无法执行"""
+        for name in self.order:
+            step = self.steps[name]
+            if step['status'] == 'pending' and failed in step['deps']:
+                step['status'] = 'blocked'
+                self.log(f"⏭️  跳过 {name}（依赖的 {failed} 失败）")
+                self._skip_dependents(name)
+
+    def _terminate_all(self):
+        """终止所有正在运行的步骤（整个进程组）"""
+        running = [name for name, step in self.steps.items() if step['status'] == 'running']
+        for name in running:
+            try:
+                os.killpg(self.processes[name].pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.time() + KILL_TIMEOUT
+        for name in running:
+            process = self.processes[name]
+            try:
+                process.wait(timeout=max(deadline - time.time(), 0.1))
+            except subprocess.TimeoutExpired:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        # 等待输出线程收尾（刚好在终止前完成的步骤仍记为成功）
+        for _ in running:
+            name, returncode = self.events.get()
+            step = self.steps[name]
+            step['end'] = time.time()
+            step['returncode'] = returncode
+            step['status'] = 'success' if returncode == 0 else 'cancelled'
+        for step in self.steps.values():
+            if step['status'] == 'pending':
+                step['status'] = 'cancelled'
+
+    def run(self):
+        """
+        执行所有步骤
+
+        Returns:
+            bool: 关键步骤是否全部成功
+        """
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.start_time = time.time()
+        failed = None
+
+        for name in self._ready():
+            self._start(name)
+
+        while any(step['status'] == 'running' for step in self.steps.values()):
+            name, returncode = self.events.get()
+            step = self.steps[name]
+            step['end'] = time.time()
+            step['returncode'] = returncode
+            duration = step['end'] - step['start']
+
+            if returncode == 0:
+                step['status'] = 'success'
+                self.log(f"✅ {name} 完成（{duration:.0f}s）")
+            elif not step['critical']:
+                step['status'] = 'failed'
+                self.log(f"⚠️  {name} 失败（非关键步骤，退出码 {returncode}，{duration:.0f}s）")
+                self._skip_dependents(name)
+            else:
+                step['status'] = 'failed'
+                self.log(f"❌ {name} 失败（退出码 {returncode}，{duration:.0f}s），终止其它步骤")
+                failed = name
+                self._terminate_all()
+                break
+
+            for ready in self._ready():
+                self._start(ready)
+
+        # 依赖没有满足而永远无法启动的步骤（不应出现，定义已校验过）
+        for step in self.steps.values():
+            if step['status'] == 'pending':
+                step['status'] = 'blocked'
+
+        self.report(failed)
+        return failed is None
+
+    # ==================== 报告 ====================
+    def critical_path(self, last=None):
+        """
+        关键路径：从最后结束的步骤出发，沿着最晚完成的依赖向前回溯
+
+        Args:
+            last: 起点步骤名，默认为最后结束的步骤
+
+        Returns:
+            list: 步骤名（按执行顺序）
+        """
+        timed = {name: step for name, step in self.steps.items() if step['end'] is not None}
+        if not timed:
+            return []
+        if last is None:
+            # 非关键步骤不影响整体是否完成，从最后结束的关键步骤出发
+            critical = [name for name in timed if self.steps[name]['critical']] or list(timed)
+            last = max(critical, key=lambda name: timed[name]['end'])
+        path = [last]
+        while True:
+            deps = [dep for dep in self.steps[path[-1]]['deps'] if dep in timed]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda dep: timed[dep]['end']))
+        return list(reversed(path))
+
+    def report(self, failed=None):
+        """打印耗时报告、关键路径和失败步骤的日志末尾"""
+        icons = {'success': '✅', 'failed': '❌', 'skipped': '⏭️ ', 'blocked': '⏭️ ', 'cancelled': '🛑'}
+        total = time.time() - self.start_time
+        lines = ['', '=' * 50, '📊 环境准备耗时报告', '=' * 50]
+        for name in self.order:
+            step = self.steps[name]
+            icon = icons.get(step['status'], '❓')
+            if step['start'] is not None:
+                offset = step['start'] - self.start_time
+                duration = (step['end'] or time.time()) - step['start']
+                timing = f"+{offset:>4.0f}s 起，耗时 {duration:>4.0f}s"
+            else:
+                timing = '未执行'
+            note = '' if step['critical'] else '（非关键）'
+            lines.append(f"{icon} {name:<{self.width}}  {step['status']:<9} {timing}{note}")
+
+        path = self.critical_path(failed)
+        if path:
+            parts = [f"{name} ({self.steps[name]['end'] - self.steps[name]['start']:.0f}s)" for name in path]
+            lines.append('')
+            lines.append(('🔥 失败路径：' if failed else '🔥 关键路径：') + ' → '.join(parts))
+        busy = sum(step['end'] - step['start'] for step in self.steps.values() if step['end'] is not None)
+        lines.append(f"⏱️  总耗时 {total:.0f}s（各步骤累计 {busy:.0f}s）")
+        lines.append('=' * 50)
+
+        if failed:
+            lines.append(f"📋 {failed} 日志（最后 {FAILURE_TAIL} 行，完整日志见 {self.log_dir}/{failed}.log）：")
+            with open(os.path.join(self.log_dir, f'{failed}.log'), encoding='utf-8', errors='replace') as f:
+                lines.extend('    ' + line.rstrip('\n') for line in f.readlines()[-FAILURE_TAIL:])
+        with self.print_lock:
+            print('\n'.join(lines), flush=True)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="按依赖关系并发执行环境准备步骤")
+    parser.add_argument('--mode', default=os.getenv('MODE', 'auto'), choices=['auto', 'init', 'update'],
+                        help='运行模式')
+    parser.add_argument('--client-type', default=os.getenv('CLIENT_TYPE', 'Official'), help='游戏客户端类型')
+    parser.add_argument('--log-dir', default=DEFAULT_LOG_DIR, help='步骤日志目录')
+    parser.add_argument('--dry-run', action='store_true', help='只显示执行计划')
+    args = parser.parse_args()
+
+    steps = setup_steps(args.mode, args.client_type)
+    try:
+        orchestrator = Orchestrator(steps, args.log_dir)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.dry_run:
+        for step in steps:
+            state = '' if step['enabled'] else '（跳过）'
+            deps = ', '.join(step['deps']) or '无'
+            print(f"{step['name']:<{orchestrator.width}}  依赖: {deps}  命令: {step['cmd']}{state}")
+        return
+
+    if not orchestrator.run():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
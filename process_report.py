@@ -6,6 +6,11 @@ import os
 import time
 from format_summary import format_for_github, format_for_telegram
 
+def instance_label():
+    """多实例模式下报告标题中的实例名（单实例为空）"""
+    instance = os.getenv('MAA_INSTANCE')
+    return f" [{instance}]" if instance else ""
+
 def read_maa_output():
     """读取 MAA 运行输出"""
     # 读取摘要
@@ -49,10 +54,10 @@ def generate_github_summary(data):
     
     with open(github_step_summary, 'w', encoding='utf-8') as f:
         if was_fixed:
-            f.write("# 🎮 MAA 执行报告（经过自动修复）\n\n")
+            f.write(f"# 🎮 MAA 执行报告{instance_label()}（经过自动修复）\n\n")
             f.write("> ⚠️ **注意：** 本次执行经过了一次自动修复（游戏资源更新），总耗时较长\n\n")
         else:
-            f.write("# 🎮 MAA 执行报告\n\n")
+            f.write(f"# 🎮 MAA 执行报告{instance_label()}\n\n")
         if start_date:
             f.write(f"**📅 执行日期:** {start_date}\n\n")
         f.write("---\n\n")
@@ -94,10 +99,10 @@ def generate_telegram_message(data):
 
     # 构建消息标题
     if was_fixed:
-        title = "🎮 MAA 自动化执行报告（经过自动修复）"
+        title = f"🎮 MAA 自动化执行报告{instance_label()}（经过自动修复）"
         fix_notice = "\n⚠️ <b>注意：</b>本次执行经过了一次自动修复（游戏资源更新），总耗时较长\n"
     else:
-        title = "🎮 MAA 自动化执行报告"
+        title = f"🎮 MAA 自动化执行报告{instance_label()}"
         fix_notice = ""
 
     # 构建消息
@@ -4,11 +4,17 @@ import os
 import pathlib
 import time
 import threading
+import signal
 import sys
 
 # 导入 MAA 工具模块
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from maa_utils import clear_fix_flag
+from maa_utils import clear_fix_flag, parse_task_event
+import maa_trace
+from cgroup_sampler import CgroupSampler, print_summary
+from log_archive import ArchiveWriter, FlightRecorder
+import task_plan
+import connection_bench
 
 # 检查是否是修复模式运行（如果是修复后的重跑，不清除标志）
 if os.getenv('MAA_FIX_MODE') != '1':
@@ -18,18 +24,40 @@ if os.getenv('MAA_FIX_MODE') != '1':
 client_type = os.getenv("CLIENT_TYPE")
 # 超时时间（秒），默认2小时，可通过环境变量配置
 timeout_seconds = int(os.getenv("MAA_TIMEOUT", "7200"))  # 默认 7200 秒 = 2 小时
+# 超时检测间隔（秒）
+timeout_check_interval = float(os.getenv("MAA_TIMEOUT_CHECK_INTERVAL", "60"))
+# MAA 可执行文件，压测时替换为 bench/fake_maa.py
+maa_bin = os.getenv("MAA_BIN", "maa")
+
+# MAA 配置目录（maa-cli 同样读取 MAA_CONFIG_DIR，多实例模式下每个实例一个）
+config_dir = os.getenv("MAA_CONFIG_DIR", str(pathlib.Path.home())+'/.config/maa')
 
 # 修改配置文件中的客户端类型
-config = toml.load(str(pathlib.Path.home())+'/.config/maa/tasks/daily.toml')
+config = toml.load(config_dir+'/tasks/daily.toml')
 for i in config['tasks']:
     if 'params' in i:
         if 'client_type' in i['params']:
             i['params']['client_type'] = client_type
-with open(str(pathlib.Path.home())+'/.config/maa/tasks/daily.toml', 'w') as f:
+with open(config_dir+'/tasks/daily.toml', 'w') as f:
     toml.dump(config, f)
 
+# 连接设置：容器镜像变化时重新测量截图和点击方式，把最快的组合写入 profile（MAA_CONNECTION_BENCH=0 关闭，见 connection_bench.py）
+if os.getenv('MAA_CONNECTION_BENCH', '1') != '0':
+    connection_bench.ensure(config_dir)
+    print()
+
+# 任务计划：根据上次运行的结果和当前时间跳过无事可做的任务（MAA_TASK_PLAN=0 关闭，见 task_plan.py）
+# 计划写入 tasks/daily_plan.toml，daily.toml 保持完整
+maa_task = 'daily'
+plan = []
+if os.getenv('MAA_TASK_PLAN', '1') != '0':
+    maa_task, plan = task_plan.write_plan(config_dir, config)
+    task_plan.print_plan(plan)
+    print()
+
 # 运行 MAA
-log = ""
+# 日志按行收集，结束时一次写入（字符串反复拼接在 TRACE 较多时是平方复杂度）
+log_lines = []
 start_time = time.time()  # 记录开始时间
 start_time_str = time.strftime("%Y-%m-%d %H:%M:%S")  # 格式化开始时间
 last_output_time = time.time()
@@ -39,25 +67,62 @@ def check_timeout():
     """检查是否超时的线程函数"""
     global timeout_triggered
     while True:
-        time.sleep(60)  # 每分钟检查一次
+        time.sleep(timeout_check_interval)
         if time.time() - last_output_time > timeout_seconds:
             print(f"\n⚠️ 警告：MAA 已经 {timeout_seconds//3600} 小时没有新的日志输出，可能已卡住")
             print("🛑 正在终止 MAA 进程...")
             timeout_triggered = True
+            maa_trace.instant('timeout', trace_track, seconds=timeout_seconds)
+            if recorder:
+                recorder.incident('卡住', time.time())
+            # MAA 在单独的进程组中运行，整组终止（只终止 shell 的话 MAA 仍占着输出管道）
             try:
-                process.terminate()
+                os.killpg(process.pid, signal.SIGTERM)
                 time.sleep(5)
-                if process.poll() is None:
-                    process.kill()
+                os.killpg(process.pid, signal.SIGKILL)
             except:
                 pass
             break
 
 print(f"⏱️ 超时检测已启动，超时时间：{timeout_seconds//3600} 小时 ({timeout_seconds} 秒)")
-print(f"🔍 日志模式：过滤 TRACE 级别日志（完整日志将保存到 asst.log 文件）\n")
+print(f"🔍 日志模式：过滤 TRACE 级别日志（完整日志将保存到 asst.log 文件和 asst.log.blocks 归档）\n")
+
+# 修复后的重跑放在单独的轨道上
+trace_track = 'maa (fix)' if os.getenv('MAA_FIX_MODE') == '1' else 'maa'
+if os.getenv('MAA_INSTANCE'):
+    trace_track += f" [{os.getenv('MAA_INSTANCE')}]"
+maa_trace.begin('maa run daily', trace_track)
+
+# 采样容器资源（MAA_SAMPLE=0 关闭），样本标记当前任务，用于对照卡顿和资源压力
+sampler = None
+if os.getenv('MAA_SAMPLE', '1') != '0':
+    sample_file = 'resource_samples_fix.csv' if os.getenv('MAA_FIX_MODE') == '1' else 'resource_samples.csv'
+    sampler = CgroupSampler(interval=float(os.getenv('MAA_SAMPLE_INTERVAL', '2')), output=sample_file)
+    if not sampler.start():
+        sampler = None
+
+# 完整日志同时写入分块压缩的归档（带接收时间和索引，可按级别/任务/时间查询，见 log_archive.py）
+# 超时终止时也会保留，用于查看卡住前的日志
+archive = ArchiveWriter('asst_fix.log.blocks' if os.getenv('MAA_FIX_MODE') == '1' else 'asst.log.blocks',
+                        start_time=start_time)
+
+def persist(line, timestamp, event):
+    """日志落盘（asst.log 和归档）"""
+    log_lines.append(line)
+    archive.add(line, timestamp, event)
+
+# 飞行记录器模式（MAA_FLIGHT_RECORDER=缓冲区 MB）：TRACE 只保留在内存中的环形缓冲区，
+# 遇到 ERROR、任务失败或卡住时才写入事发前后的窗口（MAA_FLIGHT_AFTER，默认缓冲区的 1/4），DEBUG 及以上总是保留
+recorder = None
+flight_mb = float(os.getenv('MAA_FLIGHT_RECORDER', '0'))
+if flight_mb > 0:
+    recorder = FlightRecorder(persist, int(flight_mb * 1024 * 1024),
+                              int(float(os.getenv('MAA_FLIGHT_AFTER', flight_mb / 4)) * 1024 * 1024))
+    print(f"🛩️ 飞行记录器已开启：TRACE 缓冲 {flight_mb:g} MB，只在出错或卡住时落盘\n")
 
 # 启动 MAA 进程
-process = subprocess.Popen("maa run daily", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+process = subprocess.Popen(f"{maa_bin} run {maa_task}", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                           start_new_session=True)
 
 # 启动超时检测线程
 timeout_thread = threading.Thread(target=check_timeout, daemon=True)
@@ -67,9 +132,23 @@ timeout_thread.start()
 flag_trace = False
 if process.stderr:
     for line in process.stderr:
-        log += line
         last_output_time = time.time()  # 更新最后输出时间
         
+        # 记录每个任务的耗时（日志中的 "<任务> Start" / "<任务> Completed" 等）
+        task_event = parse_task_event(line)
+        if recorder:
+            recorder.add(line, last_output_time, task_event)
+        else:
+            persist(line, last_output_time, task_event)
+        if task_event:
+            task, event = task_event
+            if event == 'Start':
+                maa_trace.begin(task, trace_track + ' tasks')
+            else:
+                maa_trace.end(task, trace_track + ' tasks', result=event)
+            if sampler:
+                sampler.task = task if event == 'Start' else ''
+        
         # 过滤 TRACE 级别日志
         if '[' in line and ']' in line:
             if 'TRACE' in line[line.find('[')+1:line.find(']')]:
@@ -81,6 +160,21 @@ if process.stderr:
 
 # 等待进程结束
 process.wait()
+archive.close()
+maa_trace.end('maa run daily', trace_track, returncode=process.returncode, timeout=timeout_triggered)
+
+if recorder:
+    stats = recorder.summary()
+    print(f"\n🛩️ 飞行记录器：TRACE 共 {stats['trace_lines']} 行（{stats['trace_bytes'] / 1024 / 1024:.1f} MB），"
+          f"落盘 {stats['kept_lines']} 行，触发 {len(stats['incidents'])} 次")
+    for reason in stats['incidents'][:5]:
+        print(f"   - {reason}")
+
+if sampler:
+    sampler.stop()
+    if sampler.samples:
+        print(f"\n📈 容器资源（{sampler.samples} 个样本，详见 {sampler.output}）：")
+        print_summary(sampler.output)
 
 # 读取 stdout（摘要信息）
 if process.stdout:
@@ -101,9 +195,15 @@ if timeout_triggered:
 # 提取摘要信息
 summary = output[output.find('\n')+1:] if output and '\n' in output else ""
 
+# 更新招募位状态（供下次计划使用），被跳过的任务附在摘要后面
+task_plan.record_run(summary, config, start_time)
+skipped = task_plan.format_skipped(plan)
+if skipped:
+    summary = summary.rstrip('\n') + '\n' + skipped
+
 # 保存日志文件
 with open('asst.log', 'w') as f:
-    f.write(log)
+    f.writelines(log_lines)
 
 # 保存摘要和时间信息
 end_time_str = time.strftime("%Y-%m-%d %H:%M:%S")
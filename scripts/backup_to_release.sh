@@ -10,30 +10,51 @@ source "${SCRIPT_DIR}/common_functions.sh"
 
 # ==================== 配置 ====================
 ENCRYPTION_KEY="${CONTAINER_ENCRYPTION_KEY}"
-SPLIT_SIZE="1900m"  # 每个分卷大小（GitHub Release 限制 2GB）
-SNAPSHOT_PREFIX="snapshot"
+SPLIT_SIZE="1900m"  # 每个分卷大小（GitHub Release 限制 2GB），调优后由 compression_tuner.py 决定
+SNAPSHOT_PREFIX="${SNAPSHOT_PREFIX:-snapshot}"  # 多实例模式为 <实例名>-snapshot
 
-# 压缩级别配置（gzip 级别）
-# 0 = 不压缩（最快，2-3分钟，~12GB）
-# 1 = 最快压缩（推荐，3-5分钟，~10GB）
-# 6 = 标准压缩（5-8分钟，~9GB）
-# 9 = 最大压缩（8-12分钟，~8GB）
+# 压缩配置（多核分块压缩，编码和级别写入帧头供恢复时识别）
+# 默认 zlib 级别 1；编码、级别和分卷大小由 compression_tuner.py 在本机实测后选择：
+# 抽样测量各编码/级别的压缩速度、压缩率和解压速度，结合上次实测的上传/下载带宽，
+# 选出 备份 + 上传 + 恢复 总耗时最短的设置，保存在 maa_state/compression.json
+# TUNE_COMPRESSION=auto（默认）时没有结果或超过 COMPRESSION_RETUNE_DAYS 天重新测量，force 强制测量，off 使用默认值
+COMPRESSION_CODEC="zlib"
 COMPRESSION_LEVEL="1"
+TUNE_COMPRESSION="${TUNE_COMPRESSION:-auto}"
+COMPRESSION_RETUNE_DAYS="${COMPRESSION_RETUNE_DAYS:-7}"
+BLOCK_COMPRESS="python3 block_compress.py"  # 多核分块压缩（见 block_compress.py）
+COMPRESSION_TUNER="python3 compression_tuner.py"  # 压缩设置调优（见 compression_tuner.py）
+SNAPSHOT_CRYPTO="python3 snapshot_crypto.py"  # 分块 AES-256-GCM 加密 + 签名清单（见 snapshot_crypto.py）
+MANIFEST_FILE="container.manifest.json"
+GITHUB_RELEASES="python3 github_releases.py"  # Releases API 客户端（并发上传、批量清理，见 github_releases.py）
+STREAM_BACKUP="python3 stream_backup.py"  # 边加密边上传（见 stream_backup.py）
+
+# 备份模式
+# pipelined = 流水线（默认）：每写完一个分卷就开始上传，同时生成下一个分卷，磁盘上最多保留几个分卷
+# file      = 传统模式：先生成全部分卷，再统一上传
+BACKUP_MODE="${BACKUP_MODE:-pipelined}"
+UPLOAD_WORKERS=2  # 并发上传数
+PARTS_IN_FLIGHT=3  # 流水线模式下已生成、未上传完成的分卷数上限
+KEEP_COUNT=2  # 保留最近几个 release
 
 # ==================== 检查依赖 ====================
 check_dependencies() {
     log_info "检查依赖..."
     
     # 检查必需工具（Ubuntu 自带）
-    for cmd in tar gzip openssl split; do
+    for cmd in tar python3; do
         if ! command -v $cmd &> /dev/null; then
             log_error "未找到 $cmd 命令"
             exit 1
         fi
     done
     
-    # 检查 gh (GitHub CLI)
-    check_command gh "sudo apt update > /dev/null 2>&1 && sudo apt install -y gh > /dev/null 2>&1"
+    for file in block_compress.py compression_tuner.py snapshot_crypto.py github_releases.py stream_backup.py; do
+        if [ ! -f "$file" ]; then
+            log_error "未找到 $file（请在仓库根目录运行）"
+            exit 1
+        fi
+    done
     
     log_success "依赖检查完成"
 }
@@ -56,68 +77,87 @@ check_encryption_key() {
 check_required_files() {
     log_info "检查必需文件..."
     
-    if [ ! -f "ark.tar" ]; then
-        log_error "未找到 ark.tar 文件"
+    # 镜像文件：增量导出的 ark.delta.tar 优先，否则为完整的 ark.tar
+    if [ -f "ark.delta.tar" ]; then
+        IMAGE_FILE="ark.delta.tar"
+    elif [ -f "ark.tar" ]; then
+        IMAGE_FILE="ark.tar"
+    else
+        log_error "未找到 ark.tar 或 ark.delta.tar 文件"
         exit 1
     fi
     
-    if [ ! -f "data.tar" ]; then
-        log_error "未找到 data.tar 文件"
+    # 数据：数据卷镜像 data.img 优先（稀疏文件，打包时 tar -S 跳过空洞），否则为旧的 data.tar
+    if [ -f "$DATA_IMG" ]; then
+        DATA_FILE="$DATA_IMG"
+    elif [ -f "data.tar" ]; then
+        DATA_FILE="data.tar"
+    else
+        log_error "未找到 $DATA_IMG 或 data.tar 文件"
         exit 1
     fi
     
     # 显示文件大小
-    ARK_SIZE=$(du -h ark.tar | cut -f1)
-    DATA_SIZE=$(du -h data.tar | cut -f1)
-    log_info "ark.tar: $ARK_SIZE"
-    log_info "data.tar: $DATA_SIZE"
+    ARK_SIZE=$(du -h "$IMAGE_FILE" | cut -f1)
+    DATA_SIZE=$(du -h "$DATA_FILE" | cut -f1)
+    log_info "$IMAGE_FILE: $ARK_SIZE"
+    log_info "$DATA_FILE: $DATA_SIZE"
     
     log_success "文件检查完成"
 }
 
+# ==================== 选择压缩设置 ====================
+select_compression() {
+    if [ "$TUNE_COMPRESSION" = "off" ]; then
+        log_info "压缩调优已关闭，使用默认设置"
+        return
+    fi
+    
+    if [ "$TUNE_COMPRESSION" = "force" ] || ! $COMPRESSION_TUNER check --max-age "$COMPRESSION_RETUNE_DAYS"; then
+        log_info "测量压缩设置（抽样 $IMAGE_FILE 和 $DATA_FILE）..."
+        if ! $COMPRESSION_TUNER tune "$IMAGE_FILE" "$DATA_FILE" \
+               --uploads "$UPLOAD_WORKERS" --mode "$BACKUP_MODE"; then
+            log_warning "压缩调优失败，使用之前的结果或默认设置"
+        fi
+    fi
+    
+    read -r COMPRESSION_CODEC COMPRESSION_LEVEL SPLIT_SIZE < <($COMPRESSION_TUNER get)
+    log_success "压缩设置：$COMPRESSION_CODEC 级别 $COMPRESSION_LEVEL，分卷 $SPLIT_SIZE"
+}
+
 # ==================== 压缩 + 加密 + 分卷 ====================
 compress_and_encrypt() {
     log_info "开始压缩、加密和分卷..."
     
     # 清理旧的分卷文件
-    rm -f container.enc.* 2>/dev/null || true
+    rm -f container.enc.* "$MANIFEST_FILE" 2>/dev/null || true
     
     # 显示原始大小
-    ORIGINAL_SIZE=$(du -ch ark.tar data.tar | tail -1 | cut -f1)
+    ORIGINAL_SIZE=$(du -ch "$IMAGE_FILE" "$DATA_FILE" | tail -1 | cut -f1)
     log_info "原始大小: $ORIGINAL_SIZE"
-    log_info "压缩级别: $COMPRESSION_LEVEL, 分卷大小: $SPLIT_SIZE"
+    log_info "压缩: $COMPRESSION_CODEC 级别 $COMPRESSION_LEVEL, 分卷大小: $SPLIT_SIZE"
     
-    # tar → gzip → openssl → split（流式处理）
+    # tar → 分块压缩 → 分块加密 + 分卷（流式处理）
+    # 分块压缩和加密都使用所有 CPU 核心；级别 0 时只分帧不压缩
+    # 每个加密块独立认证，清单记录每个分卷和块的哈希，恢复时可逐个分卷校验
     log_info "正在处理（这可能需要 3-6 分钟）..."
-    
-    # 根据压缩级别选择处理方式
-    if [ "$COMPRESSION_LEVEL" = "0" ]; then
-        # 压缩级别 0：不压缩，直接 tar → openssl → split
-        log_info "使用无压缩模式（最快）"
-        if tar -cf - ark.tar data.tar | \
-           openssl enc -aes-256-cbc -salt -pbkdf2 -iter 100000 -pass pass:"$ENCRYPTION_KEY" | \
-           split -b "$SPLIT_SIZE" -d -a 3 - container.enc.; then
-            log_success "加密和分卷完成"
-        else
-            log_error "处理失败"
-            exit 1
-        fi
+    log_info "使用多核分块压缩（$COMPRESSION_CODEC 级别 $COMPRESSION_LEVEL，$(nproc) 线程）"
+    
+    set -o pipefail
+    if tar -Scf - "$IMAGE_FILE" "$DATA_FILE" | \
+       $BLOCK_COMPRESS compress --codec "$COMPRESSION_CODEC" --level "$COMPRESSION_LEVEL" | \
+       CONTAINER_ENCRYPTION_KEY="$ENCRYPTION_KEY" $SNAPSHOT_CRYPTO seal \
+           --prefix container.enc. --part-size "$SPLIT_SIZE" --manifest "$MANIFEST_FILE"; then
+        set +o pipefail
+        log_success "压缩、加密和分卷完成"
     else
-        # 压缩级别 1-9：tar → gzip → openssl → split
-        log_info "使用 gzip 压缩（级别 $COMPRESSION_LEVEL）"
-        if tar -cf - ark.tar data.tar | \
-           gzip -$COMPRESSION_LEVEL | \
-           openssl enc -aes-256-cbc -salt -pbkdf2 -iter 100000 -pass pass:"$ENCRYPTION_KEY" | \
-           split -b "$SPLIT_SIZE" -d -a 3 - container.enc.; then
-            log_success "压缩、加密和分卷完成"
-        else
-            log_error "处理失败"
-            exit 1
-        fi
+        set +o pipefail
+        log_error "处理失败"
+        exit 1
     fi
     
     # 检查是否生成了分卷文件
-    if [ ! -f "container.enc.000" ]; then
+    if [ ! -f "container.enc.000" ] || [ ! -f "$MANIFEST_FILE" ]; then
         log_error "分卷失败，未生成文件"
         exit 1
     fi
@@ -129,7 +169,7 @@ compress_and_encrypt() {
     log_success "完成：生成 $PART_COUNT 个分卷，总大小 $FINAL_SIZE"
     
     # 显示压缩率
-    ORIGINAL_BYTES=$(du -cb ark.tar data.tar | tail -1 | cut -f1)
+    ORIGINAL_BYTES=$(du -c --block-size=1 "$IMAGE_FILE" "$DATA_FILE" | tail -1 | cut -f1)
     FINAL_BYTES=$(du -cb container.enc.* | tail -1 | cut -f1)
     if [ "$ORIGINAL_BYTES" -gt 0 ]; then
         COMPRESSION_RATIO=$(awk "BEGIN {printf \"%.1f\", (1 - $FINAL_BYTES / $ORIGINAL_BYTES) * 100}")
@@ -148,6 +188,54 @@ generate_release_tag() {
     echo "$RELEASE_TAG"
 }
 
+# ==================== Release 标题和说明 ====================
+release_title() {
+    echo "Container Snapshot $(date -u +%Y-%m-%d\ %H:%M) UTC"
+}
+
+# 用法：release_notes <分卷数> <总大小>
+release_notes() {
+    echo "Automated container backup
+
+📦 Files: $1 parts
+💾 Total size: $2
+🗜️ Compression: block ${COMPRESSION_CODEC} level ${COMPRESSION_LEVEL}
+🔒 Encryption: AES-256-GCM per chunk + signed manifest
+⏰ Created: $(date -u +%Y-%m-%d\ %H:%M:%S) UTC"
+}
+
+# ==================== 流水线：压缩 + 加密 + 分卷 + 上传 ====================
+compress_encrypt_upload() {
+    log_info "开始流水线备份（压缩、加密的同时上传）..."
+    
+    rm -f container.enc.* "$MANIFEST_FILE" 2>/dev/null || true
+    
+    RELEASE_TAG=$(generate_release_tag)
+    log_info "Release 标签：$RELEASE_TAG"
+    
+    ORIGINAL_SIZE=$(du -ch "$IMAGE_FILE" "$DATA_FILE" | tail -1 | cut -f1)
+    log_info "原始大小: $ORIGINAL_SIZE"
+    log_info "压缩: $COMPRESSION_CODEC 级别 $COMPRESSION_LEVEL, 分卷大小: $SPLIT_SIZE"
+    log_info "并发上传: $UPLOAD_WORKERS, 磁盘上最多 $PARTS_IN_FLIGHT 个待上传分卷"
+    
+    # tar → 分块压缩 → 分块加密 + 分卷 → 上传线程池
+    # 每个分卷写完立即开始上传，上传完成后删除；分卷堆积时会反压暂停压缩
+    # 全部完成后上传签名清单，再发布草稿 Release（{parts}/{size} 由 stream_backup.py 填入）
+    set -o pipefail
+    if tar -Scf - "$IMAGE_FILE" "$DATA_FILE" | \
+       $BLOCK_COMPRESS compress --codec "$COMPRESSION_CODEC" --level "$COMPRESSION_LEVEL" | \
+       CONTAINER_ENCRYPTION_KEY="$ENCRYPTION_KEY" $STREAM_BACKUP "$RELEASE_TAG" \
+           --part-size "$SPLIT_SIZE" --uploads "$UPLOAD_WORKERS" --in-flight "$PARTS_IN_FLIGHT" \
+           --title "$(release_title)" --notes "$(release_notes "{parts}" "{size}")"; then
+        set +o pipefail
+        log_success "上传完成：$RELEASE_TAG"
+    else
+        set +o pipefail
+        log_error "流水线备份失败（未发布的草稿会在下次清理时删除）"
+        exit 1
+    fi
+}
+
 # ==================== 上传到 GitHub Release ====================
 upload_to_release() {
     log_info "准备上传到 GitHub Release..."
@@ -155,23 +243,13 @@ upload_to_release() {
     RELEASE_TAG=$(generate_release_tag)
     log_info "Release 标签：$RELEASE_TAG"
     
-    # 检查 Release 是否已存在
-    if gh release view "$RELEASE_TAG" &>/dev/null; then
-        log_warning "Release $RELEASE_TAG 已存在，将删除后重新创建"
-        gh release delete "$RELEASE_TAG" -y
-    fi
-    
-    # 创建 Release 并上传文件
+    # 先创建草稿 Release，并发上传所有分卷（单个分卷失败时单独重试），全部完成后再发布
+    # 同名 Release 已存在时会先删除；重新运行时内容相同（SHA-256 一致）的分卷会被跳过
     log_info "创建 Release 并上传文件..."
-    gh release create "$RELEASE_TAG" \
-        container.enc.* \
-        --title "Container Snapshot $(date -u +%Y-%m-%d\ %H:%M) UTC" \
-        --notes "Automated container backup
-
-📦 Files: $(ls container.enc.* | wc -l) parts
-💾 Total size: $(du -ch container.enc.* | tail -1 | cut -f1)
-🔒 Encryption: OpenSSL AES-256-CBC
-⏰ Created: $(date -u +%Y-%m-%d\ %H:%M:%S) UTC"
+    $GITHUB_RELEASES -j "$UPLOAD_WORKERS" upload "$RELEASE_TAG" \
+        container.enc.* "$MANIFEST_FILE" \
+        --title "$(release_title)" \
+        --notes "$(release_notes "$(ls container.enc.* | wc -l)" "$(du -ch container.enc.* | tail -1 | cut -f1)")"
     
     log_success "上传完成：$RELEASE_TAG"
 }
@@ -180,167 +258,27 @@ upload_to_release() {
 cleanup_temp_files() {
     log_info "清理临时文件..."
     
-    rm -f container.enc.* 2>/dev/null || true
+    rm -f container.enc.* "$MANIFEST_FILE" 2>/dev/null || true
     
     log_success "清理完成"
 }
 
-# ==================== 清理旧版本 ====================
+# ==================== 清理旧版本和残留的 tag ====================
 cleanup_old_releases() {
-    log_info "清理旧版本（保留最近 2 个）..."
+    log_info "清理旧版本（保留最近 $KEEP_COUNT 个）和残留的 tag..."
     
-    # 使用公共函数获取所有 Release
+    # 一次分页获取所有 Release，并发删除旧版本（含 tag）、未发布的草稿和孤立 tag
     set +e
-    RELEASES=$(list_snapshot_releases "$SNAPSHOT_PREFIX" false)
+    $GITHUB_RELEASES cleanup --prefix "$SNAPSHOT_PREFIX" --keep "$KEEP_COUNT"
     local exit_code=$?
     set -e
     
     if [ $exit_code -ne 0 ]; then
-        log_info "没有需要清理的 Release"
-        return
-    fi
-    
-    TOTAL_COUNT=$(echo "$RELEASES" | wc -l)
-    KEEP_COUNT=2
-    
-    log_info "找到 $TOTAL_COUNT 个 snapshot Release"
-    
-    # 如果总数小于等于保留数量，不需要清理
-    if [ "$TOTAL_COUNT" -le "$KEEP_COUNT" ]; then
-        log_info "当前只有 $TOTAL_COUNT 个 Release，无需清理"
-        return
-    fi
-    
-    # 计算需要删除的数量
-    DELETE_COUNT=$((TOTAL_COUNT - KEEP_COUNT))
-    log_warning "将删除 $DELETE_COUNT 个旧版本"
-    
-    # 获取需要删除的旧版本（跳过最新的 KEEP_COUNT 个）
-    OLD_RELEASES=$(echo "$RELEASES" | tail -n +"$((KEEP_COUNT + 1))")
-    
-    # 删除旧版本
-    DELETED_COUNT=0
-    HAS_FAILURE=0
-    
-    # 禁用 set -e：删除操作可能失败，需要捕获错误信息并继续处理
-    set +e
-    
-    echo "$OLD_RELEASES" | while read -r tag; do
-        [ -n "$tag" ] && {
-            log_info "删除旧版本：$tag"
-            
-            # 捕获错误输出
-            ERROR_OUTPUT=$(gh release delete "$tag" -y --cleanup-tag 2>&1)
-            EXIT_CODE=$?
-            
-            if [ $EXIT_CODE -eq 0 ]; then
-                log_success "已删除：$tag (包括 tag)"
-                DELETED_COUNT=$((DELETED_COUNT + 1))
-            else
-                log_error "删除失败：$tag"
-                log_error "错误信息：$ERROR_OUTPUT"
-                HAS_FAILURE=1
-            fi
-        }
-    done
-    
-    # 恢复 set -e
-    set -e
-    
-    if [ $HAS_FAILURE -eq 1 ]; then
-        log_warning "部分 release 删除失败，将尝试清理残留的 tag"
-    else
-        log_success "旧版本清理完成"
-    fi
-}
-
-# ==================== 清理残留的 tag ====================
-cleanup_orphaned_tags() {
-    log_info "检查残留的 tag..."
-    
-    # 获取所有 snapshot 开头的 tag
-    set +e
-    ALL_TAGS=$(git ls-remote --tags origin 2>&1 | grep "refs/tags/${SNAPSHOT_PREFIX}-" | awk -F'/' '{print $3}' | sed 's/\^{}//')
-    set -e
-    
-    if [ -z "$ALL_TAGS" ]; then
-        log_info "没有找到任何 ${SNAPSHOT_PREFIX} tag"
-        return
-    fi
-    
-    # 获取所有 release 的 tag
-    set +e
-    RELEASE_TAGS=$(list_snapshot_releases "$SNAPSHOT_PREFIX" false)
-    set -e
-    
-    # 找出没有对应 release 的 tag（孤立 tag）
-    ORPHANED_TAGS=""
-    while read -r tag; do
-        [ -n "$tag" ] && {
-            if ! echo "$RELEASE_TAGS" | grep -q "^${tag}$"; then
-                ORPHANED_TAGS="${ORPHANED_TAGS}${tag}\n"
-            fi
-        }
-    done <<< "$ALL_TAGS"
-    
-    if [ -z "$ORPHANED_TAGS" ]; then
-        log_info "没有残留的 tag"
-        return
-    fi
-    
-    # 计算有多少个孤立 tag
-    ORPHANED_COUNT=$(echo -e "$ORPHANED_TAGS" | grep -v '^$' | wc -l)
-    
-    log_warning "发现 $ORPHANED_COUNT 个孤立 tag（没有对应的 release）"
-    log_warning "孤立 tag 列表："
-    
-    # 禁用 set -e：管道操作可能失败导致脚本退出
-    set +e
-    echo -e "$ORPHANED_TAGS" | grep -v '^$' | while read -r tag; do
-        [ -n "$tag" ] && log_warning "  - $tag"
-    done
-    set -e
-    
-    echo ""
-    
-    # 删除孤立的 tag
-    log_info "开始删除残留 tag..."
-    DELETED_TAG_COUNT=0
-    HAS_FAILURE=0
-    
-    # 禁用 set -e：删除操作可能失败，需要捕获错误信息并继续处理
-    set +e
-    
-    # 使用 while read 从 here-string 读取，避免管道导致的子 shell 问题
-    while IFS= read -r tag; do
-        if [ -n "$tag" ]; then
-            log_info "准备删除 tag：$tag"
-            
-            # 捕获错误输出
-            ERROR_OUTPUT=$(git push origin --delete "refs/tags/${tag}" 2>&1)
-            EXIT_CODE=$?
-            
-            if [ $EXIT_CODE -eq 0 ]; then
-                log_success "已删除 tag：$tag"
-                DELETED_TAG_COUNT=$((DELETED_TAG_COUNT + 1))
-            else
-                log_error "删除 tag 失败：$tag"
-                log_error "错误信息：$ERROR_OUTPUT"
-                HAS_FAILURE=1
-            fi
-        fi
-    done <<< "$(echo -e "$ORPHANED_TAGS" | grep -v '^$')"
-    
-    # 恢复 set -e
-    set -e
-    
-    # 检查是否有失败
-    if [ $HAS_FAILURE -eq 1 ]; then
-        log_error "部分 tag 删除失败，请查看上面的错误信息"
+        log_error "部分 release 或 tag 删除失败，请查看上面的错误信息"
         return 1
     fi
     
-    log_success "tag 清理完成，已删除 $DELETED_TAG_COUNT 个残留 tag"
+    log_success "旧版本清理完成"
 }
 
 # ==================== 主函数 ====================
@@ -360,20 +298,35 @@ main() {
     # 3. 检查必需文件
     check_required_files
     
-    # 4. 压缩 + 加密 + 分卷
-    compress_and_encrypt
+    # 选择压缩设置（必要时重新测量）
+    trace_begin "tune compression" backup
+    select_compression
+    trace_end "tune compression" backup
     
-    # 5. 上传到 Release
-    upload_to_release
+    if [ "$BACKUP_MODE" = "pipelined" ]; then
+        # 4-5. 压缩 + 加密 + 分卷，同时上传
+        trace_begin "compress + encrypt + upload" backup
+        compress_encrypt_upload
+        trace_end "compress + encrypt + upload" backup
+    else
+        # 4. 压缩 + 加密 + 分卷
+        trace_begin "compress + encrypt" backup
+        compress_and_encrypt
+        trace_end "compress + encrypt" backup
+        
+        # 5. 上传到 Release
+        trace_begin "upload" backup
+        upload_to_release
+        trace_end "upload" backup
+    fi
     
     # 6. 清理临时文件
     cleanup_temp_files
     
-    # 7. 清理旧版本
+    # 7. 清理旧版本和残留的 tag
+    trace_begin "cleanup releases" backup
     cleanup_old_releases
-    
-    # 8. 清理残留的 tag
-    cleanup_orphaned_tags
+    trace_end "cleanup releases" backup
     
     echo ""
     log_success "=========================================="
@@ -25,6 +25,155 @@ log_error() {
     echo -e "${RED}❌ $1${NC}"
 }
 
+# ==================== 实例参数 ====================
+# 单实例使用默认值；多实例模式下由 multi_instance.py 为每个实例设置
+REDROID_NAME="${REDROID_NAME:-redroid}"       # 容器名
+ADB_DEVICE="${ADB_DEVICE:-127.0.0.1:5555}"    # ADB 地址
+ARK_IMAGE="${ARK_IMAGE:-ark}"                 # docker commit 保存的镜像名
+
+# ==================== 数据卷镜像 ====================
+# /data 保存为一个稀疏 ext4 镜像 data.img，loop 挂载到 ./data 后直接映射进容器
+# 备份/恢复只需顺序读写一个文件，不再逐个打包/解包几万个小文件
+# DATA_FORMAT=tar 时仍使用旧的 data.tar（逐文件打包）
+DATA_FORMAT="${DATA_FORMAT:-img}"
+DATA_IMG="${DATA_IMG:-data.img}"
+DATA_IMG_SIZE="${DATA_IMG_SIZE:-16G}"  # 镜像的最大容量（稀疏文件，只占用实际写入的空间）
+
+# 用法：create_data_image [源目录]
+# 创建数据卷镜像；指定源目录时把目录内容（含属主和权限）写入镜像
+create_data_image() {
+    local source_dir="$1"
+    sudo rm -f "$DATA_IMG"
+    if [ -n "$source_dir" ]; then
+        sudo mke2fs -q -t ext4 -F -m 0 -d "$source_dir" "$DATA_IMG" "$DATA_IMG_SIZE" > /dev/null || return 1
+    else
+        sudo mke2fs -q -t ext4 -F -m 0 "$DATA_IMG" "$DATA_IMG_SIZE" > /dev/null || return 1
+    fi
+    sudo chown "$(id -u):$(id -g)" "$DATA_IMG"
+}
+
+# 用法：mount_data_image
+# 检查文件系统，镜像小于 DATA_IMG_SIZE 时先扩容，再挂载到 ./data
+mount_data_image() {
+    if mountpoint -q data 2>/dev/null; then
+        return 0
+    fi
+
+    # e2fsck 退出码 0/1 表示没有错误或已修复
+    local status=0
+    sudo e2fsck -p "$DATA_IMG" > /dev/null 2>&1 || status=$?
+    if [ $status -gt 1 ]; then
+        log_error "$DATA_IMG 文件系统检查失败（e2fsck 退出码 $status）"
+        return 1
+    fi
+
+    local current target
+    current=$(stat -c %s "$DATA_IMG")
+    target=$(numfmt --from=iec "$DATA_IMG_SIZE")
+    if [ "$current" -lt "$target" ]; then
+        log_info "扩容 $DATA_IMG 到 $DATA_IMG_SIZE..."
+        truncate -s "$DATA_IMG_SIZE" "$DATA_IMG"
+        sudo e2fsck -fp "$DATA_IMG" > /dev/null 2>&1 || true
+        sudo resize2fs "$DATA_IMG" > /dev/null 2>&1 || log_warning "$DATA_IMG 扩容失败，继续使用原大小"
+    fi
+
+    sudo mkdir -p data
+    sudo mount -o loop "$DATA_IMG" data
+}
+
+# 用法：unmount_data_image
+# 卸载前 fstrim 把已删除文件的块还给宿主（镜像保持稀疏，备份时不会读到这些块）
+unmount_data_image() {
+    if ! mountpoint -q data 2>/dev/null; then
+        return 0
+    fi
+    sudo fstrim data > /dev/null 2>&1 || true
+    sudo umount data && sudo rmdir data
+}
+
+# ==================== 重新连接 ADB ====================
+# 用法：adb_reconnect
+# 单实例时重启 adb server；多实例共用一个 adb server，只断开重连自己的设备
+adb_reconnect() {
+    if [ -n "$MAA_INSTANCE" ]; then
+        adb disconnect "$ADB_DEVICE" > /dev/null 2>&1
+    else
+        adb kill-server > /dev/null 2>&1
+    fi
+    adb connect "$ADB_DEVICE" > /dev/null 2>&1
+}
+
+# ==================== 等待 Android 启动 ====================
+# 用法：wait_for_boot [最大尝试次数]
+# 每秒检查一次 sys.boot_completed；容器停止或超时时打印诊断信息并返回 1
+wait_for_boot() {
+    local max_attempts="${1:-180}"
+    local attempt=0
+
+    echo ""
+    echo "⏳ 等待 Android 系统启动（最多 ${max_attempts} 次尝试）..."
+    echo "   提示：首次启动可能需要 1-2 分钟"
+    echo ""
+    trace_begin "android boot"
+
+    while [[ $attempt -lt $max_attempts ]]; do
+        # 每次循环都重新连接 ADB（这是必要的，因为 redroid 的 ADB 守护进程是异步初始化的）
+        adb_reconnect
+
+        # 检查容器是否还在运行
+        if ! docker ps --format '{{.Names}}' | grep -qx "$REDROID_NAME"; then
+            echo ""
+            echo "❌ Docker 容器已停止运行"
+            echo "📋 容器日志："
+            docker logs "$REDROID_NAME" 2>&1 | tail -20
+            return 1
+        fi
+
+        # 检查 Android 系统是否启动完成
+        BOOT_STATUS=$(adb -s "$ADB_DEVICE" shell getprop sys.boot_completed 2>/dev/null || echo "0")
+
+        if [[ "$BOOT_STATUS" == "1" ]]; then
+            echo ""
+            echo "✅ Android 容器已就绪（尝试 ${attempt} 次，约 ${attempt} 秒）"
+            echo ""
+            trace_end "android boot"
+
+            # 显示 Android 版本信息
+            ANDROID_VERSION=$(adb -s "$ADB_DEVICE" shell getprop ro.build.version.release 2>/dev/null || echo "未知")
+            echo "📱 Android 版本: ${ANDROID_VERSION}"
+            echo ""
+            return 0
+        fi
+
+        # 每 10 次尝试显示一次进度（约每 10 秒）
+        if [ $((attempt % 10)) -eq 0 ] && [ $attempt -gt 0 ]; then
+            echo "   ⏳ 已尝试 ${attempt}/${max_attempts} 次（约 ${attempt} 秒）..."
+
+            # 显示调试信息
+            if [ $((attempt % 30)) -eq 0 ]; then
+                echo "   🔍 调试信息："
+                echo "      - 容器状态: $(docker ps --filter "name=^${REDROID_NAME}\$" --format '{{.Status}}' 2>/dev/null || echo '未知')"
+                echo "      - ADB 连接: $(adb devices 2>/dev/null | grep "$ADB_DEVICE" || echo '未连接')"
+                echo "      - boot_completed: ${BOOT_STATUS}"
+            fi
+        fi
+
+        attempt=$((attempt + 1))
+        sleep 1
+    done
+
+    echo ""
+    echo "❌ 容器启动超时（超过 ${max_attempts} 次尝试）"
+    echo ""
+    echo "📋 最终状态："
+    echo "   - 容器状态: $(docker ps --filter "name=^${REDROID_NAME}\$" --format '{{.Status}}' 2>/dev/null || echo '未知')"
+    echo "   - ADB 设备: $(adb devices 2>/dev/null | grep -v 'List of devices' || echo '无设备')"
+    echo ""
+    echo "📋 容器日志（最后 30 行）："
+    docker logs "$REDROID_NAME" 2>&1 | tail -30
+    return 1
+}
+
 # ==================== 列出所有 snapshot Release ====================
 # 用法：list_snapshot_releases [SNAPSHOT_PREFIX] [DEBUG]
 # 参数：
@@ -37,29 +186,16 @@ list_snapshot_releases() {
     local prefix="${1:-snapshot}"
     local debug="${2:-false}"
     
-    if [ "$debug" = "true" ]; then
-        log_info "获取所有 ${prefix} Release..." >&2
-        log_info "调试：列出所有 releases..." >&2
-        echo "--- gh release list 输出 (前10个) ---" >&2
-        gh release list --limit 10 2>&1 | head -10 >&2 || {
-            log_error "gh release list 命令失败" >&2
-            return 1
-        }
-        echo "--- 输出结束 ---" >&2
-        echo "" >&2
-    fi
-    
-    # 🔧 关键：使用 tab 作为分隔符，tag 在第 3 列
+    # 通过 Releases API 分页获取全部 Release（不受 gh release list --limit 限制，草稿不计入）
+    local releases
     set +e
-    local releases=$(gh release list --limit 100 2>&1 | awk -F'\t' '{print $3}' | grep "^${prefix}-")
-    local grep_exit=$?
+    releases=$(python3 github_releases.py list --prefix "$prefix")
+    local list_exit=$?
     set -e
     
-    if [ $grep_exit -ne 0 ] || [ -z "$releases" ]; then
+    if [ $list_exit -ne 0 ] || [ -z "$releases" ]; then
         if [ "$debug" = "true" ]; then
             log_info "未找到任何 ${prefix} Release" >&2
-            log_info "所有 release tags:" >&2
-            gh release list --limit 100 2>&1 | awk -F'\t' '{print "  - " $3}' >&2 || echo "  (无法列出)" >&2
         fi
         return 1
     fi
@@ -102,6 +238,19 @@ get_latest_snapshot_release() {
     echo "$releases" | head -1
 }
 
+# ==================== 耗时追踪 ====================
+# 用法：trace_begin <名称> [轨道]
+#       trace_end <名称> [轨道]
+# 轨道默认为编排器设置的 MAA_TRACE_TRACK（步骤名），见 maa_trace.py
+# 追踪失败（如 maa_trace.py 不在当前目录）不影响脚本执行
+trace_begin() {
+    python3 maa_trace.py begin "$1" --track "${2:-${MAA_TRACE_TRACK:-main}}" > /dev/null 2>&1 || true
+}
+
+trace_end() {
+    python3 maa_trace.py end "$1" --track "${2:-${MAA_TRACE_TRACK:-main}}" > /dev/null 2>&1 || true
+}
+
 # ==================== 检查依赖 ====================
 # 用法：check_command <command_name> [install_command]
 # 参数：
@@ -1,14 +1,24 @@
 #!/bin/bash
 # 容器导出脚本
 
+# ==================== 加载公共函数 ====================
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+source "${SCRIPT_DIR}/common_functions.sh"
+
+# 导出模式
+# delta = 增量导出（默认）：保留基础镜像层不合并，只保存 docker commit 产生的改动层到 ark.delta.tar
+#         恢复时拉取/使用缓存的基础镜像再合并，快照体积和导出、上传、加载时间都更少
+# full  = 完整导出：docker-squash 合并所有层后 docker save 到 ark.tar
+EXPORT_MODE="${EXPORT_MODE:-delta}"
+BASE_IMAGE="redroid/redroid:11.0.0-latest"
+
 echo "🔒 保存容器状态..."
 echo ""
 
 # 卸载游戏（保留数据）
 echo "📱 [1/6] 卸载游戏（保留数据）..."
-adb kill-server > /dev/null 2>&1
-adb connect 127.0.0.1:5555 > /dev/null 2>&1
-if adb -s 127.0.0.1:5555 shell cmd package uninstall -k com.hypergryph.arknights > /dev/null 2>&1; then
+adb_reconnect
+if adb -s "$ADB_DEVICE" shell cmd package uninstall -k com.hypergryph.arknights > /dev/null 2>&1; then
     echo "✅ 游戏已卸载（数据已保留）"
 else
     echo "ℹ️  游戏可能未安装或已卸载"
@@ -16,57 +26,133 @@ fi
 
 # 停止并提交容器
 echo "🐳 [2/6] 停止 Docker 容器..."
-if docker stop redroid > /dev/null 2>&1; then
+if docker stop "$REDROID_NAME" > /dev/null 2>&1; then
     echo "✅ 容器已停止"
 else
     echo "⚠️  容器停止失败（可能未运行）"
 fi
 
 echo "💾 [3/6] 提交容器更改（这可能需要 10-30 秒）..."
-if docker commit redroid ark > /dev/null 2>&1; then
+trace_begin "docker commit" export
+if docker commit "$REDROID_NAME" "$ARK_IMAGE" > /dev/null 2>&1; then
     echo "✅ 容器更改已提交"
 else
     echo "❌ 容器提交失败"
     exit 1
 fi
 
-docker rm redroid > /dev/null 2>&1
-docker rmi redroid/redroid:11.0.0-latest 2>/dev/null || :
+trace_end "docker commit" export
+docker rm "$REDROID_NAME" > /dev/null 2>&1
+rm -f ./ark.tar ./ark.delta.tar 2>/dev/null || true
 
-# 优化容器镜像
-echo "🗜️  [4/6] 优化容器镜像（合并镜像层，这可能需要 1-2 分钟）..."
-if docker-squash -t ark ark > /dev/null 2>&1; then
-    echo "✅ 容器镜像已优化"
-else
-    echo "⚠️  容器优化失败（将使用未优化版本）"
+# 增量导出：只保存基础镜像之外的改动层
+if [[ "$EXPORT_MODE" == "delta" ]]; then
+    # 只合并基础镜像之上的改动层（每次 commit 都会新增一层，不合并会越积越多）
+    echo "🗜️  [4/6] 合并改动层（保留基础镜像层）..."
+    trace_begin "docker-squash" export
+    if docker-squash -f "$BASE_IMAGE" -t "$ARK_IMAGE" "$ARK_IMAGE" > /dev/null 2>&1; then
+        echo "✅ 改动层已合并"
+    else
+        echo "⚠️  改动层合并失败（将使用未合并版本）"
+    fi
+    trace_end "docker-squash" export
+
+    echo "💾 [5/6] 导出改动层到 ark.delta.tar（这可能需要 10-30 秒）..."
+    trace_begin "docker save (delta)" export
+    set -o pipefail
+    if docker save "$ARK_IMAGE" | python3 image_delta.py split --base "$BASE_IMAGE" -o ./ark.delta.tar; then
+        DELTA_SIZE=$(du -h ./ark.delta.tar | cut -f1)
+        echo "✅ 改动层已导出（大小: $DELTA_SIZE）"
+    else
+        echo "⚠️  增量导出失败，改用完整导出"
+        rm -f ./ark.delta.tar
+        EXPORT_MODE="full"
+    fi
+    set +o pipefail
+    trace_end "docker save (delta)" export
 fi
 
-# 保存容器
-echo "💾 [5/6] 导出容器镜像到 ark.tar（这可能需要 30-60 秒）..."
-if docker save ark -o ./ark.tar; then
-    ARK_SIZE=$(du -h ./ark.tar | cut -f1)
-    echo "✅ 容器镜像已导出（大小: $ARK_SIZE）"
-else
-    echo "❌ 容器导出失败"
-    exit 1
+if [[ "$EXPORT_MODE" == "full" ]]; then
+    docker rmi $BASE_IMAGE 2>/dev/null || :
+
+    # 优化容器镜像
+    echo "🗜️  [4/6] 优化容器镜像（合并镜像层，这可能需要 1-2 分钟）..."
+    trace_begin "docker-squash" export
+    if docker-squash -t "$ARK_IMAGE" "$ARK_IMAGE" > /dev/null 2>&1; then
+        echo "✅ 容器镜像已优化"
+    else
+        echo "⚠️  容器优化失败（将使用未优化版本）"
+    fi
+    trace_end "docker-squash" export
+
+    # 保存容器
+    echo "💾 [5/6] 导出容器镜像到 ark.tar（这可能需要 30-60 秒）..."
+    trace_begin "docker save" export
+    if docker save "$ARK_IMAGE" -o ./ark.tar; then
+        ARK_SIZE=$(du -h ./ark.tar | cut -f1)
+        echo "✅ 容器镜像已导出（大小: $ARK_SIZE）"
+    else
+        echo "❌ 容器导出失败"
+        exit 1
+    fi
+    trace_end "docker save" export
 fi
 
-docker rmi ark > /dev/null 2>&1
+docker rmi "$ARK_IMAGE" > /dev/null 2>&1
 
 # 保存数据
-echo "📦 [6/6] 打包数据文件到 data.tar（这可能需要 1-2 分钟）..."
-if sudo tar -cpf ./data.tar data > /dev/null 2>&1; then
-    DATA_SIZE=$(du -h ./data.tar | cut -f1)
-    echo "✅ 数据文件已打包（大小: $DATA_SIZE）"
+if [[ "$DATA_FORMAT" == "img" ]]; then
+    trace_begin "data image" export
+    if mountpoint -q data; then
+        # 数据本来就在镜像里：卸载即可
+        echo "💽 [6/6] 卸载数据卷镜像 $DATA_IMG..."
+        if unmount_data_image; then
+            echo "✅ 数据卷镜像已卸载"
+        else
+            echo "❌ 数据卷镜像卸载失败"
+            exit 1
+        fi
+    else
+        # 旧的 data 目录（从 data.tar 恢复）：转换为镜像，之后的运行都直接挂载
+        echo "💽 [6/6] 把 data 目录写入数据卷镜像 $DATA_IMG（只需转换一次，这可能需要 1-2 分钟）..."
+        if create_data_image data; then
+            echo "✅ 数据卷镜像已创建"
+        else
+            echo "❌ 数据卷镜像创建失败"
+            exit 1
+        fi
+        sudo rm -rf data
+    fi
+    trace_end "data image" export
+    rm -f ./data.tar
+    DATA_FILE="$DATA_IMG"
 else
-    echo "❌ 数据打包失败"
-    exit 1
-fi
+    echo "📦 [6/6] 打包数据文件到 data.tar（这可能需要 1-2 分钟）..."
+    trace_begin "tar data" export
+    if sudo tar -cpf ./data.tar data > /dev/null 2>&1; then
+        DATA_SIZE=$(du -h ./data.tar | cut -f1)
+        echo "✅ 数据文件已打包（大小: $DATA_SIZE）"
+    else
+        echo "❌ 数据打包失败"
+        exit 1
+    fi
 
-sudo rm -rf data
+    trace_end "tar data" export
+    if mountpoint -q data; then
+        unmount_data_image
+        rm -f "./$DATA_IMG"
+    else
+        sudo rm -rf data
+    fi
+    DATA_FILE="data.tar"
+fi
 
 echo ""
 echo "✅ 容器状态已保存"
-echo "   - ark.tar: $(du -h ./ark.tar | cut -f1)"
-echo "   - data.tar: $(du -h ./data.tar | cut -f1)"
+if [[ -f ./ark.delta.tar ]]; then
+    echo "   - ark.delta.tar: $(du -h ./ark.delta.tar | cut -f1)（基础镜像: $BASE_IMAGE）"
+else
+    echo "   - ark.tar: $(du -h ./ark.tar | cut -f1)"
+fi
+echo "   - $DATA_FILE: $(du -h "./$DATA_FILE" | cut -f1)"
 echo ""
@@ -1,11 +1,23 @@
 #!/bin/bash
 # 游戏安装脚本
+# 用法：install_game.sh <CLIENT_TYPE> [all|download|install]
+#   download = 只下载 APK（不需要容器，可以和容器恢复同时进行）
+#   install  = 只安装已下载的 APK（需要容器已启动）
+#   all      = 下载并安装（默认）
 
 CLIENT_TYPE="$1"
+PHASE="${2:-all}"
+
+# ==================== 加载公共函数 ====================
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+source "${SCRIPT_DIR}/common_functions.sh"
 
 echo "🎮 安装/更新游戏..."
 echo ""
 
+# ==================== 下载 ====================
+if [ "$PHASE" = "all" ] || [ "$PHASE" = "download" ]; then
+
 # 下载游戏 APK
 echo "⬇️  [1/3] 下载 ${CLIENT_TYPE} 版本游戏..."
 echo "    这可能需要 3-10 分钟，取决于网络速度..."
@@ -32,9 +44,23 @@ APK_SIZE=$(du -h arknights.apk | cut -f1)
 echo "📦 APK 文件大小: $APK_SIZE"
 echo ""
 
+fi
+
+if [ "$PHASE" = "download" ]; then
+    echo "✅ 游戏下载完成（等待容器就绪后安装）"
+    echo ""
+    exit 0
+fi
+
+# ==================== 安装 ====================
+if [ ! -f arknights.apk ]; then
+    echo "❌ 游戏 APK 文件不存在，请先运行 download 阶段"
+    exit 1
+fi
+
 # 连接 ADB
 echo "🔌 [2/3] 连接 ADB..."
-if adb kill-server && adb connect 127.0.0.1:5555 > /dev/null 2>&1; then
+if adb_reconnect; then
     echo "✅ ADB 连接成功"
     echo ""
     echo "📱 设备列表："
@@ -52,21 +78,21 @@ echo "    使用 -r 参数保留游戏数据"
 echo "    这可能需要 1-3 分钟..."
 echo ""
 
-if adb -s 127.0.0.1:5555 install -r arknights.apk 2>&1 | tee /tmp/install.log; then
+if adb -s "$ADB_DEVICE" install -r arknights.apk 2>&1 | tee "/tmp/install-${REDROID_NAME}.log"; then
     echo ""
     echo "✅ 游戏安装成功"
 else
     echo ""
     echo "❌ 游戏安装失败"
     echo "📋 错误日志："
-    cat /tmp/install.log
+    cat "/tmp/install-${REDROID_NAME}.log"
     rm arknights.apk
     exit 1
 fi
 
 # 清理 APK 文件
 rm arknights.apk
-rm -f /tmp/install.log
+rm -f "/tmp/install-${REDROID_NAME}.log"
 
 echo ""
 echo "✅ 游戏安装完成"
@@ -0,0 +1,383 @@
+#!/bin/bash
+# 常驻主机模式（keep-warm）
+# 适用于自托管的常驻 runner：redroid 容器和 /data 在两次运行之间保留在本机，
+# 每次运行只需要 确认容器在线 → 本地快照 → 运行 MAA → 报告，
+# 不再经过 恢复 → docker load → 启动 → 安装 → 导出 → squash → 保存 → 加密 → 上传
+#
+# 回滚使用本地写时复制快照：
+#   - data 为挂载的 data.img 时冻结文件系统后 reflink 复制镜像（btrfs/XFS 上瞬间完成，否则稀疏复制）
+#   - data 在 btrfs 上时使用子卷快照（btrfs subvolume snapshot，瞬间完成）
+#   - 否则使用 cp --reflink=auto（XFS/btrfs 上共享数据块；其他文件系统退化为完整复制）
+#   - 容器本身的改动用 docker commit 保存为 ${ARK_IMAGE}:warm-<快照名>（只记录改动层）
+# MAA 运行失败时自动回滚到运行前的快照
+#
+# Release 往返（导出 + 上传，用于异地备份和迁移到新主机）只在到期（SYNC_INTERVAL_HOURS）或指定 --sync 时进行
+#
+# 用法：keep_warm.sh run [--sync|--no-sync]   运行一次（工作目录 WARM_DIR，默认 ~/maa-warm）
+#       keep_warm.sh snapshot [名称]           创建快照
+#       keep_warm.sh rollback [名称]           回滚到快照（默认最新的）
+#       keep_warm.sh list                      列出快照
+#       keep_warm.sh sync                      立即进行 Release 往返
+#       keep_warm.sh status                    显示容器、快照和上次同步时间
+
+set -e  # 遇到错误立即退出
+
+# ==================== 加载公共函数 ====================
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+source "${SCRIPT_DIR}/common_functions.sh"
+
+# ==================== 配置 ====================
+REPO_DIR="$(pwd)"  # 仓库目录（workflow 的 checkout），Python 脚本从这里链接到工作目录
+WARM_DIR="${WARM_DIR:-$HOME/maa-warm}"  # 常驻工作目录：data、快照、运行状态都在这里，不受 checkout 清理影响
+SNAPSHOT_DIR="${WARM_SNAPSHOT_DIR:-.warm_snapshots}"  # 快照目录（相对 WARM_DIR，须与 data 在同一文件系统）
+KEEP_SNAPSHOTS="${KEEP_SNAPSHOTS:-3}"  # 保留最近几个快照
+SYNC_INTERVAL_HOURS="${SYNC_INTERVAL_HOURS:-168}"  # Release 往返间隔（小时），默认每周一次
+SYNC_STATE="maa_state/last_release_sync"  # 上次 Release 往返的时间（UNIX 秒）
+ROLLBACK_MARK=".warm_rolled_back"  # 本次运行失败后已回滚到的快照名（workflow 据此发送通知）
+CLIENT_TYPE="${CLIENT_TYPE:-Official}"
+
+# ==================== 工作目录 ====================
+# scripts/ 下的脚本以 "python3 xxx.py" 调用辅助脚本，docker compose 以当前目录为项目目录，
+# 所以工作目录中链接仓库的 Python 脚本并复制 docker-compose.yml（与 multi_instance.py 相同）
+prepare_workdir() {
+    mkdir -p "$WARM_DIR/$SNAPSHOT_DIR" "$WARM_DIR/maa_state"
+    for file in "$REPO_DIR"/*.py; do
+        ln -sfn "$file" "$WARM_DIR/$(basename "$file")"
+    done
+    cp "$REPO_DIR/docker-compose.yml" "$WARM_DIR/"
+    cd "$WARM_DIR"
+
+    # 同一台主机上同时只能有一个运行
+    exec 9> .keep_warm.lock
+    if ! flock -n 9; then
+        log_error "另一个 keep_warm.sh 正在运行（$WARM_DIR）"
+        exit 1
+    fi
+}
+
+# ==================== 快照方式 ====================
+# 输出 image（data 是挂载的 data.img）、btrfs（data 是 btrfs 子卷）或 reflink
+snapshot_method() {
+    if mountpoint -q data 2>/dev/null && [ -f "$DATA_IMG" ]; then
+        echo "image"
+    elif [ "$(stat -f -c %T . 2>/dev/null)" = "btrfs" ] && command -v btrfs > /dev/null && \
+       { [ ! -e data ] || sudo btrfs subvolume show data > /dev/null 2>&1; }; then
+        echo "btrfs"
+    else
+        echo "reflink"
+    fi
+}
+
+# 在 btrfs 上把 data 建成子卷（恢复解包前调用，之后的快照都是瞬间完成的）
+# 数据卷镜像模式下快照直接 reflink data.img，不需要子卷
+ensure_data_subvolume() {
+    if [ "$DATA_FORMAT" = "tar" ] && [ ! -e data ] && [ "$(stat -f -c %T . 2>/dev/null)" = "btrfs" ] && command -v btrfs > /dev/null; then
+        sudo btrfs subvolume create data > /dev/null
+        log_info "已创建 btrfs 子卷 data"
+    fi
+}
+
+# ==================== 容器状态 ====================
+container_exists() {
+    docker container inspect "$REDROID_NAME" > /dev/null 2>&1
+}
+
+container_running() {
+    [ "$(docker container inspect -f '{{.State.Running}}' "$REDROID_NAME" 2>/dev/null)" = "true" ]
+}
+
+# 容器当前使用的镜像（回滚后为 ${ARK_IMAGE}:warm-<快照名>），用于 docker compose 重新创建时保持一致
+container_image() {
+    docker container inspect -f '{{.Config.Image}}' "$REDROID_NAME" 2>/dev/null
+}
+
+game_installed() {
+    adb -s "$ADB_DEVICE" shell pm path com.hypergryph.arknights 2>/dev/null | grep -q '^package:'
+}
+
+# ==================== 首次运行：从 Release 恢复 ====================
+bootstrap() {
+    log_info "本机还没有容器，从 Release 恢复..."
+    ensure_data_subvolume
+    trace_begin "restore" keep-warm
+    restore_from_release.sh
+    trace_end "restore" keep-warm
+    setup_container.sh 180
+    install_game.sh "$CLIENT_TYPE"
+}
+
+# ==================== 确保容器在线 ====================
+ensure_running() {
+    if ! container_exists; then
+        bootstrap
+        return
+    fi
+
+    if container_running; then
+        log_success "容器 $REDROID_NAME 已在运行"
+    else
+        log_info "启动已有的容器 $REDROID_NAME..."
+        docker start "$REDROID_NAME" > /dev/null
+    fi
+    wait_for_boot 180
+
+    if ! game_installed; then
+        log_warning "游戏未安装，重新安装..."
+        install_game.sh "$CLIENT_TYPE"
+    fi
+}
+
+# ==================== 快照 ====================
+# 用法：take_snapshot <名称>
+# 快照期间暂停容器（冻结所有进程），保证 data 和容器改动层一致
+# 暂停到恢复之间的命令都记录失败而不是直接退出（set -e），保证容器和文件系统不会停在冻结状态
+take_snapshot() {
+    local name="$1"
+    local method
+    method=$(snapshot_method)
+
+    log_info "创建快照 $name（$method）..."
+    trace_begin "snapshot" keep-warm
+    local paused=false
+    if container_running; then
+        docker pause "$REDROID_NAME" > /dev/null && paused=true
+    fi
+
+    local status=0
+    if [ "$method" = "image" ]; then
+        # 冻结文件系统把脏页写回镜像，再 reflink（btrfs/XFS 上瞬间完成）或稀疏复制
+        mkdir -p "$SNAPSHOT_DIR/$name" || status=$?
+        if [ $status -eq 0 ] && sudo fsfreeze -f data; then
+            cp --reflink=auto --sparse=always "$DATA_IMG" "$SNAPSHOT_DIR/$name/$DATA_IMG" || status=$?
+            if ! sudo fsfreeze -u data; then
+                log_error "无法解冻 data，请手动执行 sudo fsfreeze -u $WARM_DIR/data"
+                status=1
+            fi
+        else
+            [ $status -eq 0 ] && status=1
+        fi
+    elif [ "$method" = "btrfs" ]; then
+        sudo btrfs subvolume snapshot -r data "$SNAPSHOT_DIR/$name" > /dev/null || status=$?
+    else
+        sudo cp -a --reflink=auto data "$SNAPSHOT_DIR/$name" || status=$?
+    fi
+    if [ $status -eq 0 ] && container_exists; then
+        docker commit --pause=false "$REDROID_NAME" "${ARK_IMAGE}:warm-$name" > /dev/null || status=$?
+    fi
+
+    if [ "$paused" = true ] && ! docker unpause "$REDROID_NAME" > /dev/null; then
+        log_error "无法恢复容器 $REDROID_NAME，请手动执行 docker unpause $REDROID_NAME"
+        status=1
+    fi
+    trace_end "snapshot" keep-warm
+
+    if [ $status -ne 0 ]; then
+        log_error "快照 $name 创建失败"
+        delete_snapshot "$name"
+        return 1
+    fi
+    log_success "快照 $name 已创建"
+}
+
+delete_snapshot() {
+    local name="$1"
+    if [ -d "$SNAPSHOT_DIR/$name" ]; then
+        sudo btrfs subvolume delete "$SNAPSHOT_DIR/$name" > /dev/null 2>&1 || sudo rm -rf "${SNAPSHOT_DIR:?}/$name"
+    fi
+    docker rmi "${ARK_IMAGE}:warm-$name" > /dev/null 2>&1 || true
+}
+
+# 快照名以时间开头，按名称排序即按时间排序
+list_snapshots() {
+    ls -1 "$SNAPSHOT_DIR" 2>/dev/null | sort
+}
+
+# 只保留最近 KEEP_SNAPSHOTS 个快照
+prune_snapshots() {
+    local count
+    count=$(list_snapshots | wc -l)
+    if [ "$count" -le "$KEEP_SNAPSHOTS" ]; then
+        return
+    fi
+    list_snapshots | head -n $((count - KEEP_SNAPSHOTS)) | while read -r name; do
+        delete_snapshot "$name"
+        log_info "已删除旧快照 $name"
+    done
+}
+
+# ==================== 回滚 ====================
+# 用法：rollback <名称>
+# 停止并删除容器，data 换成快照的可写副本，用快照时提交的镜像重新创建容器
+rollback() {
+    local name="$1"
+    if [ ! -d "$SNAPSHOT_DIR/$name" ]; then
+        log_error "快照 $name 不存在"
+        return 1
+    fi
+
+    log_info "回滚到快照 $name..."
+    trace_begin "rollback" keep-warm
+    docker rm -f "$REDROID_NAME" > /dev/null 2>&1 || true
+
+    if [ -f "$SNAPSHOT_DIR/$name/$DATA_IMG" ]; then
+        unmount_data_image
+        sudo rm -rf data
+        cp --reflink=auto --sparse=always "$SNAPSHOT_DIR/$name/$DATA_IMG" "$DATA_IMG"
+        mount_data_image
+    elif sudo btrfs subvolume show "$SNAPSHOT_DIR/$name" > /dev/null 2>&1; then
+        sudo btrfs subvolume delete data > /dev/null 2>&1 || sudo rm -rf data
+        sudo btrfs subvolume snapshot "$SNAPSHOT_DIR/$name" data > /dev/null
+    else
+        sudo rm -rf data
+        sudo cp -a --reflink=auto "$SNAPSHOT_DIR/$name" data
+    fi
+
+    if docker image inspect "${ARK_IMAGE}:warm-$name" > /dev/null 2>&1; then
+        export IMAGETAG="${ARK_IMAGE}:warm-$name"
+    else
+        log_warning "没有快照 $name 的容器镜像，使用 $ARK_IMAGE"
+        export IMAGETAG="$ARK_IMAGE"
+    fi
+    docker compose up -d > /dev/null 2>&1
+    trace_end "rollback" keep-warm
+
+    if wait_for_boot 180; then
+        log_success "已回滚到快照 $name"
+    else
+        log_error "回滚后容器启动失败"
+        return 1
+    fi
+}
+
+# ==================== Release 往返 ====================
+sync_due() {
+    local last=0
+    [ -f "$SYNC_STATE" ] && last=$(cat "$SYNC_STATE")
+    [ $(( $(date +%s) - last )) -ge $(( SYNC_INTERVAL_HOURS * 3600 )) ]
+}
+
+# 导出并上传到 Release，再用本地导出的文件重新加载容器（不需要重新下载）
+sync_release() {
+    log_info "Release 往返：导出 → 上传 → 本地重新加载..."
+    take_snapshot "$(date +%Y%m%d-%H%M%S)-sync"
+
+    trace_begin "release sync" keep-warm
+    # export_container.sh 按镜像名 ARK_IMAGE 提交，回滚后的容器同样适用
+    export_container.sh
+    if ! backup_to_release.sh; then
+        log_error "上传失败，恢复本地容器（下次运行会重试）"
+        ensure_data_subvolume
+        setup_container.sh 180
+        install_game.sh "$CLIENT_TYPE"
+        trace_end "release sync" keep-warm
+        return 1
+    fi
+    date +%s > "$SYNC_STATE"
+
+    ensure_data_subvolume
+    setup_container.sh 180
+    install_game.sh "$CLIENT_TYPE"
+    trace_end "release sync" keep-warm
+    log_success "Release 往返完成"
+}
+
+# ==================== 运行一次 ====================
+run_once() {
+    local sync="$1"
+    rm -f "$ROLLBACK_MARK"
+
+    ensure_running
+
+    local name
+    name="$(date +%Y%m%d-%H%M%S)-pre"
+    take_snapshot "$name"
+
+    # 运行中（如自动修复）用 docker compose 重新创建容器时沿用当前镜像，而不是默认的 redroid 镜像
+    export IMAGETAG
+    IMAGETAG="$(container_image)"
+
+    set +e
+    python3 run.py
+    local run_status=$?
+    set -e
+
+    if [ $run_status -ne 0 ]; then
+        log_error "MAA 运行失败，回滚到运行前的快照 $name"
+        if rollback "$name"; then
+            echo "$name" > "$ROLLBACK_MARK"
+        fi
+        return 1
+    fi
+
+    python3 process_report.py || log_warning "报告处理失败"
+    prune_snapshots
+
+    if [ "$sync" = "force" ] || { [ "$sync" = "auto" ] && sync_due; }; then
+        sync_release
+    else
+        log_info "跳过 Release 往返（下次到期：$(next_sync_time)）"
+    fi
+}
+
+next_sync_time() {
+    local last=0
+    [ -f "$SYNC_STATE" ] && last=$(cat "$SYNC_STATE")
+    date -d "@$(( last + SYNC_INTERVAL_HOURS * 3600 ))" '+%Y-%m-%d %H:%M'
+}
+
+show_status() {
+    if container_running; then
+        log_success "容器 $REDROID_NAME 运行中（镜像 $(container_image)）"
+    elif container_exists; then
+        log_info "容器 $REDROID_NAME 已停止"
+    else
+        log_info "本机没有容器（下次运行会从 Release 恢复）"
+    fi
+    log_info "快照方式：$(snapshot_method)，共 $(list_snapshots | wc -l) 个快照（保留 $KEEP_SNAPSHOTS 个）"
+    if [ -f "$SYNC_STATE" ]; then
+        log_info "上次 Release 往返：$(date -d "@$(cat "$SYNC_STATE")" '+%Y-%m-%d %H:%M')，下次到期：$(next_sync_time)"
+    else
+        log_info "还没有进行过 Release 往返（下次运行时进行）"
+    fi
+}
+
+# ==================== 主函数 ====================
+main() {
+    local command="${1:-run}"
+    shift || true
+
+    prepare_workdir
+
+    case "$command" in
+        run)
+            local sync="auto"
+            case "$1" in
+                --sync) sync="force" ;;
+                --no-sync) sync="off" ;;
+            esac
+            run_once "$sync"
+            ;;
+        snapshot)
+            take_snapshot "${1:-$(date +%Y%m%d-%H%M%S)-manual}"
+            ;;
+        rollback)
+            rollback "${1:-$(list_snapshots | tail -1)}"
+            ;;
+        list)
+            list_snapshots
+            ;;
+        sync)
+            ensure_running
+            sync_release
+            ;;
+        status)
+            show_status
+            ;;
+        *)
+            echo "用法：keep_warm.sh run [--sync|--no-sync] | snapshot [名称] | rollback [名称] | list | sync | status"
+            exit 1
+            ;;
+    esac
+}
+
+main "$@"
@@ -19,7 +19,7 @@ echo ""
 
 (
     echo "  → 安装系统依赖（linux-modules, python3, adb）..."
-    if timeout 300 sudo apt install linux-modules-extra-$(uname -r) python3-requests python3-toml adb -y > /dev/null 2>&1; then
+    if timeout 300 sudo apt install linux-modules-extra-$(uname -r) python3-requests python3-toml python3-cryptography python3-zstandard adb -y > /dev/null 2>&1; then
         echo "  ✅ 系统依赖安装完成"
     else
         EXIT_CODE=$?
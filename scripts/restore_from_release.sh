@@ -4,9 +4,22 @@
 
 set -e  # 遇到错误立即退出
 
+# ==================== 加载公共函数（耗时追踪）====================
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+source "${SCRIPT_DIR}/common_functions.sh"
+
 # ==================== 配置 ====================
 ENCRYPTION_KEY="${CONTAINER_ENCRYPTION_KEY}"
-SNAPSHOT_PREFIX="snapshot"
+SNAPSHOT_PREFIX="${SNAPSHOT_PREFIX:-snapshot}"  # 多实例模式为 <实例名>-snapshot
+BLOCK_COMPRESS="python3 block_compress.py"  # 多核分块解压（兼容旧的 gzip/无压缩备份）
+SNAPSHOT_CRYPTO="python3 snapshot_crypto.py"  # 分块 AES-256-GCM 解密（旧备份没有清单时使用 openssl）
+MANIFEST_FILE="container.manifest.json"
+GITHUB_RELEASES="python3 github_releases.py"  # Releases API 客户端（分页查询、并发下载）
+
+# 恢复模式
+# stream = 流式恢复（默认）：边下载边解密解压，镜像直接 docker load，数据直接解包，不落地中间文件
+# file   = 传统模式：下载全部分卷后解密，生成 ark.tar / data.tar 交给 setup_container.sh
+RESTORE_MODE="${RESTORE_MODE:-stream}"
 
 # ==================== 颜色输出 ====================
 RED='\033[0;31m'
@@ -36,20 +49,19 @@ check_dependencies() {
     log_info "检查依赖..."
     
     # 检查必需工具（Ubuntu 自带）
-    for cmd in tar gzip openssl; do
+    for cmd in tar python3 openssl; do
         if ! command -v $cmd &> /dev/null; then
             log_error "未找到 $cmd 命令"
             exit 1
         fi
     done
     
-    # 检查 gh (GitHub CLI)
-    if ! command -v gh &> /dev/null; then
-        log_error "未找到 gh 命令，正在安装..."
-        sudo apt update > /dev/null 2>&1
-        sudo apt install -y gh > /dev/null 2>&1
-        log_success "gh 安装完成"
-    fi
+    for file in block_compress.py snapshot_crypto.py stream_restore.py image_delta.py github_releases.py; do
+        if [ ! -f "$file" ]; then
+            log_error "未找到 $file（请在仓库根目录运行）"
+            exit 1
+        fi
+    done
     
     log_success "依赖检查完成"
 }
@@ -74,19 +86,8 @@ find_latest_release() {
     echo "ℹ️  查找最新的容器备份..." >&2
     echo "" >&2
     
-    # 调试：检查 gh 命令是否可用
-    echo "ℹ️  调试 [1/4]: 检查 gh 命令..." >&2
-    if command -v gh &> /dev/null; then
-        echo "✅ gh 命令存在: $(which gh)" >&2
-        gh --version >&2 2>&1 || echo "⚠️  无法获取 gh 版本" >&2
-    else
-        echo "❌ gh 命令不存在" >&2
-        exit 1
-    fi
-    echo "" >&2
-    
     # 调试：检查 GH_TOKEN
-    echo "ℹ️  调试 [2/4]: 检查 GH_TOKEN..." >&2
+    echo "ℹ️  调试 [1/2]: 检查 GH_TOKEN..." >&2
     if [ -z "$GH_TOKEN" ]; then
         echo "❌ GH_TOKEN 未设置" >&2
         exit 1
@@ -95,50 +96,16 @@ find_latest_release() {
     fi
     echo "" >&2
     
-    # 调试：显示 gh release list 的输出
-    echo "ℹ️  调试 [3/4]: 列出所有 releases..." >&2
-    echo "--- gh release list 输出 (前10个) ---" >&2
-    gh release list --limit 10 >&2 2>&1 || {
-        echo "❌ gh release list 命令失败，错误码: $?" >&2
-        exit 1
-    }
-    echo "--- 输出结束 ---" >&2
-    echo "" >&2
-    
-    # 调试：提取和过滤过程
-    echo "ℹ️  调试 [4/4]: 查找 snapshot releases..." >&2
+    # 调试：列出 snapshot releases（分页获取全部 Release，未发布的草稿不计入）
+    echo "ℹ️  调试 [2/2]: 查找 snapshot releases..." >&2
     echo "  SNAPSHOT_PREFIX = '${SNAPSHOT_PREFIX}'" >&2
-    echo "  查找模式 = '^${SNAPSHOT_PREFIX}-'" >&2
-    echo "" >&2
-    
-    # 🔧 关键修复：使用 tab 作为分隔符，tag 在第 3 列
-    # 注意：不使用 2>&1，避免 stderr 混入结果
+    echo "--- snapshot releases（新的在前）---" >&2
     set +e
-    LATEST_RELEASE=$(gh release list --limit 100 2>/dev/null | awk -F'\t' '{print $3}' | grep "^${SNAPSHOT_PREFIX}-" | head -1)
-    GREP_EXIT_CODE=$?
+    RELEASES=$($GITHUB_RELEASES list --prefix "$SNAPSHOT_PREFIX" --verbose)
     set -e
-    
-    # 调试：显示提取结果（清理前）
-    echo "--- 提取结果（清理前）---" >&2
-    echo "原始值: [$LATEST_RELEASE]" >&2
-    echo "长度: ${#LATEST_RELEASE}" >&2
-    echo "十六进制: $(echo -n "$LATEST_RELEASE" | xxd -p | head -c 100)" >&2
-    echo "" >&2
-    
-    # 清理可能的空白字符和换行符
-    LATEST_RELEASE=$(echo "$LATEST_RELEASE" | tr -d '\n\r\t ' | xargs)
-    
-    # 调试：显示提取结果（清理后）
-    echo "--- 提取结果（清理后）---" >&2
-    if [ $GREP_EXIT_CODE -eq 0 ] && [ -n "$LATEST_RELEASE" ]; then
-        echo "✅ 找到匹配: [$LATEST_RELEASE]" >&2
-        echo "长度: ${#LATEST_RELEASE}" >&2
-    else
-        echo "❌ 未找到匹配 (grep exit code: $GREP_EXIT_CODE)" >&2
-        echo "所有 release tags:" >&2
-        gh release list --limit 100 2>/dev/null | awk -F'\t' '{print "  - " $3}' >&2 || echo "  (无法列出)" >&2
-    fi
-    echo "--- 提取结果结束 ---" >&2
+    echo "$RELEASES" | head -10 >&2
+    LATEST_RELEASE=$(echo "$RELEASES" | head -1 | cut -f1)
+    echo "--- 输出结束 ---" >&2
     echo "" >&2
     
     if [ -z "$LATEST_RELEASE" ]; then
@@ -159,74 +126,39 @@ download_release_files() {
     log_info "下载备份文件..."
     
     # 清理旧的下载文件
-    rm -f container.enc.* 2>/dev/null || true
+    rm -f container.enc.* "$MANIFEST_FILE" 2>/dev/null || true
     
     # 获取文件列表和总数
     log_info "获取文件列表..."
     
+    ASSETS=$($GITHUB_RELEASES assets "$release_tag")
+    
     # 检查备份文件
-    if ! gh release view "$release_tag" --json assets --jq '.assets[].name' | grep -q "container.enc."; then
+    if ! echo "$ASSETS" | grep -q "container.enc."; then
         log_error "未找到备份文件（container.enc.*）"
         exit 1
     fi
     
     FILE_PATTERN="container.enc."
     
-    FILE_LIST=$(gh release view "$release_tag" --json assets --jq '.assets[].name' | grep "$FILE_PATTERN")
+    FILE_LIST=$(echo "$ASSETS" | grep "$FILE_PATTERN")
     TOTAL_FILES=$(echo "$FILE_LIST" | wc -l)
     
+    # 新格式备份带有签名清单，一起下载
+    if echo "$ASSETS" | grep -qx "$MANIFEST_FILE"; then
+        FILE_LIST="$FILE_LIST $MANIFEST_FILE"
+        log_info "备份带有清单 $MANIFEST_FILE"
+    fi
+    
     log_info "需要下载 $TOTAL_FILES 个分卷文件"
     log_info "并行下载中..."
     echo ""
     
-    # 并行下载所有文件
-    for file in $FILE_LIST; do
-        (
-            gh release download "$release_tag" --pattern "$file" --clobber > /dev/null 2>&1
-            if [ -f "$file" ]; then
-                FILE_SIZE=$(ls -lh "$file" 2>/dev/null | awk '{print $5}')
-                echo "✅ $file ($FILE_SIZE)"
-            else
-                echo "❌ $file 下载失败"
-            fi
-        ) &
-    done
-    
-    # 等待所有下载完成，显示进度
-    echo "⏳ 等待下载完成..."
-    echo ""
-    WAIT_COUNT=0
-    while true; do
-        DOWNLOADED=$(ls ${FILE_PATTERN}* 2>/dev/null | wc -l)
-        # 只统计已完全下载的文件大小（避免显示不准确的中间值）
-        if [ "$DOWNLOADED" -gt 0 ]; then
-            TOTAL_SIZE=$(du -ch ${FILE_PATTERN}* 2>/dev/null | tail -1 | cut -f1 || echo "0")
-        else
-            TOTAL_SIZE="0"
-        fi
-        
-        # 使用 \r 覆盖当前行，显示实时进度
-        printf "\r   📥 进度: %d/%d 文件，已下载: %s    " "$DOWNLOADED" "$TOTAL_FILES" "$TOTAL_SIZE"
-        
-        if [ "$DOWNLOADED" -eq "$TOTAL_FILES" ]; then
-            break
-        fi
-        
-        WAIT_COUNT=$((WAIT_COUNT + 1))
-        if [ $WAIT_COUNT -gt 600 ]; then
-            echo ""
-            log_error "下载超时（10分钟）"
-            exit 1
-        fi
-        
-        sleep 2
-    done
-    
-    # 等待所有后台进程完成
-    wait
-    
-    # 清除进度行，打印最终结果
-    printf "\r%80s\r" " "  # 清除整行
+    # 并发下载所有文件（单个文件失败时自动重试）
+    if ! $GITHUB_RELEASES download "$release_tag" $FILE_LIST; then
+        log_error "部分文件下载失败"
+        exit 1
+    fi
     echo ""
     
     # 检查是否下载成功
@@ -251,56 +183,101 @@ extract_and_decrypt() {
     log_info "开始解密和解压..."
     
     # 清理旧的解压文件
-    rm -f ark.tar data.tar 2>/dev/null || true
+    rm -f ark.tar ark.delta.tar data.tar "$DATA_IMG" 2>/dev/null || true
+    
+    log_info "解密中（这可能需要 2-5 分钟）..."
     
-    log_info "使用 OpenSSL 解密（这可能需要 2-5 分钟）..."
+    # 解密 → 分块解压 → tar
+    # 有清单：校验签名和分卷哈希后分块并行解密；没有清单（旧备份）：cat → openssl
+    # 分块解压根据帧头识别压缩格式（旧的 gzip/无压缩备份也能识别），只需解密一次
+    if [ -f "$MANIFEST_FILE" ]; then
+        log_info "校验清单和分卷..."
+        if ! CONTAINER_ENCRYPTION_KEY="$ENCRYPTION_KEY" $SNAPSHOT_CRYPTO verify --manifest "$MANIFEST_FILE"; then
+            log_error "分卷校验失败！"
+            exit 1
+        fi
+        decrypt_parts() {
+            CONTAINER_ENCRYPTION_KEY="$ENCRYPTION_KEY" $SNAPSHOT_CRYPTO open --manifest "$MANIFEST_FILE"
+        }
+    else
+        log_info "未找到清单，按旧格式（openssl 单流）解密"
+        decrypt_parts() {
+            cat container.enc.* | \
+                openssl enc -d -aes-256-cbc -pbkdf2 -iter 100000 -pass pass:"$ENCRYPTION_KEY"
+        }
+    fi
     
-    # 尝试方法 1：cat → openssl → gunzip → tar（假设有 gzip 压缩）
-    log_info "尝试解密（带 gzip 解压）..."
-    if cat container.enc.* | \
-       openssl enc -d -aes-256-cbc -pbkdf2 -iter 100000 -pass pass:"$ENCRYPTION_KEY" | \
-       gunzip | \
+    set -o pipefail
+    if decrypt_parts | \
+       $BLOCK_COMPRESS decompress | \
        tar -xf -; then
+        set +o pipefail
         log_success "解密和解压完成"
     else
-        # 方法 1 失败，尝试方法 2：cat → openssl → tar（无 gzip 压缩）
-        log_warning "带 gzip 解压失败，尝试无压缩模式..."
-        
-        # 清理可能的部分解压文件
-        rm -f ark.tar data.tar 2>/dev/null || true
-        
-        if cat container.enc.* | \
-           openssl enc -d -aes-256-cbc -pbkdf2 -iter 100000 -pass pass:"$ENCRYPTION_KEY" | \
-           tar -xf -; then
-            log_success "解密和解压完成（无压缩模式）"
-        else
-            log_error "解密失败！"
-            log_error "可能的原因："
-            log_error "  1. 密码错误"
-            log_error "  2. 文件损坏"
-            log_error "  3. 分卷文件不完整"
-            exit 1
-        fi
+        set +o pipefail
+        log_error "解密失败！"
+        log_error "可能的原因："
+        log_error "  1. 密码错误"
+        log_error "  2. 文件损坏"
+        log_error "  3. 分卷文件不完整"
+        exit 1
+    fi
+    
+    # 检查是否成功解压（数据为 data.img 或旧的 data.tar）
+    if { [ ! -f "ark.tar" ] && [ ! -f "ark.delta.tar" ]; } || { [ ! -f "$DATA_IMG" ] && [ ! -f "data.tar" ]; }; then
+        log_error "解压失败，未找到 ark.tar（或 ark.delta.tar）或 $DATA_IMG（或 data.tar）"
+        exit 1
+    fi
+}
+
+# ==================== 流式恢复 ====================
+stream_restore() {
+    local release_tag=$1
+    
+    log_info "流式恢复：下载、解密、解压、加载同时进行..."
+    
+    # 清理旧的文件
+    rm -f container.enc.* ark.tar ark.delta.tar data.tar "$DATA_IMG" .stream_restored 2>/dev/null || true
+    
+    if python3 stream_restore.py "$release_tag"; then
+        log_success "流式恢复完成"
+    else
+        log_error "流式恢复失败！"
+        log_error "可能的原因："
+        log_error "  1. 密码错误"
+        log_error "  2. 文件损坏"
+        log_error "  3. 分卷下载失败"
+        exit 1
     fi
+}
+
+# ==================== 验证流式恢复结果 ====================
+verify_stream_restore() {
+    log_info "验证恢复结果..."
     
-    # 检查是否成功解压
-    if [ ! -f "ark.tar" ] || [ ! -f "data.tar" ]; then
-        log_error "解压失败，未找到 ark.tar 或 data.tar"
+    if ! docker image inspect "$ARK_IMAGE" > /dev/null 2>&1; then
+        log_error "未找到已加载的 $ARK_IMAGE 镜像"
         exit 1
     fi
     
-    # 显示解压后的文件大小
-    ARK_SIZE=$(du -h ark.tar | cut -f1)
-    DATA_SIZE=$(du -h data.tar | cut -f1)
-    log_info "ark.tar: $ARK_SIZE"
-    log_info "data.tar: $DATA_SIZE"
+    log_info "$ARK_IMAGE 镜像: $(docker image inspect "$ARK_IMAGE" --format '{{.Size}}' | awk '{printf "%.1fG", $1/1024/1024/1024}')"
+    if [ -f "$DATA_IMG" ]; then
+        log_info "$DATA_IMG: $(du -h "$DATA_IMG" | cut -f1)（由 setup_container.sh 挂载）"
+    elif [ -d "data" ]; then
+        log_info "data: $(sudo du -sh data | cut -f1)"
+    else
+        log_error "未找到 $DATA_IMG 或 data 目录"
+        exit 1
+    fi
+    
+    log_success "恢复结果验证完成"
 }
 
 # ==================== 清理临时文件 ====================
 cleanup_temp_files() {
     log_info "清理临时文件..."
     
-    rm -f container.enc.* 2>/dev/null || true
+    rm -f container.enc.* "$MANIFEST_FILE" 2>/dev/null || true
     
     log_success "清理完成"
 }
@@ -309,22 +286,30 @@ cleanup_temp_files() {
 verify_files() {
     log_info "验证文件..."
     
-    # 检查文件是否存在
-    if [ ! -f "ark.tar" ]; then
+    # 检查文件是否存在（增量快照为 ark.delta.tar）
+    if [ -f "ark.delta.tar" ]; then
+        IMAGE_FILE="ark.delta.tar"
+    elif [ -f "ark.tar" ]; then
+        IMAGE_FILE="ark.tar"
+    else
         log_error "ark.tar 不存在"
         exit 1
     fi
     
-    if [ ! -f "data.tar" ]; then
-        log_error "data.tar 不存在"
+    if [ -f "$DATA_IMG" ]; then
+        DATA_FILE="$DATA_IMG"
+    elif [ -f "data.tar" ]; then
+        DATA_FILE="data.tar"
+    else
+        log_error "$DATA_IMG 和 data.tar 都不存在"
         exit 1
     fi
     
     # 显示文件大小
-    ARK_SIZE=$(du -h ark.tar | cut -f1)
-    DATA_SIZE=$(du -h data.tar | cut -f1)
-    log_info "ark.tar: $ARK_SIZE"
-    log_info "data.tar: $DATA_SIZE"
+    ARK_SIZE=$(du -h "$IMAGE_FILE" | cut -f1)
+    DATA_SIZE=$(du -h "$DATA_FILE" | cut -f1)
+    log_info "$IMAGE_FILE: $ARK_SIZE"
+    log_info "$DATA_FILE: $DATA_SIZE"
     
     log_success "文件验证完成"
 }
@@ -344,28 +329,50 @@ main() {
     check_encryption_key
     
     # 3. 查找最新的 Release
+    trace_begin "find release" restore
     LATEST_RELEASE=$(find_latest_release)
+    trace_end "find release" restore
     
-    # 4. 下载 Release 文件
-    download_release_files "$LATEST_RELEASE"
-    
-    # 5. 解压 + 解密
-    extract_and_decrypt
-    
-    # 6. 验证文件
-    verify_files
-    
-    # 7. 清理临时文件
-    cleanup_temp_files
+    if [ "$RESTORE_MODE" = "stream" ]; then
+        # 4. 流式恢复（下载 + 解密 + 解压 + 加载）
+        trace_begin "stream restore" restore
+        stream_restore "$LATEST_RELEASE"
+        trace_end "stream restore" restore
+        
+        # 5. 验证结果
+        verify_stream_restore
+    else
+        # 4. 下载 Release 文件
+        trace_begin "download" restore
+        download_release_files "$LATEST_RELEASE"
+        trace_end "download" restore
+        
+        # 5. 解压 + 解密
+        trace_begin "decrypt + decompress" restore
+        extract_and_decrypt
+        trace_end "decrypt + decompress" restore
+        
+        # 6. 验证文件
+        verify_files
+        
+        # 7. 清理临时文件
+        cleanup_temp_files
+    fi
     
     echo ""
     log_success "=========================================="
     log_success "  恢复完成！"
     log_success "=========================================="
     echo ""
-    log_info "已恢复文件："
-    log_info "  - ark.tar"
-    log_info "  - data.tar"
+    if [ "$RESTORE_MODE" = "stream" ]; then
+        log_info "已恢复："
+        log_info "  - Docker 镜像 $ARK_IMAGE（已加载）"
+        log_info "  - 数据（$DATA_IMG 或已解包的 data 目录）"
+    else
+        log_info "已恢复文件："
+        log_info "  - $IMAGE_FILE"
+        log_info "  - $DATA_FILE"
+    fi
     echo ""
 }
 
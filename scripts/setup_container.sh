@@ -1,6 +1,10 @@
 #!/bin/bash
 # 容器设置脚本
 
+# ==================== 加载公共函数 ====================
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+source "${SCRIPT_DIR}/common_functions.sh"
+
 echo "🔒 启动 Android 容器..."
 echo ""
 
@@ -10,36 +14,86 @@ if [[ "${USE_DEFAULT_IMAGE}" == "true" ]]; then
     echo "   跳过加载已保存的容器"
     echo ""
     # 删除已保存的容器文件（如果存在）
-    rm -f ./ark.tar ./data.tar 2>/dev/null || true
+    unmount_data_image
+    rm -f ./ark.tar ./ark.delta.tar ./data.tar "./$DATA_IMG" ./.stream_restored 2>/dev/null || true
     sudo rm -rf ./data 2>/dev/null || true
-elif [[ -f ./ark.tar ]] && [[ -f ./data.tar ]]; then
+elif [[ -f ./.stream_restored ]]; then
+    # 流式恢复已经完成了 docker load 和数据解包
+    echo "📦 容器已通过流式恢复加载（$(cat ./.stream_restored)）"
+    rm -f ./.stream_restored
+    export IMAGETAG="$ARK_IMAGE"
+    if [[ -f "./$DATA_IMG" ]]; then
+        echo "💽 挂载数据卷镜像 $DATA_IMG..."
+        trace_begin "mount data image"
+        if ! mount_data_image; then
+            echo "❌ 数据卷镜像挂载失败"
+            exit 1
+        fi
+        trace_end "mount data image"
+    fi
+    echo "✅ 容器文件加载完成"
+    echo ""
+elif [[ -f ./ark.tar || -f ./ark.delta.tar ]] && [[ -f ./data.tar || -f "./$DATA_IMG" ]]; then
     echo "📦 发现已保存的容器文件"
     
-    ARK_SIZE=$(du -h ./ark.tar | cut -f1)
-    DATA_SIZE=$(du -h ./data.tar | cut -f1)
-    echo "   - ark.tar: $ARK_SIZE"
-    echo "   - data.tar: $DATA_SIZE"
+    IMAGE_FILE=$([[ -f ./ark.delta.tar ]] && echo ark.delta.tar || echo ark.tar)
+    DATA_FILE=$([[ -f "./$DATA_IMG" ]] && echo "$DATA_IMG" || echo data.tar)
+    ARK_SIZE=$(du -h ./$IMAGE_FILE | cut -f1)
+    DATA_SIZE=$(du -h "./$DATA_FILE" | cut -f1)
+    echo "   - $IMAGE_FILE: $ARK_SIZE"
+    echo "   - $DATA_FILE: $DATA_SIZE"
     
-    echo "📥 加载 Docker 镜像（这可能需要 30-60 秒）..."
-    if docker load -i ./ark.tar > /dev/null 2>&1; then
-        echo "✅ Docker 镜像加载完成"
+    if [[ "$IMAGE_FILE" == "ark.delta.tar" ]]; then
+        # 增量快照：基础镜像（拉取或使用缓存）+ 改动层 → docker load
+        echo "📥 合并基础镜像和改动层并加载（这可能需要 30-60 秒）..."
+        trace_begin "docker load"
+        set -o pipefail
+        if python3 image_delta.py merge ./ark.delta.tar | docker load > /dev/null; then
+            echo "✅ Docker 镜像加载完成"
+        else
+            echo "❌ Docker 镜像加载失败"
+            exit 1
+        fi
+        set +o pipefail
     else
-        echo "❌ Docker 镜像加载失败"
-        exit 1
+        echo "📥 加载 Docker 镜像（这可能需要 30-60 秒）..."
+        trace_begin "docker load"
+        if docker load -i ./ark.tar > /dev/null 2>&1; then
+            echo "✅ Docker 镜像加载完成"
+        else
+            echo "❌ Docker 镜像加载失败"
+            exit 1
+        fi
     fi
     
-    sudo rm ./ark.tar
-    export IMAGETAG=ark
+    trace_end "docker load"
+    sudo rm ./$IMAGE_FILE
+    export IMAGETAG="$ARK_IMAGE"
     
-    echo "📂 解压数据文件（这可能需要 10-20 秒）..."
-    if sudo tar -xf ./data.tar > /dev/null 2>&1; then
-        echo "✅ 数据文件解压完成"
+    if [[ "$DATA_FILE" == "$DATA_IMG" ]]; then
+        # 数据卷镜像直接挂载，不需要解包
+        echo "💽 挂载数据卷镜像 $DATA_IMG..."
+        trace_begin "mount data image"
+        if mount_data_image; then
+            echo "✅ 数据卷镜像已挂载"
+        else
+            echo "❌ 数据卷镜像挂载失败"
+            exit 1
+        fi
+        trace_end "mount data image"
     else
-        echo "❌ 数据文件解压失败"
-        exit 1
+        echo "📂 解压数据文件（这可能需要 10-20 秒）..."
+        trace_begin "extract data"
+        if sudo tar -xf ./data.tar > /dev/null 2>&1; then
+            echo "✅ 数据文件解压完成"
+        else
+            echo "❌ 数据文件解压失败"
+            exit 1
+        fi
+        
+        trace_end "extract data"
+        sudo rm ./data.tar
     fi
-    
-    sudo rm ./data.tar
     echo "✅ 容器文件加载完成"
     echo ""
 else
@@ -47,77 +101,29 @@ else
     echo ""
 fi
 
+# 新容器（或旧的 data 目录不存在时）：创建空的数据卷镜像
+if [[ "$DATA_FORMAT" == "img" && ! -e ./data ]]; then
+    if [[ ! -f "./$DATA_IMG" ]]; then
+        echo "💽 创建数据卷镜像 $DATA_IMG（稀疏，最大 $DATA_IMG_SIZE）..."
+        create_data_image || { echo "❌ 数据卷镜像创建失败"; exit 1; }
+    fi
+    if ! mount_data_image; then
+        echo "❌ 数据卷镜像挂载失败"
+        exit 1
+    fi
+fi
+
 # 启动容器
 echo "🚀 启动 Docker 容器..."
+trace_begin "docker compose up"
 if docker compose up -d > /dev/null 2>&1; then
     echo "✅ Docker 容器已启动"
 else
     echo "❌ Docker 容器启动失败"
     exit 1
 fi
+trace_end "docker compose up"
 
 # 等待容器就绪
-MAX_ATTEMPTS=${1:-180}  # 默认 180 次尝试
-attempt=0
-
-echo ""
-echo "⏳ 等待 Android 系统启动（最多 ${MAX_ATTEMPTS} 次尝试）..."
-echo "   提示：首次启动可能需要 1-2 分钟"
-echo ""
-
-while [[ $attempt -lt $MAX_ATTEMPTS ]]; do
-    # 每次循环都重新连接 ADB（这是必要的，因为 redroid 的 ADB 守护进程是异步初始化的）
-    adb kill-server > /dev/null 2>&1
-    adb connect 127.0.0.1:5555 > /dev/null 2>&1
-    
-    # 检查容器是否还在运行
-    if ! docker ps | grep -q redroid; then
-        echo ""
-        echo "❌ Docker 容器已停止运行"
-        echo "📋 容器日志："
-        docker logs redroid 2>&1 | tail -20
-        exit 1
-    fi
-    
-    # 检查 Android 系统是否启动完成
-    BOOT_STATUS=$(adb -s 127.0.0.1:5555 shell getprop sys.boot_completed 2>/dev/null || echo "0")
-    
-    if [[ "$BOOT_STATUS" == "1" ]]; then
-        echo ""
-        echo "✅ Android 容器已就绪（尝试 ${attempt} 次，约 ${attempt} 秒）"
-        echo ""
-        
-        # 显示 Android 版本信息
-        ANDROID_VERSION=$(adb -s 127.0.0.1:5555 shell getprop ro.build.version.release 2>/dev/null || echo "未知")
-        echo "📱 Android 版本: ${ANDROID_VERSION}"
-        echo ""
-        exit 0
-    fi
-    
-    # 每 10 次尝试显示一次进度（约每 10 秒）
-    if [ $((attempt % 10)) -eq 0 ] && [ $attempt -gt 0 ]; then
-        echo "   ⏳ 已尝试 ${attempt}/${MAX_ATTEMPTS} 次（约 ${attempt} 秒）..."
-        
-        # 显示调试信息
-        if [ $((attempt % 30)) -eq 0 ]; then
-            echo "   🔍 调试信息："
-            echo "      - 容器状态: $(docker ps --filter name=redroid --format '{{.Status}}' 2>/dev/null || echo '未知')"
-            echo "      - ADB 连接: $(adb devices 2>/dev/null | grep 127.0.0.1:5555 || echo '未连接')"
-            echo "      - boot_completed: ${BOOT_STATUS}"
-        fi
-    fi
-    
-    attempt=$((attempt + 1))
-    sleep 1
-done
-
-echo ""
-echo "❌ 容器启动超时（超过 ${MAX_ATTEMPTS} 次尝试）"
-echo ""
-echo "📋 最终状态："
-echo "   - 容器状态: $(docker ps --filter name=redroid --format '{{.Status}}' 2>/dev/null || echo '未知')"
-echo "   - ADB 设备: $(adb devices 2>/dev/null | grep -v 'List of devices' || echo '无设备')"
-echo ""
-echo "📋 容器日志（最后 30 行）："
-docker logs redroid 2>&1 | tail -30
-exit 1
+wait_for_boot "${1:-180}"  # 默认 180 次尝试
+exit $?
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快照分块认证加密
+
+将（已压缩的）快照流切成固定大小的块，每块单独用 AES-256-GCM 加密，
+再按分卷大小写成 container.enc.000、container.enc.001 ...，
+同时生成带 HMAC 签名的清单 container.manifest.json，记录每个分卷和每个块的 SHA-256
+
+好处：
+- 每个分卷下载完成后即可单独校验，损坏时只需重新下载这一个分卷
+- 各块互不依赖，解密可以在所有 CPU 核心上并行
+- 块序号参与认证（AAD），分卷被调换或截断都能被发现
+
+块格式：nonce（12 字节）+ 密文 + GCM tag（16 字节）
+
+用法：
+    ... | python3 snapshot_crypto.py seal --prefix container.enc. --part-size 1900m
+    python3 snapshot_crypto.py open --manifest container.manifest.json | ...
+    python3 snapshot_crypto.py verify --manifest container.manifest.json
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import struct
+import sys
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from block_compress import default_workers, ordered_map, read_exact
+
+FORMAT = 'maa-snapshot-aesgcm-v1'
+MANIFEST_NAME = 'container.manifest.json'
+PART_PREFIX = 'container.enc.'
+PASSWORD_ENV = 'CONTAINER_ENCRYPTION_KEY'
+
+# 默认每块 16 MiB 明文
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+KDF_ITERATIONS = 200000
+NONCE_SIZE = 12
+TAG_SIZE = 16
+CHUNK_OVERHEAD = NONCE_SIZE + TAG_SIZE
+HASH_BUFSIZE = 4 * 1024 * 1024
+
+
+def parse_size(text):
+    """
+    解析大小字符串（与 split -b 相同的写法）
+
+    Args:
+        text: 如 '1900m'、'2g'、'4096'
+
+    Returns:
+        int: 字节数
+    """
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    text = str(text).strip().lower()
+    if text and text[-1] in units:
+        return int(text[:-1]) * units[text[-1]]
+    return int(text)
+
+
+def derive_keys(password, salt, iterations=KDF_ITERATIONS):
+    """
+    由密码派生加密密钥和清单签名密钥
+
+    Returns:
+        tuple: (加密密钥, 签名密钥)，各 32 字节
+    """
+    material = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations, dklen=64)
+    return material[:32], material[32:]
+
+
+def _chunk_aad(snapshot_id, index):
+    """块的附加认证数据：快照 ID + 块序号"""
+    return snapshot_id.encode('ascii') + struct.pack('>Q', index)
+
+
+def _chunk_nonce(nonce_prefix, index):
+    """块 nonce：快照随机前缀（4 字节）+ 块序号（8 字节），保证不重复"""
+    return nonce_prefix + struct.pack('>Q', index)
+
+
+def sign_manifest(manifest, mac_key):
+    """计算清单签名（对除 signature 外的字段做规范化 JSON 后 HMAC-SHA256）"""
+    body = {k: v for k, v in manifest.items() if k != 'signature'}
+    payload = json.dumps(body, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hmac.new(mac_key, payload, hashlib.sha256).hexdigest()
+
+
+def seal_stream(src, password, prefix=PART_PREFIX, part_size=parse_size('1900m'),
+                chunk_size=DEFAULT_CHUNK_SIZE, workers=None, on_part=None):
+    """
+    分块加密并写出分卷
+
+    Args:
+        src: 二进制输入流（明文）
+        password: 加密密码
+        prefix: 分卷文件名前缀
+        part_size: 分卷大小上限（字节），分卷边界总是落在块边界上
+        chunk_size: 每块明文大小（字节）
+        workers: 线程数，默认 CPU 核心数
+        on_part: 可选回调，每个分卷写完后调用 on_part(path, part_info)
+
+    Returns:
+        dict: 已签名的清单
+    """
+    enc_size = chunk_size + CHUNK_OVERHEAD
+    chunks_per_part = part_size // enc_size
+    if chunks_per_part < 1:
+        raise ValueError(f"分卷大小 {part_size} 小于一个加密块 {enc_size}")
+
+    salt = secrets.token_bytes(16)
+    enc_key, mac_key = derive_keys(password, salt)
+    aead = AESGCM(enc_key)
+    snapshot_id = secrets.token_hex(8)
+    nonce_prefix = secrets.token_bytes(4)
+    workers = workers or default_workers()
+
+    parts = []
+    state = {'file': None, 'path': None, 'hash': None, 'info': None, 'index': 0, 'plain': 0}
+
+    def close_part():
+        if state['file'] is None:
+            return
+        state['file'].close()
+        state['info']['sha256'] = state['hash'].hexdigest()
+        path = state['path']
+        state['info']['size'] = os.path.getsize(path)
+        parts.append(state['info'])
+        if on_part:
+            on_part(path, state['info'])
+        state['file'] = None
+
+    def encrypt(index, block):
+        nonce = _chunk_nonce(nonce_prefix, index)
+        data = nonce + aead.encrypt(nonce, block, _chunk_aad(snapshot_id, index))
+        return len(block), data, hashlib.sha256(data).hexdigest()
+
+    def blocks():
+        index = 0
+        while True:
+            block = read_exact(src, chunk_size)
+            if not block:
+                return
+            yield index, block
+            index += 1
+
+    def write(result):
+        plain_len, data, digest = result
+        if state['file'] is None or len(state['info']['chunks']) >= chunks_per_part:
+            close_part()
+            state['path'] = f"{prefix}{len(parts):03d}"
+            state['file'] = open(state['path'], 'wb')
+            state['hash'] = hashlib.sha256()
+            # 清单中只记录文件名，分卷可以放在任意目录
+            state['info'] = {'name': os.path.basename(state['path']), 'first_chunk': state['index'], 'chunks': []}
+        state['file'].write(data)
+        state['hash'].update(data)
+        state['info']['chunks'].append(digest)
+        state['index'] += 1
+        state['plain'] += plain_len
+
+    ordered_map(encrypt, blocks(), workers, write)
+    close_part()
+
+    manifest = {
+        'format': FORMAT,
+        'snapshot_id': snapshot_id,
+        'kdf': {'name': 'pbkdf2-sha256', 'iterations': KDF_ITERATIONS, 'salt': salt.hex()},
+        'nonce_prefix': nonce_prefix.hex(),
+        'chunk_size': chunk_size,
+        'total_chunks': state['index'],
+        'plain_size': state['plain'],
+        'parts': parts,
+    }
+    manifest['signature'] = sign_manifest(manifest, mac_key)
+    return manifest
+
+
+def write_manifest(manifest, path=MANIFEST_NAME):
+    """保存清单"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def load_manifest(path, password):
+    """
+    读取并校验清单签名
+
+    Args:
+        path: 清单路径
+        password: 加密密码
+
+    Returns:
+        tuple: (清单, 加密密钥)
+
+    Raises:
+        ValueError: 格式不支持或签名不匹配（密码错误或清单被篡改）
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f"不支持的快照格式: {manifest.get('format')}")
+    kdf = manifest['kdf']
+    enc_key, mac_key = derive_keys(password, bytes.fromhex(kdf['salt']), kdf['iterations'])
+    if not hmac.compare_digest(sign_manifest(manifest, mac_key), manifest.get('signature', '')):
+        raise ValueError("清单签名校验失败（密码错误或清单被篡改）")
+    return manifest, enc_key
+
+
+def verify_part(path, part_info):
+    """
+    校验分卷的大小和 SHA-256
+
+    Returns:
+        bool: 是否完整
+    """
+    if not os.path.exists(path) or os.path.getsize(path) != part_info['size']:
+        return False
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_BUFSIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest() == part_info['sha256']
+
+
+def decrypt_part(path, part_info, manifest, enc_key, dst, workers=None):
+    """
+    并行解密单个分卷并按顺序写出明文
+
+    Args:
+        path: 分卷路径
+        part_info: 清单中该分卷的信息
+        manifest: 已校验的清单
+        enc_key: 加密密钥
+        dst: 二进制输出流
+        workers: 线程数，默认 CPU 核心数
+
+    Raises:
+        ValueError: 块哈希不匹配或 GCM 认证失败
+    """
+    aead = AESGCM(enc_key)
+    snapshot_id = manifest['snapshot_id']
+    enc_size = manifest['chunk_size'] + CHUNK_OVERHEAD
+    workers = workers or default_workers()
+
+    def decrypt(index, expected, data):
+        if hashlib.sha256(data).hexdigest() != expected:
+            raise ValueError(f"{part_info['name']} 第 {index} 块哈希不匹配")
+        nonce, body = data[:NONCE_SIZE], data[NONCE_SIZE:]
+        try:
+            return aead.decrypt(nonce, body, _chunk_aad(snapshot_id, index))
+        except InvalidTag:
+            raise ValueError(f"{part_info['name']} 第 {index} 块认证失败")
+
+    def blocks(f):
+        for offset, expected in enumerate(part_info['chunks']):
+            data = f.read(enc_size)
+            if not data:
+                raise ValueError(f"{part_info['name']} 被截断")
+            yield part_info['first_chunk'] + offset, expected, data
+        if f.read(1):
+            raise ValueError(f"{part_info['name']} 末尾有多余数据")
+
+    with open(path, 'rb') as f:
+        ordered_map(decrypt, blocks(f), workers, dst.write)
+
+
+def open_parts(manifest, enc_key, dst, directory='.', workers=None):
+    """
+    按清单顺序解密所有本地分卷
+
+    Args:
+        manifest: 已校验的清单
+        enc_key: 加密密钥
+        dst: 二进制输出流
+        directory: 分卷所在目录
+        workers: 线程数
+    """
+    for part_info in manifest['parts']:
+        decrypt_part(os.path.join(directory, part_info['name']), part_info, manifest, enc_key, dst, workers)
+    dst.flush()
+
+
+def get_password():
+    """从环境变量读取加密密码"""
+    password = os.getenv(PASSWORD_ENV)
+    if not password:
+        print(f"❌ 未设置 {PASSWORD_ENV} 环境变量", file=sys.stderr)
+        sys.exit(1)
+    return password
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="快照分块认证加密（AES-256-GCM + 签名清单）")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_seal = sub.add_parser('seal', help='加密 stdin 并写出分卷和清单')
+    p_seal.add_argument('--prefix', default=PART_PREFIX, help='分卷文件名前缀')
+    p_seal.add_argument('--part-size', default='1900m', help='分卷大小（如 1900m）')
+    p_seal.add_argument('--chunk-size', default='16m', help='加密块大小（如 16m）')
+    p_seal.add_argument('--manifest', default=MANIFEST_NAME, help='清单文件路径')
+    p_seal.add_argument('-j', '--workers', type=int, default=None, help='线程数')
+
+    p_open = sub.add_parser('open', help='校验并解密分卷到 stdout')
+    p_open.add_argument('--manifest', default=MANIFEST_NAME, help='清单文件路径')
+    p_open.add_argument('--dir', default='.', help='分卷所在目录')
+    p_open.add_argument('-j', '--workers', type=int, default=None, help='线程数')
+
+    p_verify = sub.add_parser('verify', help='只校验清单签名和分卷哈希')
+    p_verify.add_argument('--manifest', default=MANIFEST_NAME, help='清单文件路径')
+    p_verify.add_argument('--dir', default='.', help='分卷所在目录')
+
+    args = parser.parse_args()
+    password = get_password()
+
+    try:
+        if args.command == 'seal':
+            manifest = seal_stream(sys.stdin.buffer, password, args.prefix, parse_size(args.part_size),
+                                   parse_size(args.chunk_size), args.workers)
+            write_manifest(manifest, args.manifest)
+            print(f"✅ 已生成 {len(manifest['parts'])} 个分卷（{manifest['total_chunks']} 块）和清单 {args.manifest}",
+                  file=sys.stderr)
+        elif args.command == 'open':
+            manifest, enc_key = load_manifest(args.manifest, password)
+            open_parts(manifest, enc_key, sys.stdout.buffer, args.dir, args.workers)
+        elif args.command == 'verify':
+            manifest, _ = load_manifest(args.manifest, password)
+            bad = [p['name'] for p in manifest['parts'] if not verify_part(os.path.join(args.dir, p['name']), p)]
+            if bad:
+                print(f"❌ 损坏或缺失的分卷: {', '.join(bad)}", file=sys.stderr)
+                sys.exit(1)
+            print(f"✅ 清单和 {len(manifest['parts'])} 个分卷校验通过", file=sys.stderr)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流水线备份
+
+加密分卷和上传同时进行：每写完一个分卷就交给上传线程池，
+同时继续压缩、加密下一个分卷，CPU 时间和网络时间重叠。
+上传完成的分卷立即删除，磁盘上最多保留 --in-flight 个分卷，
+分卷堆积时会阻塞加密（进而阻塞上游的 tar 和压缩）
+
+流程：
+    stdin（分块压缩后的 tar 流）→ 分块加密 + 分卷 → 上传线程池 → 删除分卷
+    全部分卷上传后上传签名清单，最后发布草稿 Release
+
+用法：
+    tar -Scf - ark.tar data.img | python3 block_compress.py compress | \\
+        python3 stream_backup.py snapshot-20250101-0000 --title "..." --notes "..."
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from compression_tuner import record_transfer
+from github_releases import GitHubError, ReleasesClient
+from snapshot_crypto import MANIFEST_NAME, PART_PREFIX, get_password, parse_size, seal_stream, write_manifest
+
+# 已写完、尚未上传完成的分卷数上限（另外还有一个正在写的分卷）
+DEFAULT_IN_FLIGHT = 3
+DEFAULT_UPLOADS = 2
+
+
+class PartUploader:
+    """分卷上传队列：有界并发上传，上传完成后删除本地文件"""
+
+    def __init__(self, client, release, uploads=DEFAULT_UPLOADS, in_flight=DEFAULT_IN_FLIGHT):
+        """
+        Args:
+            client: ReleasesClient
+            release: 目标 Release（草稿）
+            uploads: 并发上传数
+            in_flight: 磁盘上同时存在的分卷数上限
+        """
+        self.client = client
+        self.release = release
+        self.pool = ThreadPoolExecutor(max_workers=uploads)
+        self.slots = threading.BoundedSemaphore(max(in_flight, 1))
+        self.errors = []
+        self.waited = 0.0
+        self.uploads = uploads
+        # 每个分卷的 (字节数, 秒数)，用于记录上传带宽（见 compression_tuner.py）
+        self.transfers = []
+
+    def _upload(self, path):
+        try:
+            start = time.time()
+            self.client.upload_asset(self.release, path)
+            size = os.path.getsize(path)
+            seconds = time.time() - start
+            self.transfers.append((size, seconds))
+            print(f"📤 {os.path.basename(path)} 上传完成（{size / 1024 / 1024:.0f} MB，{seconds:.0f}s）",
+                  file=sys.stderr)
+            os.remove(path)
+        except (GitHubError, OSError) as e:
+            self.errors.append(e)
+        finally:
+            self.slots.release()
+
+    def submit(self, path, info=None):
+        """
+        提交分卷（seal_stream 的 on_part 回调）
+
+        磁盘上的分卷达到上限时阻塞，直到有分卷上传完成
+
+        Raises:
+            RuntimeError: 之前的分卷上传失败（立即中止，不再继续生成）
+        """
+        if self.errors:
+            raise RuntimeError(f"分卷上传失败: {self.errors[0]}")
+        start = time.time()
+        self.slots.acquire()
+        self.waited += time.time() - start
+        print(f"🔐 {os.path.basename(path)} 加密完成 → 上传队列", file=sys.stderr)
+        self.pool.submit(self._upload, path)
+
+    def finish(self):
+        """
+        等待所有上传完成
+
+        Raises:
+            RuntimeError: 有分卷上传失败
+        """
+        self.pool.shutdown(wait=True)
+        if self.errors:
+            raise RuntimeError(f"分卷上传失败: {self.errors[0]}")
+
+
+def stream_backup(src, tag, password, title=None, notes='', part_size=parse_size('1900m'),
+                  uploads=DEFAULT_UPLOADS, in_flight=DEFAULT_IN_FLIGHT, client=None):
+    """
+    边加密边上传
+
+    Args:
+        src: 二进制输入流（压缩后的数据）
+        tag: Release 标签
+        password: 加密密码
+        title: Release 标题
+        notes: Release 说明，{parts} 和 {size} 会被替换为分卷数和总大小
+        part_size: 分卷大小上限（字节）
+        uploads: 并发上传数
+        in_flight: 磁盘上同时存在的分卷数上限
+        client: 可选的 ReleasesClient
+
+    Returns:
+        dict: 已签名的清单
+    """
+    client = client or ReleasesClient(workers=uploads)
+    # 同名的草稿是上次中断留下的，内容不同（每次加密的随机数不同），删除后重新创建
+    existing = client.get_release(tag)
+    if existing is not None:
+        print(f"⚠️  Release {tag} 已存在，将删除后重新创建", file=sys.stderr)
+        client.delete_release(existing)
+    release = client.create_release(tag, title or tag, notes, draft=True)
+
+    uploader = PartUploader(client, release, uploads, in_flight)
+    try:
+        manifest = seal_stream(src, password, PART_PREFIX, part_size, on_part=uploader.submit)
+    except BaseException:
+        uploader.pool.shutdown(wait=True)
+        raise
+    uploader.finish()
+    record_transfer('upload', uploader.transfers, uploads)
+
+    # 清单最后上传：有清单才说明所有分卷都已上传
+    write_manifest(manifest)
+    client.upload_asset(release, MANIFEST_NAME)
+    os.remove(MANIFEST_NAME)
+
+    total_gb = sum(part['size'] for part in manifest['parts']) / 1024 ** 3
+    body = notes.replace('{parts}', str(len(manifest['parts']))).replace('{size}', f'{total_gb:.1f}G')
+    client.publish_release(release, body=body)
+    print(f"ℹ️  加密等待上传的时间：{uploader.waited:.0f}s", file=sys.stderr)
+    return manifest
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="流水线备份（加密分卷的同时上传到 Release）")
+    parser.add_argument('tag', help='Release 标签')
+    parser.add_argument('--title', default=None, help='Release 标题')
+    parser.add_argument('--notes', default='', help='Release 说明（{parts}/{size} 会被替换）')
+    parser.add_argument('--part-size', default='1900m', help='分卷大小（如 1900m）')
+    parser.add_argument('--uploads', type=int, default=DEFAULT_UPLOADS, help='并发上传数')
+    parser.add_argument('--in-flight', type=int, default=DEFAULT_IN_FLIGHT, help='磁盘上最多保留的分卷数')
+    args = parser.parse_args()
+
+    start = time.time()
+    try:
+        manifest = stream_backup(sys.stdin.buffer, args.tag, get_password(), args.title, args.notes,
+                                 parse_size(args.part_size), args.uploads, args.in_flight)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ 流水线备份失败: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"✅ 已发布 {args.tag}（{len(manifest['parts'])} 个分卷），耗时 {int(time.time() - start)} 秒",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
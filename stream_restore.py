@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式恢复容器
+
+按顺序消费 Release 中的分卷（后面的分卷仍在下载时就开始处理），
+边解密边解压，直接把镜像送入 docker load，把数据卷镜像稀疏写入磁盘
+（旧备份的 data.tar 直接送入 tar 解包），不在磁盘上生成 ark.tar 中间文件
+
+流程：
+    Releases API 下载（预取窗口，逐个校验分卷）→ 分块并行解密 → 分块解压 → tar 流拆分
+        ├─ ark.tar  → docker load
+        ├─ ark.delta.tar → 合并基础镜像 → docker load
+        ├─ data.img → 稀疏写入（全零块跳过，由 setup_container.sh 挂载）
+        ├─ data.tar → sudo tar -xf -（旧格式）
+        └─ 其它文件 → 解压到当前目录
+
+用法：
+    python3 stream_restore.py <release_tag>
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import maa_trace
+from block_compress import decompress_stream
+from compression_tuner import record_transfer
+from github_releases import GitHubError, ReleasesClient
+from image_delta import merge_image
+from snapshot_crypto import MANIFEST_NAME, PASSWORD_ENV, decrypt_part, load_manifest, verify_part
+
+PART_PATTERN = "container.enc."
+# 同时预取的分卷数（磁盘上最多保留这么多个分卷）
+DEFAULT_PREFETCH = 2
+# 流式恢复完成标志，setup_container.sh 据此跳过 docker load 和解包
+RESTORED_FLAG = '.stream_restored'
+COPY_BUFSIZE = 4 * 1024 * 1024
+# 稀疏写入的粒度：全零的块只 seek 不写
+SPARSE_CHUNK = 1024 * 1024
+DATA_IMG = 'data.img'
+
+
+_client = None
+_assets = {}
+# 每个分卷的 (字节数, 秒数)，用于记录下载带宽（见 compression_tuner.py）
+_transfers = []
+
+
+def _get_assets(release_tag):
+    """获取 Release 的文件信息（name → asset），每个 Release 只请求一次"""
+    global _client
+    if release_tag not in _assets:
+        if _client is None:
+            _client = ReleasesClient()
+        release = _client.get_release(release_tag)
+        if release is None:
+            raise RuntimeError(f"未找到 Release {release_tag}")
+        _assets[release_tag] = {a['name']: a for a in _client.list_assets(release)}
+    return _assets[release_tag]
+
+
+def list_assets(release_tag):
+    """
+    获取 Release 中的文件名
+
+    Args:
+        release_tag: Release 标签
+
+    Returns:
+        list: 文件名列表
+    """
+    return list(_get_assets(release_tag))
+
+
+def download_part(release_tag, name, directory, check=None, retries=3):
+    """
+    下载单个文件（失败或校验不通过时重试）
+
+    Args:
+        release_tag: Release 标签
+        name: 文件名
+        directory: 下载目录
+        check: 可选校验函数 check(path) -> bool
+        retries: 最大尝试次数
+
+    Returns:
+        str: 下载后的文件路径
+    """
+    asset = _get_assets(release_tag).get(name)
+    if asset is None:
+        raise RuntimeError(f"Release 中没有 {name}")
+    for attempt in range(1, retries + 1):
+        try:
+            start = time.time()
+            path = _client.download_asset(asset, directory)
+            if name.startswith(PART_PATTERN):
+                _transfers.append((os.path.getsize(path), time.time() - start))
+        except (GitHubError, OSError) as e:
+            print(f"⚠️  {name} 下载失败（第 {attempt}/{retries} 次）: {e}", file=sys.stderr)
+        else:
+            if check is None or check(path):
+                return path
+            print(f"⚠️  {name} 校验失败，重新下载（第 {attempt}/{retries} 次）", file=sys.stderr)
+        time.sleep(2 * attempt)
+    raise RuntimeError(f"{name} 下载失败")
+
+
+def fetch_parts(release_tag, parts, directory, prefetch=DEFAULT_PREFETCH, checks=None):
+    """
+    按顺序产出已下载的分卷，同时预取后面的分卷
+
+    调用方处理完一个分卷后应立即删除，磁盘上最多保留 prefetch 个分卷
+
+    Args:
+        release_tag: Release 标签
+        parts: 分卷文件名列表
+        directory: 下载目录
+        prefetch: 预取窗口大小
+        checks: 可选，与 parts 一一对应的校验函数列表
+
+    Yields:
+        tuple: (序号, 分卷路径)
+    """
+    checks = checks or [None] * len(parts)
+    with ThreadPoolExecutor(max_workers=prefetch) as pool:
+        futures = {}
+        for i in range(min(prefetch, len(parts))):
+            futures[i] = pool.submit(download_part, release_tag, parts[i], directory, checks[i])
+
+        for i, name in enumerate(parts):
+            path = futures.pop(i).result()
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            print(f"📥 [{i + 1}/{len(parts)}] {name} ({size_mb:.0f} MB) → 解密", file=sys.stderr)
+
+            next_index = i + prefetch
+            if next_index < len(parts):
+                futures[next_index] = pool.submit(download_part, release_tag, parts[next_index],
+                                                  directory, checks[next_index])
+            yield i, path
+
+
+def _run_sink(cmd, fileobj):
+    """启动子进程并把 fileobj 的内容写入其 stdin"""
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    try:
+        shutil.copyfileobj(fileobj, process.stdin, COPY_BUFSIZE)
+    finally:
+        process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError(f"命令执行失败: {' '.join(cmd)}")
+
+
+def _load_delta(fileobj):
+    """增量快照：与基础镜像合并后送入 docker load"""
+    process = subprocess.Popen(['docker', 'load'], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    try:
+        merge_image(fileobj, process.stdin)
+    finally:
+        process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError("docker load 失败")
+
+
+def _write_sparse(fileobj, path, size):
+    """
+    把数据卷镜像写成稀疏文件
+
+    外层 tar 用 -S 打包时空洞不占流量，但解出来仍是全零数据，
+    这里按块检查，全零的块直接跳过，恢复后的文件同样只占用实际数据的空间
+
+    Args:
+        fileobj: 镜像内容
+        path: 目标文件
+        size: 镜像大小（字节）
+    """
+    zero = bytes(SPARSE_CHUNK)
+    with open(path, 'wb') as out:
+        while True:
+            chunk = fileobj.read(SPARSE_CHUNK)
+            if not chunk:
+                break
+            if chunk == zero[:len(chunk)]:
+                out.seek(len(chunk), os.SEEK_CUR)
+            else:
+                out.write(chunk)
+        out.truncate(size)
+
+
+def load_members(stream):
+    """
+    拆分外层 tar 流，按成员分发到对应的消费者
+
+    Args:
+        stream: 外层 tar 的二进制流
+
+    Returns:
+        list: 已处理的成员名
+    """
+    handled = []
+    track = maa_trace.default_track('restore')
+    with tarfile.open(fileobj=stream, mode='r|') as archive:
+        for member in archive:
+            with maa_trace.span(member.name, track, size=member.size):
+                if member.name == 'ark.tar':
+                    print("🐳 ark.tar → docker load", file=sys.stderr)
+                    _run_sink(['docker', 'load'], archive.extractfile(member))
+                elif member.name == 'ark.delta.tar':
+                    print("🐳 ark.delta.tar + 基础镜像 → docker load", file=sys.stderr)
+                    _load_delta(archive.extractfile(member))
+                elif member.name == DATA_IMG:
+                    print(f"💽 {DATA_IMG} → 稀疏写入", file=sys.stderr)
+                    _write_sparse(archive.extractfile(member), DATA_IMG, member.size)
+                elif member.name == 'data.tar':
+                    print("📂 data.tar → tar -xf", file=sys.stderr)
+                    _run_sink(['sudo', 'tar', '-xpf', '-'], archive.extractfile(member))
+                else:
+                    print(f"📄 {member.name} → 当前目录", file=sys.stderr)
+                    archive.extract(member, '.')
+            handled.append(member.name)
+    return handled
+
+
+def _start_legacy_decrypt(release_tag, parts, directory, prefetch, password_env, errors):
+    """
+    旧格式（单个 openssl AES-256-CBC 流）：分卷按顺序写入 openssl
+
+    Returns:
+        tuple: (明文输出流, 后台线程, openssl 进程)
+    """
+    openssl = subprocess.Popen(
+        ['openssl', 'enc', '-d', '-aes-256-cbc', '-pbkdf2', '-iter', '100000', '-pass', f'env:{password_env}'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+
+    def feeder():
+        try:
+            for _, path in fetch_parts(release_tag, parts, directory, prefetch):
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, openssl.stdin, COPY_BUFSIZE)
+                os.remove(path)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                openssl.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    return openssl.stdout, threading.Thread(target=feeder, daemon=True), openssl
+
+
+def _start_chunked_decrypt(release_tag, directory, prefetch, password_env, errors):
+    """
+    分块认证加密格式：先校验清单签名，每个分卷下载后校验哈希（损坏时单独重下），再并行解密
+
+    Returns:
+        tuple: (明文输出流, 后台线程, None)
+    """
+    manifest_path = download_part(release_tag, MANIFEST_NAME, directory)
+    manifest, enc_key = load_manifest(manifest_path, os.getenv(password_env, ''))
+    os.remove(manifest_path)
+    part_infos = manifest['parts']
+    print(f"🔐 清单签名校验通过（{len(part_infos)} 个分卷，{manifest['total_chunks']} 块）", file=sys.stderr)
+
+    checks = [lambda path, info=info: verify_part(path, info) for info in part_infos]
+    read_fd, write_fd = os.pipe()
+
+    def feeder():
+        with os.fdopen(write_fd, 'wb') as sink:
+            try:
+                for i, path in fetch_parts(release_tag, [p['name'] for p in part_infos],
+                                           directory, prefetch, checks):
+                    decrypt_part(path, part_infos[i], manifest, enc_key, sink)
+                    os.remove(path)
+            except Exception as e:
+                errors.append(e)
+
+    return os.fdopen(read_fd, 'rb'), threading.Thread(target=feeder, daemon=True), None
+
+
+def stream_restore(release_tag, password_env=PASSWORD_ENV, prefetch=DEFAULT_PREFETCH, directory='.'):
+    """
+    流式恢复
+
+    Args:
+        release_tag: Release 标签
+        password_env: 存放加密密码的环境变量名（不出现在进程列表中）
+        prefetch: 预取窗口大小
+        directory: 分卷临时下载目录
+
+    Returns:
+        list: 已恢复的成员名
+    """
+    assets = list_assets(release_tag)
+    parts = sorted(name for name in assets if name.startswith(PART_PATTERN))
+    if not parts:
+        raise RuntimeError("未找到备份文件（container.enc.*）")
+    print(f"ℹ️  共 {len(parts)} 个分卷，预取窗口 {prefetch}", file=sys.stderr)
+
+    errors = []
+    if MANIFEST_NAME in assets:
+        cipher_out, feeder, openssl = _start_chunked_decrypt(release_tag, directory, prefetch, password_env, errors)
+    else:
+        print("ℹ️  未找到清单，按旧格式（openssl 单流）解密", file=sys.stderr)
+        cipher_out, feeder, openssl = _start_legacy_decrypt(release_tag, parts, directory, prefetch,
+                                                            password_env, errors)
+
+    read_fd, write_fd = os.pipe()
+
+    def decompressor():
+        with os.fdopen(write_fd, 'wb') as plain:
+            try:
+                decompress_stream(cipher_out, plain)
+            except Exception as e:
+                errors.append(e)
+            # 读完剩余数据，避免上游阻塞
+            while cipher_out.read(COPY_BUFSIZE):
+                pass
+
+    threads = [feeder, threading.Thread(target=decompressor, daemon=True)]
+    for t in threads:
+        t.start()
+
+    with os.fdopen(read_fd, 'rb') as plain:
+        try:
+            handled = load_members(plain)
+        except Exception as e:
+            errors.append(e)
+            handled = []
+        while plain.read(COPY_BUFSIZE):
+            pass
+
+    for t in threads:
+        t.join()
+    cipher_out.close()
+    if openssl is not None and openssl.wait() != 0:
+        errors.append(RuntimeError("openssl 解密失败（密码错误或文件损坏）"))
+    if errors:
+        raise errors[0]
+
+    missing = set()
+    if not {DATA_IMG, 'data.tar'} & set(handled):
+        missing.add(DATA_IMG)
+    if not {'ark.tar', 'ark.delta.tar'} & set(handled):
+        missing.add('ark.tar')
+    if missing:
+        raise RuntimeError(f"备份中缺少文件: {', '.join(sorted(missing))}")
+    return handled
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="流式恢复容器（下载、解密、解压、加载同时进行）")
+    parser.add_argument('release_tag', help='Release 标签')
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH, help='同时预取的分卷数')
+    args = parser.parse_args()
+
+    start = time.time()
+    try:
+        handled = stream_restore(args.release_tag, prefetch=args.prefetch)
+    except Exception as e:
+        print(f"❌ 流式恢复失败: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # 记录下载带宽，供备份压缩调优使用
+    record_transfer('download', _transfers, args.prefetch)
+    with open(RESTORED_FLAG, 'w') as f:
+        f.write(args.release_tag)
+    print(f"✅ 流式恢复完成（{', '.join(handled)}），耗时 {int(time.time() - start)} 秒", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务计划（运行前的预处理）
+
+根据上一次运行的结果和当前时间，在启动 MAA 之前去掉注定无事可做的任务，
+不在模拟器上为它们花时间：
+    - 公开招募：上一次运行把所有招募位都排满了（recruitment_time 460–540 分钟），且都还没有到时间
+    - 带 Weekday 条件的 variants：去掉今天不适用的 variant，没有适用的 variant 时整个任务跳过
+
+每个被跳过或精简的任务都记录原因，写入 task_plan.json 并追加到摘要中
+计划只写入 tasks/daily_plan.toml，daily.toml 保持不变
+
+上一次运行的结果保存在 maa_state/tasks.json（由 workflow 的缓存在多次运行之间保留），
+由 run.py 在运行结束后根据摘要更新
+
+用法：
+    python3 task_plan.py plan                          # 按当前时间预览计划（不写入）
+    python3 task_plan.py plan --at "2025-01-06 05:00"  # 按指定时间预览
+    python3 task_plan.py show                          # 显示保存的招募位状态
+"""
+import argparse
+import copy
+import json
+import os
+import re
+import sys
+import time
+
+import toml
+
+from format_summary import parse_summary
+
+STATE_DIR = os.getenv('MAA_STATE_DIR', 'maa_state')
+STATE_FILE = os.path.join(STATE_DIR, 'tasks.json')
+PLAN_FILE = 'task_plan.json'
+# 计划写入的任务文件名（tasks/<名称>.toml，运行 maa run <名称>）
+PLAN_TASK = 'daily_plan'
+
+# 公开招募位数量
+RECRUIT_SLOTS = 4
+# recruitment_time 中没有配置的星级按最短招募时间（1 小时）估计，只会少跳过，不会误跳过
+MIN_RECRUIT_MINUTES = 60
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+WEEKDAY_NAMES = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+# 游戏日在 04:00 切换
+GAME_DAY_OFFSET = 4 * 3600
+
+TITLE_PATTERN = re.compile(r'\[([^\]]+)\]\s+(\d{2}:\d{2}:\d{2})\s*-\s*(\d{2}:\d{2}:\d{2})\s+\(([^)]+)\)\s+(\w+)')
+RECRUITED_PATTERN = re.compile(r'^\d+\.\s+(\d)★.*, Recruited$')
+
+
+def load_state(path=STATE_FILE):
+    """
+    读取状态文件
+
+    Returns:
+        dict: 状态，文件不存在或损坏时为空字典
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, path=STATE_FILE):
+    """写入状态文件（先写临时文件再替换）"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _weekday(timestamp):
+    """本地时间的星期（'Mon' ...）"""
+    return WEEKDAYS[time.localtime(timestamp).tm_wday]
+
+
+def condition_matches(condition, now):
+    """
+    判断 variant 的条件在 now 时是否成立
+
+    只处理不带时区的 Weekday 条件；maa-cli 的版本可能按自然日或游戏日（04:00 换日）计算，
+    两种算法结果不一致时（凌晨 0–4 点）不做判断
+
+    Returns:
+        bool: 是否成立；None 表示无法预先判断，交给 maa-cli
+    """
+    if not condition:
+        return True
+    if condition.get('type') != 'Weekday' or 'timezone' in condition:
+        return None
+    natural = _weekday(now)
+    if natural != _weekday(now - GAME_DAY_OFFSET):
+        return None
+    return natural in condition.get('weekdays', [])
+
+
+def recruit_minutes(params, star):
+    """某个星级的招募时间（分钟）"""
+    minutes = params.get('recruitment_time', {}).get(str(star))
+    return minutes if minutes else MIN_RECRUIT_MINUTES
+
+
+def _plan_recruit(task, state, now):
+    """
+    公开招募是否可以跳过
+
+    Returns:
+        str: 跳过的原因；None 表示需要运行
+    """
+    params = task.get('params', {})
+    # 使用加急许可时招募位排满也有事可做
+    if params.get('expedite'):
+        return None
+    slots = state.get('recruit_slots')
+    if slots is None or len(slots) < RECRUIT_SLOTS:
+        return None
+    earliest = min(slots)
+    if earliest <= now:
+        return None
+    return (f"{len(slots)} 个招募位都在招募中（上次运行时开始），"
+            f"最早 {time.strftime('%m-%d %H:%M', time.localtime(earliest))} 完成")
+
+
+def _plan_variants(task, now):
+    """
+    去掉今天不适用的 variants
+
+    Returns:
+        tuple: (剩余的 variants, 去掉的 variant 的说明列表)
+    """
+    kept = []
+    dropped = []
+    for variant in task['variants']:
+        condition = variant.get('condition')
+        if condition_matches(condition, now) is False:
+            days = '/'.join(condition.get('weekdays', []))
+            stage = variant.get('params', {}).get('stage', '')
+            dropped.append(f"{stage}（仅 {days}）".lstrip())
+        else:
+            kept.append(variant)
+    return kept, dropped
+
+
+def plan_tasks(config, state, now=None):
+    """
+    生成本次运行的任务计划
+
+    Args:
+        config: daily.toml 的内容
+        state: 上一次运行的结果（load_state 读取的 tasks.json）
+        now: 计划的时间（UNIX 秒），默认当前时间
+
+    Returns:
+        tuple: (精简后的配置, 计划列表 [{'name', 'type', 'action', 'reason'}])
+               action 为 run / skip / trim
+    """
+    now = time.time() if now is None else now
+    today = WEEKDAY_NAMES[time.localtime(now).tm_wday]
+    planned = copy.deepcopy(config)
+    planned['tasks'] = []
+    plan = []
+    for task in config.get('tasks', []):
+        entry = {'name': task.get('name', task.get('type', '')), 'type': task.get('type', ''),
+                 'action': 'run', 'reason': ''}
+        plan.append(entry)
+
+        if task.get('type') == 'Recruit':
+            reason = _plan_recruit(task, state, now)
+            if reason:
+                entry.update(action='skip', reason=reason)
+                continue
+
+        if task.get('variants'):
+            kept, dropped = _plan_variants(task, now)
+            if not kept:
+                entry.update(action='skip', reason=f"今天是{today}，没有适用的 variant：{'、'.join(dropped)}")
+                continue
+            if dropped:
+                task = dict(task, variants=kept)
+                entry.update(action='trim', reason=f"今天是{today}，去掉不适用的 variant：{'、'.join(dropped)}")
+
+        planned['tasks'].append(task)
+    return planned, plan
+
+
+def write_plan(config_dir, config, state_path=STATE_FILE, plan_path=PLAN_FILE, now=None):
+    """
+    生成计划并写入 tasks/daily_plan.toml 和 task_plan.json（run.py 调用）
+
+    Args:
+        config_dir: MAA 配置目录
+        config: daily.toml 的内容
+
+    Returns:
+        tuple: (要运行的任务名, 计划列表)
+    """
+    now = time.time() if now is None else now
+    planned, plan = plan_tasks(config, load_state(state_path), now)
+    with open(os.path.join(config_dir, 'tasks', PLAN_TASK + '.toml'), 'w') as f:
+        toml.dump(planned, f)
+    with open(plan_path, 'w', encoding='utf-8') as f:
+        json.dump({'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)), 'tasks': plan},
+                  f, ensure_ascii=False, indent=2)
+    return PLAN_TASK, plan
+
+
+def format_skipped(plan):
+    """
+    被跳过的任务，格式与 MAA 摘要相同，追加到摘要后由 format_summary.py 一起显示
+
+    Returns:
+        str: 摘要文本，没有跳过的任务时为空字符串
+    """
+    blocks = []
+    for entry in plan:
+        if entry['action'] == 'skip':
+            blocks.append(f"{'-' * 55}\n[{entry['name']}] Skipped\n{entry['reason']}")
+    return '\n'.join(blocks)
+
+
+def _task_start(title, run_start):
+    """
+    摘要标题中的任务开始时间（只有时分秒）换算为 UNIX 秒
+
+    Returns:
+        tuple: (开始时间, 状态)；标题格式不符时为 (None, None)
+    """
+    match = TITLE_PATTERN.match(title)
+    if not match:
+        return None, None
+    day = time.strftime('%Y-%m-%d', time.localtime(run_start))
+    start = time.mktime(time.strptime(f"{day} {match.group(2)}", '%Y-%m-%d %H:%M:%S'))
+    # 运行跨过午夜
+    if start < run_start - 60:
+        start += 86400
+    return start, match.group(5)
+
+
+def record_run(summary, config, run_start, path=STATE_FILE):
+    """
+    根据本次运行的摘要更新招募位状态（run.py 在运行结束后调用）
+
+    公开招募完成时，先前已到时间的招募位视为已被本次运行聘用，
+    本次新开始的招募按 开始时间 + recruitment_time 估计完成时间（实际开始得更晚，估计只会偏早）；
+    公开招募失败时状态未知，清空记录，下次不会跳过
+
+    记录失败只打印警告，不影响运行
+    """
+    recruit_names = {task.get('name') for task in config.get('tasks', []) if task.get('type') == 'Recruit'}
+    params = next((task.get('params', {}) for task in config.get('tasks', []) if task.get('type') == 'Recruit'), {})
+    try:
+        state = load_state(path)
+        for task in parse_summary(summary):
+            if task['name'] not in recruit_names:
+                continue
+            start, status = _task_start(task['title'], run_start)
+            if start is None or status != 'Completed':
+                state['recruit_slots'] = None
+                break
+            slots = [finish for finish in (state.get('recruit_slots') or []) if finish > start]
+            for line in task['details']:
+                match = RECRUITED_PATTERN.match(line.strip())
+                if match:
+                    slots.append(start + recruit_minutes(params, match.group(1)) * 60)
+            state['recruit_slots'] = sorted(slots)[-RECRUIT_SLOTS:]
+            break
+        state['updated_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        save_state(state, path)
+    except OSError as e:
+        print(f"⚠️  无法记录任务状态: {e}", file=sys.stderr)
+
+
+def print_plan(plan):
+    """打印计划中跳过和精简的任务"""
+    icons = {'skip': '⏭️ ', 'trim': '✂️ '}
+    changed = [entry for entry in plan if entry['action'] != 'run']
+    if not changed:
+        print("📋 任务计划：全部任务照常运行")
+        return
+    print(f"📋 任务计划：{len(plan) - sum(entry['action'] == 'skip' for entry in plan)}/{len(plan)} 个任务运行")
+    for entry in changed:
+        print(f"   {icons[entry['action']]} [{entry['name']}] {entry['reason']}")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="任务计划（跳过无事可做的任务）")
+    parser.add_argument('--state', default=STATE_FILE, help='状态文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_plan = sub.add_parser('plan', help='预览计划（不写入）')
+    p_plan.add_argument('--config', default=os.path.join(
+        os.getenv('MAA_CONFIG_DIR', os.path.expanduser('~/.config/maa')), 'tasks', 'daily.toml'), help='任务配置')
+    p_plan.add_argument('--at', help='计划的时间（YYYY-MM-DD HH:MM，默认当前时间）')
+
+    sub.add_parser('show', help='显示保存的招募位状态')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'plan':
+            now = None
+            if args.at:
+                try:
+                    now = time.mktime(time.strptime(args.at, '%Y-%m-%d %H:%M'))
+                except ValueError:
+                    raise ValueError(f"无法解析时间: {args.at}（格式 YYYY-MM-DD HH:MM）")
+            try:
+                config = toml.load(args.config)
+            except (OSError, toml.TomlDecodeError) as e:
+                raise ValueError(f"无法读取 {args.config}: {e}")
+            _, plan = plan_tasks(config, load_state(args.state), now)
+            print_plan(plan)
+        elif args.command == 'show':
+            state = load_state(args.state)
+            slots = state.get('recruit_slots')
+            if slots is None:
+                print("ℹ️  没有招募位记录（下次运行不会跳过公开招募）")
+            else:
+                print(f"👥 招募中 {len(slots)}/{RECRUIT_SLOTS} 个位（{state.get('updated_at', '未知')} 记录）")
+                for finish in slots:
+                    print(f"   - {time.strftime('%Y-%m-%d %H:%M', time.localtime(finish))} 完成")
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()